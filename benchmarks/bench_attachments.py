@@ -0,0 +1,78 @@
+"""附件处理基准：python -m benchmarks.bench_attachments
+
+process_attachments 对本地 HTTP 服务器下载 4 个文本 + 4 张图片，
+分别测量未命中缓存（每次都下载）与命中内存缓存的耗时。
+"""
+import asyncio
+from types import SimpleNamespace
+import httpx
+from benchmarks.harness import measure, report
+from utils.llmm.handler import AIGenerator, AIConfig
+from utils.llmm.attachment_cache import attachment_cache
+
+TEXT_BODY = ("附件正文 attachment body line\n" * 800).encode("utf-8")
+IMAGE_BODY = bytes(range(256)) * 800  # 约 200KB
+ROUNDS = 20
+
+
+async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while line := await reader.readline():
+            path = line.decode().split(" ")[1]
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            body, content_type = (TEXT_BODY, "text/plain") if path.startswith("/text") else (IMAGE_BODY, "image/png")
+            writer.write(
+                f"HTTP/1.1 200 OK\r\ncontent-type: {content_type}\r\ncontent-length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def make_attachments(base_url: str, round_id: int) -> list:
+    attachments = []
+    for i in range(4):
+        attachments.append({"id": round_id * 100 + i, "url": f"{base_url}/text/{i}", "content_type": "text/plain", "size": len(TEXT_BODY)})
+        attachments.append({"id": round_id * 100 + 50 + i, "url": f"{base_url}/image/{i}", "content_type": "image/png", "size": len(IMAGE_BODY)})
+    return attachments
+
+
+def run() -> list:
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(serve, "127.0.0.1", 0))
+    base_url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    client = httpx.AsyncClient()
+    config = AIConfig(
+        provider="openai", model="gpt-4o", base_url=base_url, api_key="sk-test", system_prompt="",
+        max_text=100000, max_images=5, max_messages=25, extra_api_parameters={},
+    )
+    generator = AIGenerator(config, SimpleNamespace(httpx_client=client, openai_client=None))
+
+    async def process_rounds(fresh_ids: bool):
+        for round_id in range(ROUNDS):
+            await generator.process_attachments(make_attachments(base_url, round_id if fresh_ids else 0))
+
+    results = []
+    try:
+        attachment_cache.configure(max_bytes=0, disk_path=None)
+        results.append(measure(
+            f"process_attachments_cold[8x{ROUNDS}]", lambda: loop.run_until_complete(process_rounds(True)),
+        ))
+        attachment_cache.configure(max_bytes=256 * 1024 * 1024, disk_path=None)
+        loop.run_until_complete(process_rounds(False))
+        results.append(measure(
+            f"process_attachments_cached[8x{ROUNDS}]", lambda: loop.run_until_complete(process_rounds(False)),
+        ))
+    finally:
+        loop.run_until_complete(client.aclose())
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,54 @@
+"""消息链构建微基准：python -m benchmarks.bench_chain
+
+用内存中的假父消息获取器构建不同长度的回复链（不含网络），
+首轮之后 token 计数命中节点缓存。
+"""
+import asyncio
+from types import SimpleNamespace
+from benchmarks.harness import bench, report
+from utils.llmm.handler import AIGenerator, AIConfig, MessageNode
+
+LENGTHS = (5, 25, 100)
+TEXT = "这是一条用于基准测试的消息。The quick brown fox jumps over the lazy dog. " * 8
+
+
+def make_chain(length: int) -> dict:
+    return {
+        i: MessageNode(
+            text=f"{i} {TEXT}",
+            role="user" if i % 2 == 0 else "assistant",
+            user_id=10**17 + i % 3,
+            parent_msg_id=i - 1 if i > 0 else None,
+        )
+        for i in range(length)
+    }
+
+
+def run() -> list:
+    loop = asyncio.new_event_loop()
+    results = []
+    try:
+        for length in LENGTHS:
+            config = AIConfig(
+                provider="openai", model="gpt-4o", base_url="http://localhost", api_key="sk-test",
+                system_prompt="You are a helpful bot.", max_text=100000, max_images=5,
+                max_messages=length, extra_api_parameters={"max_tokens": 4096},
+                accept_usernames=True, context_tokens=128000,
+            )
+            generator = AIGenerator(config, SimpleNamespace(httpx_client=None, openai_client=None))
+            nodes = make_chain(length)
+
+            async def get_parent(msg_id):
+                return nodes[msg_id]
+
+            results.append(bench(
+                f"build_message_chain[{length}]",
+                lambda: loop.run_until_complete(generator.build_message_chain(nodes[length - 1], get_parent)),
+            ))
+    finally:
+        loop.close()
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
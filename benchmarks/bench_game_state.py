@@ -0,0 +1,98 @@
+"""游戏存档与属性计算基准：python -m benchmarks.bench_game_state [玩家数...]
+
+在临时目录中替换游戏模块的存档，测量：
+calculate_total_state / state_to_text（已加载玩家），
+game_save_state 全量写入、按需加载全部玩家，以及旧 pickle 存档迁移。
+"""
+import os
+import pickle
+import sys
+import tempfile
+from benchmarks.harness import bench, measure, report
+from utils.minigame import utils as game
+from utils.minigame.store import PlayerStore, PlayerRegistry, LEGACY_VERSION
+from utils.minigame.player import PlayerState, Effect
+from utils.minigame.effects import schedule_player_effects
+
+COUNTS = (10000, 100000)
+
+
+def make_player(i: int) -> PlayerState:
+    player = PlayerState(coin=i % 50)
+    player.add_item("生命药水", 2)
+    player.special_memory["signed"] = {"times": 1, "last_sign_time": 1744187087.4 + i}
+    if i % 10 == 0:
+        player.add_effect("力量药水", Effect(start_time=4102444800.0, duration=600, buff={"atk": 5}))
+    return player
+
+
+def make_registry(path: str) -> PlayerRegistry:
+    store = PlayerStore(path)
+    return PlayerRegistry(store, decode=PlayerState.from_dict, encode=PlayerState.to_dict, on_load=schedule_player_effects)
+
+
+def run(counts=COUNTS) -> list:
+    saved_store, saved_state = game.__game_store__, game.__game_state__
+    saved_cwd = os.getcwd()
+    results = []
+    try:
+        for count in counts:
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                db_file = os.path.join(tmp, f"bench_{count}.db")
+
+                def install(registry: PlayerRegistry):
+                    game.__game_store__, game.__game_state__ = registry.store, registry
+
+                # 写入：所有玩家都是脏数据，一次事务写入
+                def save_all():
+                    registry = make_registry(db_file)
+                    install(registry)
+                    for user_id in range(count):
+                        registry[user_id] = make_player(user_id)
+                    game.game_save_state()
+                    registry.store.close()
+                results.append(measure(f"game_save_state[{count}]", save_all, repeat=1, players=count))
+
+                # 读取：打开存档后逐个按需加载
+                def load_all():
+                    registry = make_registry(db_file)
+                    install(registry)
+                    game.game_load_state()
+                    for user_id in range(count):
+                        registry[user_id]
+                    return registry
+                results.append(measure(f"game_load_state+load_all[{count}]", load_all, repeat=1, players=count))
+
+                registry = load_all()
+                user_ids = iter(range(10**9))
+                results.append(bench(
+                    f"calculate_total_state[{count}]",
+                    lambda: game.calculate_total_state(next(user_ids) % count),
+                ))
+                player = registry[1]
+                total = game.calculate_total_state(1)
+                results.append(bench(f"state_to_text[{count}]", lambda: game.state_to_text(player, total)))
+                registry.store.close()
+
+                # 旧版整包 pickle 存档迁移
+                legacy_file = os.path.join(tmp, "game_save.pkl")
+                with open(legacy_file, "wb") as f:
+                    pickle.dump({
+                        "version": LEGACY_VERSION,
+                        "game_state": {user_id: make_player(user_id).to_dict() for user_id in range(count)},
+                    }, f)
+
+                def migrate():
+                    store = PlayerStore(os.path.join(tmp, "migrated.db"))
+                    store.migrate_pickle(legacy_file)
+                    store.close()
+                results.append(measure(f"migrate_pickle[{count}]", migrate, repeat=1, players=count))
+    finally:
+        os.chdir(saved_cwd)
+        game.__game_store__, game.__game_state__ = saved_store, saved_state
+    return results
+
+
+if __name__ == "__main__":
+    report(run(tuple(int(arg) for arg in sys.argv[1:]) or COUNTS))
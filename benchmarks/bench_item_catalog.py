@@ -0,0 +1,51 @@
+"""物品目录基准：python -m benchmarks.bench_item_catalog
+
+对比旧版每次合并生成新字典的 get_equip_info 与只读目录查询的耗时，
+并用 tracemalloc 统计每次查询的内存分配。
+"""
+import tracemalloc
+from benchmarks.harness import bench, report
+from utils.minigame.equip_db import get_equip_info
+
+LEGACY_WEAPON_DB = {"铁剑": {"name": "铁剑", "item_buff": {"atk": 3, "def": 1, "luck": 1}, "fit": "weapon"}}
+LEGACY_ARMOR_DB = {"新人冒险家套装": {"name": "新人冒险家套装", "item_buff": {"atk": 0, "def": 3, "luck": 1}, "fit": "armor"}}
+LOOKUPS = 100000
+
+
+def legacy_get_equip_info(item_id):
+    """旧版实现：每次查询都构造一个新字典"""
+    if item_id in LEGACY_WEAPON_DB:
+        return {'type': 'weapon', **LEGACY_WEAPON_DB[item_id]}
+    if item_id in LEGACY_ARMOR_DB:
+        return {'type': 'armor', **LEGACY_ARMOR_DB[item_id]}
+    return None
+
+
+def allocated_per_lookup(lookup, item_id: str) -> float:
+    """查询结果保留到统计结束，得到每次查询新分配的字节数"""
+    lookup(item_id)
+    tracemalloc.start()
+    results = [None] * LOOKUPS
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(LOOKUPS):
+        results[i] = lookup(item_id)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / LOOKUPS
+
+
+def run() -> list:
+    results = []
+    for name, lookup in (("legacy", legacy_get_equip_info), ("catalog", get_equip_info)):
+        results.append(bench(
+            f"{name}_lookup", lambda: lookup("新人冒险家套装"),
+            bytes_per_lookup=allocated_per_lookup(lookup, "新人冒险家套装"),
+        ))
+    return results
+
+
+if __name__ == "__main__":
+    results = run()
+    report(results)
+    for r in results:
+        print(f"{r['name']:<16} {r['bytes_per_lookup']:>8.1f} B/lookup")
@@ -0,0 +1,51 @@
+"""命令分发微基准：python -m benchmarks.bench_menu
+
+对比原先的 split + get_matched_menus + 逐个解析参数，与编译后的路由表；
+以及每次重建的帮助文本与缓存后的帮助文本。
+"""
+from benchmarks.harness import bench, report
+import utils.llmm.handler  # noqa: F401  注册聊天菜单
+import utils.minigame.utils  # noqa: F401  注册游戏菜单
+from utils.discords.menu import (
+    init_menu, freeze_menu, get_menu_map, dispatch_menu, dump_help_list, get_matched_menus, _render_help_list,
+)
+
+LINES = ("!装备 铁剑", "!状态", "!chat 你好", "随便说点什么")
+
+
+def legacy_dispatch(line):
+    """on_message 中原先的分发逻辑（不执行菜单）"""
+    if " " in line:
+        cmd, params = line.split(" ", 1)
+    else:
+        cmd, params = [line, ""]
+    results = []
+    for target in get_matched_menus(cmd):
+        params = params.strip().split(" ") if isinstance(params, str) else params
+        valued_params = {}
+        for i in target["binding_func_args"]:
+            if len(params) == 0:
+                raise ValueError("参数不足")
+            valued_params[i] = params.pop(0)
+        results.append((target, valued_params))
+    return results
+
+
+def run() -> list:
+    if not get_menu_map()[1]:
+        init_menu()
+    freeze_menu()
+    results = []
+    for line in LINES:
+        results.append(bench(f"legacy_dispatch[{line}]", lambda: legacy_dispatch(line)))
+        results.append(bench(f"compiled_dispatch[{line}]", lambda: dispatch_menu(line)))
+    results.append(bench("legacy_help", lambda: _render_help_list(True)))
+    results.append(bench("cached_help", lambda: dump_help_list(True)))
+    # 未匹配的 @ 提及：分发后还要生成帮助文本，这是最常见的路径
+    results.append(bench("legacy_unmatched_total", lambda: (legacy_dispatch("你好"), _render_help_list(True))))
+    results.append(bench("compiled_unmatched_total", lambda: (dispatch_menu("你好"), dump_help_list(True))))
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
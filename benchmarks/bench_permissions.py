@@ -0,0 +1,76 @@
+"""权限判定微基准：python -m benchmarks.bench_permissions
+
+对比旧的列表线性查找与编译后的 frozenset 表，名单长度从 10 增长到 10000。
+"""
+from benchmarks.harness import bench, report
+from utils.discords.permissions import compile_permissions, check_permissions
+
+SIZES = (10, 1000, 10000)
+
+
+def make_config(size: int) -> dict:
+    ids = list(range(1, size + 1))
+    return {
+        "allow_dms": True,
+        "permissions": {
+            "users": {"allowed_ids": ids, "blocked_ids": [i + 10**6 for i in ids]},
+            "roles": {"allowed_ids": [i + 2 * 10**6 for i in ids], "blocked_ids": [i + 3 * 10**6 for i in ids]},
+            "channels": {"allowed_ids": [i + 4 * 10**6 for i in ids], "blocked_ids": [i + 5 * 10**6 for i in ids]},
+        },
+    }
+
+
+def legacy_check(cfg, user_id, role_ids, channel_ids, is_dm):
+    """on_message 中原先的逐条消息判定逻辑"""
+    permissions = cfg["permissions"]
+    (
+        (allowed_user_ids, blocked_user_ids),
+        (allowed_role_ids, blocked_role_ids),
+        (allowed_channel_ids, blocked_channel_ids),
+    ) = (
+        (perm["allowed_ids"], perm["blocked_ids"])
+        for perm in (permissions["users"], permissions["roles"], permissions["channels"])
+    )
+    allow_all_users = not allowed_user_ids if is_dm else not allowed_user_ids and not allowed_role_ids
+    is_good_user = (
+        allow_all_users
+        or user_id in allowed_user_ids
+        or any(id in allowed_role_ids for id in role_ids)
+    )
+    is_bad_user = (
+        not is_good_user
+        or user_id in blocked_user_ids
+        or any(id in blocked_role_ids for id in role_ids)
+    )
+    is_good_channel = cfg["allow_dms"] if is_dm else not allowed_channel_ids or any(id in allowed_channel_ids for id in channel_ids)
+    is_bad_channel = not is_good_channel or any(id in blocked_channel_ids for id in channel_ids)
+    return not (is_bad_user or is_bad_channel)
+
+
+def run() -> list:
+    results = []
+    for size in SIZES:
+        cfg = make_config(size)
+        table = compile_permissions(cfg)
+        # 最坏情况：用户位于名单末尾，且带多个角色与频道
+        user_id = size
+        role_ids = {size + 2 * 10**6, 7 * 10**6, 8 * 10**6}
+        channel_ids = {size + 4 * 10**6, 9 * 10**6}
+        assert legacy_check(cfg, user_id, role_ids, channel_ids, False) == check_permissions(
+            table, user_id, role_ids, channel_ids, False
+        )[0]
+        results.append(bench(
+            f"legacy[{size}]",
+            lambda: legacy_check(cfg, user_id, role_ids, channel_ids, False),
+            size=size,
+        ))
+        results.append(bench(
+            f"compiled[{size}]",
+            lambda: check_permissions(table, user_id, role_ids, channel_ids, False),
+            size=size,
+        ))
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
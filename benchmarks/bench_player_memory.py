@@ -0,0 +1,50 @@
+"""玩家数据内存基准：python -m benchmarks.bench_player_memory [玩家数]
+
+对比旧的嵌套字典与 PlayerState 的每玩家字节数（tracemalloc 统计）。
+"""
+import copy
+import sys
+import tracemalloc
+from utils.minigame.player import PlayerState
+
+
+def legacy_player(i: int) -> dict:
+    """旧版注册后写入的嵌套字典（键名由 JSON/pickle 读入，不共享）"""
+    return {
+        "coin": i % 50,
+        "npc_attitude": 0,
+        "weapon": "".join(["铁", "剑"]),
+        "armor": "".join(["新人冒险家", "套装"]),
+        "backpack": {"".join(["生命", "药水"]): 2},
+        "exp": 0,
+        "state": {"atk": 1, "def": 1, "hp": 36, "max_hp": 36, "luck": 0},
+        "additon": {},
+        "special_memory": {"signed": {"times": 1, "last_sign_time": 1744187087.4 + i}},
+    }
+
+
+def measure(factory, count: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    players = {10**17 + i: factory(i) for i in range(count)}
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(players) == count
+    return (after - before) / count
+
+
+def run(count: int = 10000) -> list:
+    # 从存档加载时每个字典都是新建的，用 deepcopy 模拟
+    legacy = measure(lambda i: copy.deepcopy(legacy_player(i)), count)
+    slotted = measure(lambda i: PlayerState.from_dict(legacy_player(i)), count)
+    sample = legacy_player(1)
+    assert PlayerState.from_dict(sample).to_dict() == sample
+    return [
+        {"name": f"legacy_dict_bytes_per_player[{count}]", "bytes_per_player": legacy},
+        {"name": f"player_state_bytes_per_player[{count}]", "bytes_per_player": slotted},
+    ]
+
+
+if __name__ == "__main__":
+    for result in run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000):
+        print(f"{result['name']:<45} {result['bytes_per_player']:>10,.0f} B")
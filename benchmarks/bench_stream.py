@@ -0,0 +1,68 @@
+"""流式回复拼接基准：python -m benchmarks.bench_stream [字符数...]
+
+对比原先的 buffer += chunk / buffer[max_length:] 与 StreamAssembler，
+模拟 5 字符一个片段、每 50 个片段读取一次当前页（对应一次编辑）。
+"""
+import sys
+from benchmarks.harness import measure, report
+from utils.discords.stream_assembler import StreamAssembler
+
+SIZES = (100_000, 1_000_000)
+CHUNK = "abcd "
+MAX_LENGTH = 2000
+
+
+def legacy_stream(chunks: int):
+    """handler 中原先的纯文本分片逻辑（不发送消息）"""
+    buffer = ""
+    pages = 0
+    for _ in range(chunks):
+        buffer += CHUNK
+        if len(buffer) >= MAX_LENGTH:
+            pages += 1
+            buffer = buffer[MAX_LENGTH:]
+    return pages
+
+
+def legacy_embed(chunks: int):
+    """原先的 Embed 模式：整段回复持续累积，每次编辑都拼接全部文本（超过 4096 后编辑失败）"""
+    buffer = ""
+    for i in range(chunks):
+        buffer += CHUNK
+        if i % 50 == 0:
+            f"{buffer} "
+    return buffer
+
+
+def assembled(chunks: int):
+    assembler = StreamAssembler(MAX_LENGTH)
+    pages = 0
+    for i in range(chunks):
+        pages += len(assembler.feed(CHUNK))
+        if i % 50 == 0:
+            assembler.current
+    return pages + len(assembler.finish())
+
+
+def check_whitespace_runs():
+    """大段空白不能产生空页（Discord 拒绝空消息）"""
+    for chunk in ("\n" * 300 + "abc", " " * 1000 + "abc", "```\n" + "\n" * 300 + "x\n```"):
+        assembler = StreamAssembler(100)
+        pages = assembler.feed(chunk) + assembler.finish()
+        assert pages and all(page.strip() for page in pages), pages
+        assert all(len(page) <= 100 for page in pages), pages
+
+
+def run(sizes=SIZES) -> list:
+    check_whitespace_runs()
+    results = []
+    for size in sizes:
+        chunks = size // len(CHUNK)
+        results.append(measure(f"legacy_plain_buffer[{size}]", lambda: legacy_stream(chunks), chars=size))
+        results.append(measure(f"legacy_embed_buffer[{size}]", lambda: legacy_embed(chunks), chars=size))
+        results.append(measure(f"stream_assembler[{size}]", lambda: assembled(chunks), chars=size))
+    return results
+
+
+if __name__ == "__main__":
+    report(run(tuple(int(arg) for arg in sys.argv[1:]) or SIZES))
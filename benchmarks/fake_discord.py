@@ -0,0 +1,211 @@
+"""离线 Discord 层：替换 discord.Client 的 REST 客户端，并构造真实的 discord.Message
+
+FakeDiscordHTTP 记录所有发送、编辑、删除，按频道模拟速率限制（与 discord.py 一样在内部等待后重试），
+bot 代码仍然通过 discord.py 的 Message.reply / edit / fetch_message 走完整路径。
+"""
+import asyncio
+import datetime
+import itertools
+import logging
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+import discord
+
+BOT_USER_ID = 1_000_000_000_000_000_001
+GUILD_ID = 1_000_000_000_000_000_002
+API_BASE = "https://discord.com/api/v10"
+# 与 discord.http 中的 429 日志一致，bot 借此统计速率限制
+HTTP_LOG = logging.getLogger("discord.http")
+RATE_LIMIT_LOG = "We are being rate limited. %s %s responded with 429. Retrying in %.2f seconds."
+
+_snowflakes = itertools.count(discord.utils.time_snowflake(datetime.datetime.now(datetime.timezone.utc)))
+
+
+def next_snowflake() -> int:
+    return next(_snowflakes)
+
+
+def user_payload(user_id: int, bot: bool = False) -> dict:
+    return {"id": str(user_id), "username": f"user{user_id % 100000}", "discriminator": "0", "avatar": None, "bot": bot}
+
+
+class FakeDiscordHTTP:
+    """discord.http.HTTPClient 的替身，只实现 bot 用到的接口
+
+    rate_limit 为同一频道每秒允许的发送/编辑次数；超出时记一次 429，
+    像 discord.py 的 HTTPClient 一样记录 warning 日志并在等待 retry_after 后重试。
+    """
+
+    def __init__(self, latency: float = 0.0, rate_limit: Optional[int] = 5):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.messages: Dict[int, dict] = {}
+        self.events: List[tuple] = []  # (时间, 操作, 频道 ID, 消息 ID, 消息内容)
+        self.replies: Dict[int, List[int]] = defaultdict(list)  # 被回复的消息 ID -> bot 回复 ID
+        self.first_response: Dict[int, float] = {}  # 被回复的消息 ID -> 首个正文回复的时间
+        self.rate_limited = 0
+        self.rate_limit_wait = 0.0  # 因 429 累计等待的秒数
+        self._windows: Dict[int, deque] = defaultdict(deque)
+
+    async def _roundtrip(self, channel_id: int, counted: bool = True):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if not counted or not self.rate_limit:
+            return
+        window = self._windows[channel_id]
+        while True:
+            now = time.monotonic()
+            while window and now - window[0] >= 1.0:
+                window.popleft()
+            if len(window) < self.rate_limit:
+                window.append(now)
+                return
+            retry_after = 1.0 - (now - window[0])
+            self.rate_limited += 1
+            self.rate_limit_wait += retry_after
+            HTTP_LOG.warning(RATE_LIMIT_LOG, "PATCH", f"{API_BASE}/channels/{channel_id}/messages", retry_after)
+            await asyncio.sleep(retry_after)
+
+    def last_reply(self, message_id: int) -> Optional[int]:
+        """沿回复关系找到 bot 针对该消息的最后一条回复（纯文本模式会分成多条）"""
+        last = None
+        while replies := [i for i in self.replies.get(message_id, ()) if i in self.messages]:
+            last = message_id = replies[-1]
+        return last
+
+    def store(self, payload: dict) -> dict:
+        self.messages[int(payload["id"])] = payload
+        return payload
+
+    def message_payload(self, channel_id: int, author: dict, content: str = "", reference_id: Optional[int] = None,
+                        attachments=(), embeds=(), mentions=()) -> dict:
+        payload = {
+            "id": str(next_snowflake()),
+            "channel_id": str(channel_id),
+            "guild_id": str(GUILD_ID),
+            "author": author,
+            "content": content,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": list(mentions),
+            "mention_roles": [],
+            "attachments": list(attachments),
+            "embeds": list(embeds),
+            "pinned": False,
+            "type": 19 if reference_id else 0,
+        }
+        if reference_id:
+            payload["message_reference"] = {"message_id": str(reference_id), "channel_id": str(channel_id)}
+        return payload
+
+    # discord.py 调用的接口
+    async def send_message(self, channel_id, *, params):
+        await self._roundtrip(int(channel_id))
+        body = params.payload or {}
+        reference = (body.get("message_reference") or {}).get("message_id")
+        payload = self.store(self.message_payload(
+            int(channel_id), user_payload(BOT_USER_ID, bot=True), body.get("content") or "",
+            int(reference) if reference else None, embeds=body.get("embeds") or (),
+        ))
+        now = time.monotonic()
+        self.events.append((now, "send", int(channel_id), int(payload["id"]), payload))
+        if reference:
+            self.replies[int(reference)].append(int(payload["id"]))
+            # 排队提示不算正文
+            if payload["embeds"] or not payload["content"].startswith("⏳"):
+                self.first_response.setdefault(int(reference), now)
+        return payload
+
+    async def edit_message(self, channel_id, message_id, *, params):
+        await self._roundtrip(int(channel_id))
+        payload = dict(self.messages[int(message_id)])
+        body = params.payload or {}
+        if "embeds" in body:
+            payload["embeds"] = body["embeds"] or []
+        if "content" in body:
+            payload["content"] = body["content"] or ""
+        payload["edited_timestamp"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.store(payload)
+        self.events.append((time.monotonic(), "edit", int(channel_id), int(message_id), payload))
+        return payload
+
+    async def get_message(self, channel_id, message_id):
+        await self._roundtrip(int(channel_id), counted=False)
+        payload = self.messages.get(int(message_id))
+        if payload is None:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), {"message": "Unknown Message", "code": 10008})
+        return payload
+
+    async def logs_from(self, channel_id, limit, before=None, after=None, around=None):
+        await self._roundtrip(int(channel_id), counted=False)
+        ids = sorted(i for i, m in self.messages.items() if int(m["channel_id"]) == int(channel_id))
+        if around is not None:
+            index = next((n for n, i in enumerate(ids) if i >= int(around)), len(ids))
+            start = max(0, index - limit // 2)
+            ids = ids[start:start + limit]
+        else:
+            if before is not None:
+                ids = [i for i in ids if i < int(before)]
+            if after is not None:
+                ids = [i for i in ids if i > int(after)]
+            ids = ids[-limit:]
+        return [self.messages[i] for i in reversed(ids)]
+
+    async def delete_message(self, channel_id, message_id, *, reason=None):
+        await self._roundtrip(int(channel_id), counted=False)
+        self.messages.pop(int(message_id), None)
+        self.events.append((time.monotonic(), "delete", int(channel_id), int(message_id), None))
+
+    async def add_reaction(self, channel_id, message_id, emoji):
+        await self._roundtrip(int(channel_id), counted=False)
+
+    async def remove_own_reaction(self, channel_id, message_id, emoji):
+        await self._roundtrip(int(channel_id), counted=False)
+
+
+class FakeDiscord:
+    """把 discord.Client 接到 FakeDiscordHTTP 上，并构造频道与用户消息"""
+
+    def __init__(self, client: discord.Client, http: FakeDiscordHTTP):
+        self.client = client
+        self.http = http
+        state = client._connection
+        client.http = http
+        state.http = http
+        state.user = discord.ClientUser(state=state, data=user_payload(BOT_USER_ID, bot=True))
+        self.state = state
+        self.guild = discord.Guild(data={"id": str(GUILD_ID), "name": "load-test"}, state=state)
+        self.channels: Dict[int, discord.TextChannel] = {}
+
+    def channel(self, channel_id: int) -> discord.TextChannel:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = discord.TextChannel(
+                state=self.state,
+                guild=self.guild,
+                data={"id": str(channel_id), "type": 0, "name": f"load-{channel_id}", "position": 0,
+                      "guild_id": str(GUILD_ID), "permission_overwrites": []},
+            )
+            self.guild._add_channel(channel)
+        return channel
+
+    def user_message(self, channel_id: int, user_id: int, content: str, reference_id: Optional[int] = None,
+                     attachments=()) -> discord.Message:
+        """用户发出的 @bot 消息（写入假服务器，之后可被 fetch_message 获取）"""
+        bot = user_payload(BOT_USER_ID, bot=True)
+        payload = self.http.store(self.http.message_payload(
+            channel_id, user_payload(user_id), f"<@{BOT_USER_ID}> {content}", reference_id,
+            attachments=attachments, mentions=[bot],
+        ))
+        # 与网关一致：回复消息附带被引用消息的内容
+        if reference_id and reference_id in self.http.messages:
+            payload["referenced_message"] = self.http.messages[reference_id]
+        return discord.Message(state=self.state, channel=self.channel(channel_id), data=payload)
+
+    def attachment(self, url: str, filename: str, size: int, content_type: str = "text/plain") -> dict:
+        return {"id": str(next_snowflake()), "filename": filename, "size": size, "url": url,
+                "proxy_url": url, "content_type": content_type}
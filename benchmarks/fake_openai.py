@@ -0,0 +1,144 @@
+"""本地 OpenAI 兼容测试服务器：python -m benchmarks.fake_openai [端口]
+
+只实现 bot 用到的接口：GET /v1/models 与流式 POST /v1/chat/completions（SSE），
+另有 GET /files/<名称> 充当附件 CDN。首 token 延迟、token 间隔、抖动与失败模式均可调，
+用于端点选路与压力测试。
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Optional
+
+
+class FakeOpenAIServer:
+    def __init__(
+        self,
+        ttft: float = 0.05,
+        token_interval: float = 0.005,
+        tokens: int = 20,
+        fail: bool = False,
+        jitter: float = 0.0,
+        files: Optional[dict] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.ttft = ttft
+        self.token_interval = token_interval
+        self.tokens = tokens
+        self.fail = fail  # True 时所有请求返回 500
+        self.jitter = jitter  # 延迟的随机抖动比例（0.2 表示 ±20%）
+        self.files = files or {}  # GET /files/<名称> 返回的附件内容
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.completions = 0
+        self.aborted = 0  # 客户端中途断开的流式请求
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> "FakeOpenAIServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            return None
+        method, path, _ = line.decode().split(" ", 2)
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        return method, path, headers, body
+
+    @staticmethod
+    def _response(status: int, body: bytes, content_type: str = "application/json") -> bytes:
+        reason = {200: "OK", 404: "Not Found", 500: "Internal Server Error"}.get(status, "OK")
+        return (
+            f"HTTP/1.1 {status} {reason}\r\ncontent-type: {content_type}\r\n"
+            f"content-length: {len(body)}\r\n\r\n"
+        ).encode() + body
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (request := await self._read_request(reader)) is not None:
+                method, path, _, body = request
+                self.requests += 1
+                if self.fail:
+                    writer.write(self._response(500, b'{"error": {"message": "fake failure"}}'))
+                elif method == "GET" and path.startswith("/files/"):
+                    name = path[len("/files/"):]
+                    if name in self.files:
+                        writer.write(self._response(200, self.files[name], "text/plain; charset=utf-8"))
+                    else:
+                        writer.write(self._response(404, b"not found", "text/plain"))
+                elif method == "GET" and path.endswith("/models"):
+                    writer.write(self._response(200, b'{"object": "list", "data": [{"id": "fake", "object": "model"}]}'))
+                elif method == "POST" and path.endswith("/chat/completions"):
+                    try:
+                        await self._stream_completion(writer, json.loads(body or b"{}"))
+                    except ConnectionError:
+                        self.aborted += 1
+                        raise
+                else:
+                    writer.write(self._response(404, b'{"error": {"message": "not found"}}'))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # 客户端断开，或关闭服务器时取消了空闲的长连接
+        finally:
+            writer.close()
+
+    def _delay(self, base: float) -> float:
+        if not self.jitter:
+            return base
+        return max(0.0, base * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def _stream_completion(self, writer: asyncio.StreamWriter, payload: dict):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ntransfer-encoding: chunked\r\n\r\n"
+        )
+
+        def send(data: str):
+            event = f"data: {data}\n\n".encode()
+            writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+
+        created = int(time.time())
+        await asyncio.sleep(self._delay(self.ttft))
+        for i in range(self.tokens):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": payload.get("model", "fake"),
+                "choices": [{"index": 0, "delta": {"content": f"token{i} "}, "finish_reason": None}],
+            }
+            send(json.dumps(chunk))
+            await writer.drain()
+            if self.token_interval:
+                await asyncio.sleep(self._delay(self.token_interval))
+        send("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        self.completions += 1
+
+
+async def main(port: int):
+    server = await FakeOpenAIServer(port=port).start()
+    print(f"fake OpenAI server: {server.base_url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 8000))
@@ -0,0 +1,28 @@
+import time
+import timeit
+from typing import Callable, List
+
+
+def bench(name: str, func: Callable[[], object], repeat: int = 5, **extra) -> dict:
+    """对无参函数计时，返回每次调用的最佳耗时（纳秒）"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return {"name": name, "per_call_ns": best * 1e9, "calls": number, **extra}
+
+
+def report(results: List[dict]):
+    """打印结果表"""
+    width = max(len(r["name"]) for r in results)
+    for r in results:
+        print(f"{r['name']:<{width}}  {r['per_call_ns']:>14,.1f} ns/call")
+
+
+def measure(name: str, func: Callable[[], object], repeat: int = 3, **extra) -> dict:
+    """对耗时较长的操作（毫秒级以上）计时，每轮只调用一次，取最佳值"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return {"name": name, "per_call_ns": best * 1e9, "calls": 1, **extra}
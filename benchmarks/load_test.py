@@ -0,0 +1,192 @@
+"""端到端压力测试：python -m benchmarks.load_test [--conversations 50 --turns 3 ...]
+
+不需要网络：llmcord.on_message 处理真实的 discord.Message 对象，REST 请求由
+fake_discord 记录（含按频道的速率限制模拟），模型由本地 fake_openai 流式输出。
+报告吞吐量、首次回复（首条正文消息）延迟 p50/p99、整轮耗时与事件循环延迟。
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+from typing import List
+import yaml
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.fake_discord import FakeDiscord, FakeDiscordHTTP
+from utils.config import build_snapshot, set_config_snapshot
+from utils.discords.edit_scheduler import EDIT_RATE_LIMITED, install_rate_limit_hook
+from utils.llmm.clients import close_all_clients
+from utils.watchdog import LoopWatchdog
+
+EXAMPLE_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config-example.yaml")
+ATTACHMENT_TEXT = ("附件内容 attachment line\n" * 200).encode("utf-8")
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def build_config(args, base_url: str) -> dict:
+    with open(EXAMPLE_CONFIG, encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    cfg.update({
+        "bot_token": "load-test",
+        "config_watch_interval": 0,
+        "model": "fake/fake-model",
+        "model_endpoints": [],
+        "providers": {"fake": {"base_url": base_url, "api_key": "sk-load-test"}},
+        "use_plain_responses": args.plain,
+        "edit_interval": args.edit_interval,
+        "metrics": {"enabled": False},
+        # 压测中同一用户可能在同一频道并行多个会话，不应互相取代
+        "generation_cancel": {**(cfg.get("generation_cancel") or {}), "supersede": False},
+    })
+    cfg["client_pool"] = {**(cfg.get("client_pool") or {}), "http2": False, "warmup": False}
+    cfg["generation_queue"] = {
+        **(cfg.get("generation_queue") or {}),
+        "max_concurrent": args.max_concurrent,
+        "max_queue": args.max_queue,
+        "max_per_user": args.max_per_user,
+    }
+    return cfg
+
+
+class LoopLagMonitor:
+    """周期性 sleep，记录实际唤醒时间比预期晚了多少"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+
+async def main(args):
+    import llmcord  # 导入时注册菜单并创建 discord.Client
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # 429 日志只用于计数，不打印
+    http_log = logging.getLogger("discord.http")
+    http_log.propagate = False
+    http_log.addHandler(logging.NullHandler())
+    install_rate_limit_hook()
+
+    server = await FakeOpenAIServer(
+        ttft=args.ttft,
+        token_interval=1 / args.token_rate if args.token_rate else 0,
+        tokens=args.tokens,
+        jitter=args.jitter,
+        files={"notes.txt": ATTACHMENT_TEXT},
+    ).start()
+    attachment_url = f"http://{server.host}:{server.port}/files/notes.txt"
+    set_config_snapshot(build_snapshot(build_config(args, server.base_url), 1, time.time()))
+
+    http = FakeDiscordHTTP(latency=args.discord_latency, rate_limit=args.rate_limit)
+    fake = FakeDiscord(llmcord.discord_client, http)
+
+    first_response: List[float] = []
+    turn_times: List[float] = []
+    errors = 0
+    monitor = LoopLagMonitor()
+
+    async def conversation(index: int):
+        nonlocal errors
+        channel_id = 2_000_000_000_000_000_000 + index % args.channels
+        user_id = 3_000_000_000_000_000_000 + index % args.users
+        reference = None
+        for turn in range(args.turns):
+            attachments = ()
+            if args.attachment_every and (index + turn) % args.attachment_every == 0:
+                attachments = (fake.attachment(attachment_url, "notes.txt", len(ATTACHMENT_TEXT)),)
+            msg = fake.user_message(channel_id, user_id, f"!chat 第 {turn} 轮问题，来自会话 {index}", reference, attachments)
+            started = time.monotonic()
+            try:
+                await llmcord.on_message(msg)
+            except Exception as e:
+                errors += 1
+                logging.error(f"会话 {index} 第 {turn} 轮出错: {str(e)}")
+                return
+            turn_times.append(time.monotonic() - started)
+            if msg.id in http.first_response:
+                first_response.append(http.first_response[msg.id] - started)
+            reference = http.last_reply(msg.id)
+            if reference is None:
+                errors += 1
+                return
+            if args.think:
+                await asyncio.sleep(args.think)
+
+    monitor.start()
+    watchdog = LoopWatchdog(interval=0.02, threshold=args.watchdog_threshold).start() if args.watchdog_threshold else None
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(conversation(i) for i in range(args.conversations)))
+    finally:
+        elapsed = time.monotonic() - started
+        monitor.stop()
+        if watchdog is not None:
+            watchdog.stop()
+        await close_all_clients()
+        await server.stop()
+
+    sends = [event for event in http.events if event[1] == "send"]
+    error_embeds = sum(
+        1 for *_, payload in sends
+        if any("生成错误" in (embed.get("title") or "") for embed in payload["embeds"])
+    )
+    busy = sum(1 for *_, payload in sends if payload["content"].startswith("⏳ 当前繁忙"))
+    completed = len(turn_times)
+    print(f"会话 {args.conversations}（{args.users} 用户 / {args.channels} 频道）× {args.turns} 轮，耗时 {elapsed:.2f}s")
+    print(f"完成轮次 {completed}，吞吐 {completed / elapsed:.1f} 轮/s，上游完成 {server.completions}（中断 {server.aborted}），"
+          f"约 {server.completions * args.tokens / elapsed:.0f} token/s")
+    print(f"首条回复延迟 p50 {percentile(first_response, 50) * 1000:.0f}ms  p99 {percentile(first_response, 99) * 1000:.0f}ms")
+    print(f"整轮耗时     p50 {percentile(turn_times, 50) * 1000:.0f}ms  p99 {percentile(turn_times, 99) * 1000:.0f}ms")
+    lag = monitor.samples
+    print(f"事件循环延迟 p50 {percentile(lag, 50) * 1000:.1f}ms  p99 {percentile(lag, 99) * 1000:.1f}ms  "
+          f"max {max(lag, default=0) * 1000:.1f}ms  mean {statistics.fmean(lag) * 1000 if lag else 0:.1f}ms")
+    print(f"Discord 发送 {len(sends)}，编辑 {sum(1 for e in http.events if e[1] == 'edit')}，429 {http.rate_limited}（bot 统计 {EDIT_RATE_LIMITED.value():.0f}，等待 {http.rate_limit_wait:.1f}s），"
+          f"排队已满 {busy}，生成错误 {error_embeds}，会话中断 {errors}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="llmcord 端到端压力测试（离线）")
+    parser.add_argument("--conversations", type=int, default=50, help="并发会话数")
+    parser.add_argument("--users", type=int, default=50, help="用户数（会话按序分配给用户）")
+    parser.add_argument("--channels", type=int, default=10, help="频道数（同频道共享编辑速率限制）")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的轮数（后续轮次回复 bot 的上一条消息）")
+    parser.add_argument("--think", type=float, default=0.0, help="两轮之间的间隔（秒）")
+    parser.add_argument("--attachment-every", type=int, default=4, help="每 N 条消息带一个文本附件，0 关闭")
+    parser.add_argument("--tokens", type=int, default=60, help="每次回复的 token 数")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="上游每秒输出的 token 数，0 表示不限")
+    parser.add_argument("--ttft", type=float, default=0.2, help="上游首 token 延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.3, help="上游延迟的随机抖动比例")
+    parser.add_argument("--discord-latency", type=float, default=0.03, help="Discord REST 往返延迟（秒）")
+    parser.add_argument("--rate-limit", type=int, default=5, help="每个频道每秒允许的发送/编辑次数，0 不限")
+    parser.add_argument("--edit-interval", type=float, default=1.0, help="流式编辑间隔（秒）")
+    parser.add_argument("--max-concurrent", type=int, default=16, help="每个 provider 的并发生成数")
+    parser.add_argument("--max-queue", type=int, default=500, help="生成队列上限")
+    parser.add_argument("--max-per-user", type=int, default=0, help="每个用户的排队上限，0 不限")
+    parser.add_argument("--plain", action="store_true", help="使用纯文本回复模式")
+    parser.add_argument("--watchdog-threshold", type=float, default=0.0,
+                        help="事件循环阻塞超过该秒数时打印调用栈，0 关闭")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
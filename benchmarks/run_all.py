@@ -0,0 +1,99 @@
+"""运行全部基准并保存为 JSON：python -m benchmarks.run_all [-o 输出文件] [--compare 旧结果.json] [--only 名称...]
+
+默认输出到 benchmarks/results/<git 提交>.json，便于在提交之间比较回归。
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+SUITES = (
+    "bench_permissions",
+    "bench_menu",
+    "bench_chain",
+    "bench_attachments",
+    "bench_stream",
+    "bench_item_catalog",
+    "bench_player_memory",
+    "bench_game_state",
+)
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+REGRESSION_THRESHOLD = 0.10  # 比旧结果慢 10% 以上时标记
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_suites(names) -> List[dict]:
+    results = []
+    for name in names:
+        module = importlib.import_module(f"benchmarks.{name}")
+        print(f"== {name}", file=sys.stderr)
+        for result in module.run():
+            results.append({"suite": name, **result})
+    return results
+
+
+def compare(results: List[dict], baseline: dict) -> List[str]:
+    """与旧结果逐项比较，返回回归项说明"""
+    old: Dict[str, dict] = {f"{r['suite']}:{r['name']}": r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        key = f"{r['suite']}:{r['name']}"
+        before = old.get(key)
+        if before is None or "per_call_ns" not in r or not before.get("per_call_ns"):
+            continue
+        change = r["per_call_ns"] / before["per_call_ns"] - 1
+        mark = "  <-- 回归" if change > REGRESSION_THRESHOLD else ""
+        print(f"{key:<60} {before['per_call_ns']:>14,.1f} -> {r['per_call_ns']:>14,.1f} ns ({change:+.1%}){mark}")
+        if mark:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="运行基准测试并保存 JSON 结果")
+    parser.add_argument("-o", "--output", help="结果文件路径")
+    parser.add_argument("--compare", help="与之比较的旧结果文件")
+    parser.add_argument("--only", nargs="*", choices=SUITES, help="只运行指定的基准")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    results = run_suites(args.only or SUITES)
+    data = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {output}", file=sys.stderr)
+
+    for r in results:
+        value = f"{r['per_call_ns']:>16,.1f} ns/call" if "per_call_ns" in r else f"{r.get('bytes_per_player', 0):>16,.0f} B/player"
+        print(f"{r['suite'] + ':' + r['name']:<60} {value}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
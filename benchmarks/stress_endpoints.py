@@ -0,0 +1,62 @@
+"""端点选路与故障切换测试：python -m benchmarks.stress_endpoints [请求数]
+
+启动三个本地假服务器（快、慢、故障），检查：
+请求全部成功（故障端点在首 token 前失败会切换）、故障端点被熔断、
+流量主要流向首 token 延迟低的端点，以及恢复后经健康检查重新参与选路。
+"""
+import asyncio
+import sys
+from utils.llmm.clients import close_all_clients, DEFAULT_POOL_CONFIG
+from utils.llmm.endpoints import EndpointPool, get_endpoint, OPEN, CLOSED
+from benchmarks.fake_openai import FakeOpenAIServer
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+async def main(requests: int):
+    fast = await FakeOpenAIServer(ttft=0.01, tokens=5).start()
+    slow = await FakeOpenAIServer(ttft=0.15, tokens=5).start()
+    broken = await FakeOpenAIServer(fail=True).start()
+    servers = {"fast": fast, "slow": slow, "broken": broken}
+    pool_cfg = {**DEFAULT_POOL_CONFIG, "http2": False}
+    endpoints = [
+        get_endpoint(f"fake-{name}", "fake-model", server.base_url, "sk-test", pool_cfg)
+        for name, server in servers.items()
+    ]
+    for endpoint in endpoints:
+        # 测试中不需要 OpenAI 客户端自带的退避重试
+        endpoint.client.openai_client = endpoint.client.openai_client.with_options(max_retries=0)
+    pool = EndpointPool(endpoints, failure_threshold=2, cooldown=0.2)
+
+    async def one():
+        return "".join([chunk async for chunk in pool.stream(MESSAGES, {})])
+
+    try:
+        failures = 0
+        for start in range(0, requests, 4):
+            results = await asyncio.gather(*(one() for _ in range(min(4, requests - start))), return_exceptions=True)
+            failures += sum(isinstance(result, BaseException) for result in results)
+        for name, server in servers.items():
+            print(f"{name:<7} 完成 {server.completions:>4}  收到请求 {server.requests:>4}")
+        for stats in pool.get_stats():
+            ttft = f"{stats['ewma_ttft'] * 1000:.1f}ms" if stats["ewma_ttft"] else "-"
+            print(f"{stats['endpoint']:<24} {stats['state']:<9} EWMA TTFT {ttft}")
+        print(f"调用方看到的失败 {failures}")
+        assert failures == 0
+        assert endpoints[2].state == OPEN
+        assert fast.completions > slow.completions
+
+        # 故障端点恢复后，冷却期过后的健康检查会把它重新放回选路
+        broken.fail = False
+        await asyncio.sleep(0.25)
+        await pool.probe()
+        print(f"恢复后 broken 端点状态 {endpoints[2].state}")
+        assert endpoints[2].state == CLOSED
+    finally:
+        await close_all_clients()
+        for server in servers.values():
+            await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100))
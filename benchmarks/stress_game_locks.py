@@ -0,0 +1,96 @@
+"""玩家锁并发压力测试：python -m benchmarks.stress_game_locks [玩家数] [每人命令数]
+
+1. 临界区内带 await 的读-改-写：不加锁会丢失更新，加玩家锁后计数准确；
+   不同玩家并行执行，总耗时接近单个玩家的串行耗时而不是全部命令之和。
+2. 用假的 ctx 并发调用真实的 !使用 命令，检查背包扣减没有丢失。
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from utils.minigame.locks import PlayerLockTable
+from utils.minigame.store import PlayerStore, PlayerRegistry
+from utils.minigame.player import PlayerState
+from utils.minigame import utils as game
+
+STEP_DELAY = 0.002  # 模拟临界区内的一次 I/O
+
+
+class FakeCtx:
+    def __init__(self, user_id: int):
+        self.author = SimpleNamespace(id=user_id)
+        self.replies = []
+
+    async def reply(self, text):
+        await asyncio.sleep(0)
+        self.replies.append(text)
+
+
+async def increment(players: dict, user_id: int):
+    coin = players[user_id].coin
+    await asyncio.sleep(STEP_DELAY)
+    players[user_id].coin = coin + 1
+
+
+async def run_counter(users: int, ops: int, locks) -> dict:
+    players = {user_id: PlayerState() for user_id in range(users)}
+
+    async def one(user_id):
+        if locks is None:
+            await increment(players, user_id)
+        else:
+            async with locks.lock_for(user_id):
+                await increment(players, user_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(user_id) for _ in range(ops) for user_id in range(users)))
+    elapsed = time.perf_counter() - start
+    lost = sum(ops - player.coin for player in players.values())
+    return {"elapsed_s": elapsed, "lost_updates": lost}
+
+
+async def run_use_item(users: int, ops: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = PlayerStore(os.path.join(tmp, "stress.db"))
+        registry = PlayerRegistry(store, decode=PlayerState.from_dict, encode=PlayerState.to_dict)
+        saved_state = game.__game_state__
+        game.__game_state__ = registry
+        try:
+            for user_id in range(users):
+                player = PlayerState()
+                player.add_item("生命药水", ops)
+                registry[user_id] = player
+            ctxs = [FakeCtx(user_id) for user_id in range(users)]
+            start = time.perf_counter()
+            await asyncio.gather(*(game.use_item(ctx, "生命药水") for _ in range(ops) for ctx in ctxs))
+            elapsed = time.perf_counter() - start
+            left = sum(registry[user_id].backpack.get("生命药水", 0) for user_id in range(users))
+            replies = sum(len(ctx.replies) for ctx in ctxs)
+            registry.flush()
+            store.close()
+        finally:
+            game.__game_state__ = saved_state
+    return {"elapsed_s": elapsed, "items_left": left, "replies": replies}
+
+
+async def main(users: int, ops: int):
+    unlocked = await run_counter(users, ops, None)
+    locked = await run_counter(users, ops, PlayerLockTable())
+    serial_floor = ops * STEP_DELAY
+    print(f"无锁        丢失更新 {unlocked['lost_updates']:>6}  耗时 {unlocked['elapsed_s']:.3f}s")
+    print(f"玩家锁      丢失更新 {locked['lost_updates']:>6}  耗时 {locked['elapsed_s']:.3f}s"
+          f"  (单玩家串行下限 {serial_floor:.3f}s，全局串行约 {users * serial_floor:.3f}s)")
+    assert locked["lost_updates"] == 0
+
+    used = await run_use_item(users, ops)
+    print(f"!使用 命令  剩余药水 {used['items_left']:>6}  回复 {used['replies']}  耗时 {used['elapsed_s']:.3f}s")
+    assert used["items_left"] == 0 and used["replies"] == users * ops
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    ))
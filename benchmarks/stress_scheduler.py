@@ -0,0 +1,89 @@
+"""生成调度公平性测试：python -m benchmarks.stress_scheduler [刷屏请求数] [普通用户数]
+
+一个用户连续提交大量请求，其他用户各提交一个；检查并发上限、
+普通用户的等待位置（应在前几轮内得到名额）以及队列满时立即拒绝。
+第二个场景中总队列比刷屏请求数小：刷屏用户超出个人上限的请求被拒绝，普通用户仍能排队。
+"""
+import asyncio
+import sys
+import time
+from utils.llmm.scheduler import GenerationScheduler, QueueFull, UserQueueFull
+
+GENERATION_TIME = 0.01  # 模拟一次流式生成的耗时
+
+
+async def main(spam: int, users: int):
+    scheduler = GenerationScheduler(max_concurrent=4, max_queue=spam + users - 4, max_per_user=0)
+    peak = 0
+    finished = {}
+    positions = {}
+    start = time.perf_counter()
+
+    async def request(user_id, index):
+        nonlocal peak
+
+        async def on_position(position):
+            positions.setdefault((user_id, index), position)
+
+        async with scheduler.slot(user_id, on_position, update_interval=0.001):
+            peak = max(peak, scheduler.active)
+            await asyncio.sleep(GENERATION_TIME)
+        finished[(user_id, index)] = time.perf_counter() - start
+
+    tasks = [asyncio.create_task(request("spammer", i)) for i in range(spam)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(request(f"user{i}", 0)) for i in range(users)]
+    await asyncio.sleep(0)
+
+    try:
+        async with scheduler.slot("late"):
+            pass
+        rejected = None
+    except QueueFull as e:
+        rejected = e.position
+
+    await asyncio.gather(*tasks)
+    normal = [finished[(f"user{i}", 0)] for i in range(users)]
+    first_positions = [positions.get((f"user{i}", 0), 0) for i in range(users)]
+    print(f"峰值并发 {peak}（上限 {scheduler.max_concurrent}）")
+    print(f"普通用户入队位置 最大 {max(first_positions)}（刷屏请求 {spam} 个）")
+    print(f"普通用户完成时间 最慢 {max(normal):.3f}s，刷屏用户最后完成 {max(finished.values()):.3f}s")
+    print(f"队列已满时拒绝位置 {rejected}")
+    assert peak <= scheduler.max_concurrent
+    assert max(first_positions) <= 2 * users
+    assert rejected == spam + users - 4 + 1
+
+
+async def flood(spam: int, users: int, max_per_user: int = 3):
+    """总队列小于刷屏请求数：只有刷屏用户被拒绝"""
+    scheduler = GenerationScheduler(max_concurrent=4, max_queue=max(users + max_per_user, spam // 4), max_per_user=max_per_user)
+    outcome = {}
+
+    async def request(user_id, index):
+        try:
+            async with scheduler.slot(user_id):
+                await asyncio.sleep(GENERATION_TIME)
+            outcome[(user_id, index)] = "done"
+        except UserQueueFull:
+            outcome[(user_id, index)] = "user_limit"
+        except QueueFull:
+            outcome[(user_id, index)] = "queue_full"
+
+    tasks = [asyncio.create_task(request("spammer", i)) for i in range(spam)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(request(f"user{i}", 0)) for i in range(users)]
+    await asyncio.gather(*tasks)
+    spammer = [result for (user_id, _), result in outcome.items() if user_id == "spammer"]
+    normal = [result for (user_id, _), result in outcome.items() if user_id != "spammer"]
+    print(f"总队列 {scheduler.max_queue} < 刷屏请求 {spam}：刷屏完成 {spammer.count('done')}，"
+          f"超出个人上限被拒 {spammer.count('user_limit')}；普通用户完成 {normal.count('done')}/{users}")
+    assert normal.count("done") == users
+    assert spammer.count("done") == scheduler.max_concurrent + max_per_user
+    assert "queue_full" not in spammer
+
+
+if __name__ == "__main__":
+    spam = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    asyncio.run(main(spam, users))
+    asyncio.run(flood(spam, users))
@@ -2,10 +2,20 @@
 import asyncio
 from datetime import datetime as dt
 import logging
+import time
 import discord
-import yaml
 from utils.llmm.handler import get_msg_nodes,set_msg_nodes
+from utils.llmm.handler import handle_message_delete, handle_message_edit, handle_stop_reaction
+from utils.llmm.clients import warmup_clients, close_all_clients
+from utils.llmm.endpoints import probe_endpoints, DEFAULT_PROBE_INTERVAL
+from utils.llmm.images import check_image_support
 from utils.discords.menu import *
+from utils.discords.permissions import check_permissions
+from utils.discords.edit_scheduler import install_rate_limit_hook
+from utils.metrics import counter, histogram, start_metrics_server
+from utils.offload import configure_offload, shutdown_executors
+from utils.watchdog import start_loop_watchdog
+from utils.config import get_config, get_config_snapshot, watch_config, install_reload_signal
 from utils.minigame.utils import game_load_state,game_save_state
 import os
 import pickle
@@ -16,23 +26,20 @@ intents = discord.Intents.default()
 intents.message_content = True
 discord_client = discord.Client(intents=intents)
 init_menu()
-
-__bot__config_cache__ = None
-def get_config(filename="config.yaml"):
-    global __bot__config_cache__
-    if __bot__config_cache__: return __bot__config_cache__
-    with open(filename, "r", encoding="utf-8") as file:
-        __bot__config_cache__ = yaml.safe_load(file)
-        return __bot__config_cache__
-
+# 所有菜单均已注册，编译路由表
+freeze_menu()
 
 # 消息节点缓存（保持原始设计）
-VERSION = "1.0.0"
+VERSION = "1.1.0"
+
+DISPATCH_SECONDS = histogram("llmcord_dispatch_seconds", "on_message 中从收到消息到路由出命令的耗时（含权限检查）")
+PERMISSION_DENIED = counter("llmcord_permission_denied", "因权限被忽略的消息数", ["reason"])
 
 
 
 @discord_client.event
 async def on_message(new_msg: discord.Message):
+    received = time.perf_counter()
     # 保持原始过滤逻辑
     is_dm = new_msg.channel.type == discord.ChannelType.private
 
@@ -41,100 +48,65 @@ async def on_message(new_msg: discord.Message):
     ) or new_msg.author.bot:
         return
 
-    # 保持原始权限检查逻辑
-    cfg = get_config()
-
-    role_ids = set(role.id for role in getattr(new_msg.author, "roles", ()))
-    channel_ids = set(
-        filter(
-            None,
-            (
-                new_msg.channel.id,
-                getattr(new_msg.channel, "parent_id", None),
-                getattr(new_msg.channel, "category_id", None),
-            ),
-        )
-    )
-    allow_dms = cfg["allow_dms"]
-    permissions = cfg["permissions"]
-
-    (
-        (allowed_user_ids, blocked_user_ids),
-        (allowed_role_ids, blocked_role_ids),
-        (allowed_channel_ids, blocked_channel_ids),
-    ) = (
-        (perm["allowed_ids"], perm["blocked_ids"])
-        for perm in (
-            permissions["users"],
-            permissions["roles"],
-            permissions["channels"],
-        )
-    )
-
-    allow_all_users = (
-        not allowed_user_ids if is_dm else not allowed_user_ids and not allowed_role_ids
-    )
-    is_good_user = (
-        allow_all_users
-        or new_msg.author.id in allowed_user_ids
-        or any(id in allowed_role_ids for id in role_ids)
-    )
-    is_bad_user = (
-        not is_good_user
-        or new_msg.author.id in blocked_user_ids
-        or any(id in blocked_role_ids for id in role_ids)
-    )
-
-    allow_all_channels = not allowed_channel_ids
-    is_good_channel = (
-        allow_dms
-        if is_dm
-        else allow_all_channels or any(id in allowed_channel_ids for id in channel_ids)
+    # 权限检查：使用加载配置时编译好的权限表
+    # 本条消息全程使用同一份配置快照，期间重载不影响处理中的请求
+    cfg = get_config_snapshot()
+
+    role_ids = [role.id for role in getattr(new_msg.author, "roles", ())]
+    channel_ids = filter(
+        None,
+        (
+            new_msg.channel.id,
+            getattr(new_msg.channel, "parent_id", None),
+            getattr(new_msg.channel, "category_id", None),
+        ),
     )
-    is_bad_channel = not is_good_channel or any(
-        id in blocked_channel_ids for id in channel_ids
+    allowed, reason = check_permissions(
+        cfg.permissions, new_msg.author.id, role_ids, channel_ids, is_dm
     )
-
-    if is_bad_user or is_bad_channel:
+    if not allowed:
+        PERMISSION_DENIED.inc(reason=reason)
+        logging.debug(f"忽略消息 {new_msg.id}: {reason}")
         return
 
     # Command Distributor
     # 如果时回复消息则该条件不成立（因为开头不再是at）
     line = new_msg.content.removeprefix(discord_client.user.mention).strip()
 
-    
-    if " " in line:
-        cmd, params = line.split(" ",1)
-    else:
-        cmd, params = [line, ""]
-    target_menu = get_matched_menus(cmd)
-    if isinstance(target_menu, list):
-        if len(target_menu) == 0:
-            return
-        for target in target_menu:
-            params = params.strip().split(" ")
-            valued_params = {
-                "discord_client":discord_client,
-                "cfg":cfg
-            }
-            for i in target["binding_func_args"]:
-                if len(params) == 0: raise ValueError("参数不足")
-                valued_params[i] = params.pop(0)
-            await execute_menu(target, new_msg, **valued_params)
-    else:
-        if target_menu:
-            params = params.strip().split(" ")
-            valued_params = {
-                "discord_client":discord_client,
-                "cfg":cfg
-            }
-            for i in target_menu.binding_func_args:
-                if len(params) == 0: raise ValueError("参数不足")
-                valued_params[i] = params.pop(0)
-            await execute_menu(target_menu, new_msg, **valued_params)
+    try:
+        targets = dispatch_menu(line)
+    except ValueError as e:
+        await new_msg.reply(f"❌ 参数错误: {str(e)}")
+        return
+    finally:
+        DISPATCH_SECONDS.observe(time.perf_counter() - received)
+    for target, args in targets:
+        await execute_menu(target, new_msg, discord_client=discord_client, cfg=cfg, **args)
+
+
+# 删除 / 编辑提示消息或添加停止反应时取消进行中的生成（raw 事件不依赖消息缓存）
+@discord_client.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    handle_message_delete(payload.message_id, get_config_snapshot())
+
 
+@discord_client.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    cfg = get_config_snapshot()
+    for message_id in payload.message_ids:
+        handle_message_delete(message_id, cfg)
 
 
+@discord_client.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    handle_message_edit(payload.message_id, payload.data, discord_client.user.id, get_config_snapshot())
+
+
+@discord_client.event
+async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
+    if payload.user_id == discord_client.user.id:
+        return
+    handle_stop_reaction(payload.message_id, payload.user_id, str(payload.emoji), get_config_snapshot())
 
 
 async def main():
@@ -150,7 +122,31 @@ async def main():
             else "github.com/jakobdylanc/llmcord"
         )
     )
-    await discord_client.start(cfg["bot_token"])
+    configure_offload(cfg)
+    check_image_support(cfg)
+    install_rate_limit_hook()
+    # 事件循环被阻塞时记录卡住的调用栈
+    watchdog = start_loop_watchdog(cfg)
+    await warmup_clients(cfg)
+    metrics_server = await start_metrics_server(cfg)
+    install_reload_signal()
+    config_watcher = asyncio.create_task(watch_config())
+    # 端点池健康检查，始终针对当前配置快照中的端点池
+    endpoint_prober = asyncio.create_task(probe_endpoints(
+        lambda: get_config_snapshot().derived["llm"][2],
+        lambda: (get_config_snapshot().get("endpoint_routing") or {}).get("probe_interval", DEFAULT_PROBE_INTERVAL),
+    ))
+    try:
+        await discord_client.start(cfg["bot_token"])
+    finally:
+        config_watcher.cancel()
+        endpoint_prober.cancel()
+        if metrics_server is not None:
+            metrics_server.close()
+        if watchdog is not None:
+            watchdog.stop()
+        await close_all_clients()
+        shutdown_executors()
 
 
 if __name__ == "__main__":
@@ -160,20 +156,15 @@ if __name__ == "__main__":
         try:
             game_save_state()
             msg_nodes = get_msg_nodes()
-            # 检查对话链长度并修剪
-            max_messages = get_config()["max_messages"]
-            for key, messages in list(msg_nodes.items()):
-                if len(messages) > max_messages:
-                    msg_nodes[key] = messages[-max_messages:]
-
-            # 删除超过24小时未更新的对话链
-            now = dt.now()
-            for key, messages in list(msg_nodes.items()):
-                last_timestamp = dt.fromisoformat(messages[-1]["timestamp"])
-                if (now - last_timestamp).total_seconds() > 86400:
-                    del msg_nodes[key]
+            # 删除超过24小时未更新的消息节点
+            now = dt.now().astimezone()
+            saved_nodes = {}
+            for msg_id, node in msg_nodes.items():
+                if node.timestamp and (now - dt.fromisoformat(node.timestamp)).total_seconds() > 86400:
+                    continue
+                saved_nodes[msg_id] = node
             with open(SAVE_FILE, "wb") as f:
-                pickle.dump({"version": VERSION, "msg_nodes": msg_nodes}, f)
+                pickle.dump({"version": VERSION, "msg_nodes": saved_nodes}, f)
             logging.info("状态已保存到本地文件")
         except Exception as e:
             logging.error(f"保存状态失败: {str(e)}")
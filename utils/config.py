@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+from collections.abc import Mapping as MappingABC
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+import yaml
+from .discords.permissions import PermissionTable, compile_permissions
+from .offload import run_blocking
+
+CONFIG_FILE = "config.yaml"
+DEFAULT_WATCH_INTERVAL = 2.0
+
+
+class ConfigError(ValueError):
+    """配置文件内容不合法"""
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot(MappingABC):
+    """某一时刻的只读配置及其派生结构
+
+    可以像配置字典一样读取；每次重载都会生成新的快照，
+    处理中的请求继续使用开始时拿到的快照。
+    """
+    raw: Mapping[str, Any]
+    permissions: PermissionTable
+    version: int
+    mtime: float
+    loaded_at: float = field(default_factory=time.time)
+    derived: Mapping[str, Any] = field(default_factory=dict)
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    def __len__(self):
+        return len(self.raw)
+
+
+# 派生结构构造器：name -> func(raw_cfg)，每次重载只计算一次，必须没有副作用
+__config_derivers__: Dict[str, Callable[[Mapping], Any]] = {}
+# 快照生效后的回调：name -> func(snapshot)，用于按新配置调整进程级状态（缓存上限等）
+__config_appliers__: Dict[str, Callable[[ConfigSnapshot], Any]] = {}
+__config_snapshot__: Optional[ConfigSnapshot] = None
+# 与配置一同轮询的数据文件：path -> 变化时调用的协程函数
+__watched_files__: Dict[str, Callable[[], Awaitable[Any]]] = {}
+
+
+def register_derived(name: str, func: Callable[[Mapping], Any]):
+    """注册派生结构；已加载的配置立即补算，之后每次重载各计算一次"""
+    global __config_snapshot__
+    __config_derivers__[name] = func
+    if __config_snapshot__ is not None:
+        derived = {**__config_snapshot__.derived, name: func(__config_snapshot__.raw)}
+        __config_snapshot__ = replace(__config_snapshot__, derived=MappingProxyType(derived))
+
+
+def register_config_applier(name: str, func: Callable[[ConfigSnapshot], Any]):
+    """注册快照生效后的回调；新快照校验并替换成功后才调用，已加载的配置立即调用一次"""
+    __config_appliers__[name] = func
+    if __config_snapshot__ is not None:
+        _run_applier(name, func, __config_snapshot__)
+
+
+def _run_applier(name: str, func: Callable[[ConfigSnapshot], Any], snapshot: ConfigSnapshot):
+    # 快照已经生效，单个回调失败只记录日志，不影响其余回调
+    try:
+        func(snapshot)
+    except Exception as e:
+        logging.error(f"应用配置 {name} 失败: {str(e)}")
+
+
+def set_config_snapshot(snapshot: ConfigSnapshot) -> ConfigSnapshot:
+    """替换全局快照并依次调用生效回调"""
+    global __config_snapshot__
+    __config_snapshot__ = snapshot
+    for name, func in list(__config_appliers__.items()):
+        _run_applier(name, func, snapshot)
+    return snapshot
+
+
+def register_watched_file(path: str, on_change: Callable[[], Awaitable[Any]]):
+    """登记需要热重载的数据文件，由 watch_config 一并轮询"""
+    __watched_files__[path] = on_change
+
+
+def _getmtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def freeze(value):
+    """递归转换为只读结构（dict -> MappingProxyType，list -> tuple）"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """freeze 的逆操作，用于需要普通 dict/list 的场合（如请求参数）"""
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+def validate_config(cfg) -> None:
+    """检查新配置，不合法时抛出 ConfigError，旧快照保持不变"""
+    if not isinstance(cfg, Mapping):
+        raise ConfigError("配置文件顶层必须是映射")
+    for key in ("model", "providers", "max_text", "max_images", "max_messages"):
+        if key not in cfg:
+            raise ConfigError(f"缺少配置项: {key}")
+    if "/" not in str(cfg["model"]):
+        raise ConfigError("model 必须为 <provider>/<model> 格式")
+    provider = cfg["model"].split("/", 1)[0]
+    providers = cfg["providers"] or {}
+    if provider not in providers or not (providers[provider] or {}).get("base_url"):
+        raise ConfigError(f"providers 中缺少 {provider} 的 base_url")
+    for name in cfg.get("model_endpoints") or ():
+        if "/" not in str(name):
+            raise ConfigError(f"model_endpoints 中的 {name} 必须为 <provider>/<model> 格式")
+        if not (providers.get(name.split("/", 1)[0]) or {}).get("base_url"):
+            raise ConfigError(f"providers 中缺少 {name.split('/', 1)[0]} 的 base_url")
+    for key in ("max_text", "max_images", "max_messages"):
+        if not isinstance(cfg[key], int) or cfg[key] < 0:
+            raise ConfigError(f"{key} 必须为非负整数")
+    extra = cfg.get("extra_api_parameters")
+    if extra is not None and not isinstance(extra, Mapping):
+        raise ConfigError("extra_api_parameters 必须是映射")
+    try:
+        compile_permissions(cfg)
+    except (TypeError, ValueError, AttributeError) as e:
+        raise ConfigError(f"permissions 格式错误: {str(e)}")
+
+
+def build_snapshot(cfg: dict, version: int, mtime: float) -> ConfigSnapshot:
+    validate_config(cfg)
+    raw = freeze(cfg)
+    derived = {name: func(raw) for name, func in __config_derivers__.items()}
+    return ConfigSnapshot(
+        raw=raw,
+        permissions=compile_permissions(raw),
+        version=version,
+        mtime=mtime,
+        derived=MappingProxyType(derived),
+    )
+
+
+def _read_file(filename: str):
+    mtime = os.path.getmtime(filename)
+    with open(filename, "r", encoding="utf-8") as file:
+        return yaml.safe_load(file), mtime
+
+
+def load_config(filename: str = CONFIG_FILE) -> ConfigSnapshot:
+    """读取并校验配置，原子替换全局快照"""
+    cfg, mtime = _read_file(filename)
+    version = __config_snapshot__.version + 1 if __config_snapshot__ else 1
+    return set_config_snapshot(build_snapshot(cfg, version, mtime))
+
+
+def get_config_snapshot() -> ConfigSnapshot:
+    """获取当前配置快照（首次调用时加载）"""
+    return __config_snapshot__ or load_config()
+
+
+def get_config() -> ConfigSnapshot:
+    """获取当前配置（只读快照）"""
+    return get_config_snapshot()
+
+
+async def reload_config(filename: str = CONFIG_FILE) -> bool:
+    """重新加载配置，校验失败时保留旧快照"""
+    try:
+        cfg, mtime = await run_blocking("config_load", _read_file, filename, executor="io")
+        version = __config_snapshot__.version + 1 if __config_snapshot__ else 1
+        snapshot = build_snapshot(cfg, version, mtime)
+    except Exception as e:
+        logging.error(f"重载配置失败，继续使用旧配置: {str(e)}")
+        return False
+    set_config_snapshot(snapshot)
+    logging.info(f"配置已重载 (版本 {snapshot.version})")
+    return True
+
+
+async def watch_config(filename: str = CONFIG_FILE):
+    """轮询配置文件及登记的数据文件的修改时间，变化时自动重载
+
+    config_watch_interval 为 0 时只关闭配置文件的自动重载，登记的数据文件仍按默认间隔检查。
+    """
+    seen_mtime = get_config_snapshot().mtime
+    seen_files = {path: _getmtime(path) for path in __watched_files__}
+    while True:
+        interval = get_config_snapshot().get("config_watch_interval", DEFAULT_WATCH_INTERVAL)
+        await asyncio.sleep(interval or DEFAULT_WATCH_INTERVAL)
+        mtime = _getmtime(filename)
+        if interval and mtime is not None and mtime != seen_mtime:
+            # 无论成功与否都记下该版本，避免对同一个坏文件反复报错
+            seen_mtime = mtime
+            await reload_config(filename)
+        for path, on_change in list(__watched_files__.items()):
+            mtime = _getmtime(path)
+            if mtime is not None and mtime != seen_files.get(path):
+                seen_files[path] = mtime
+                await on_change()
+
+
+def install_reload_signal(filename: str = CONFIG_FILE):
+    """收到 SIGHUP 时重载配置（仅支持 Unix）"""
+    if not hasattr(signal, "SIGHUP"):
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(
+            signal.SIGHUP, lambda: loop.create_task(reload_config(filename))
+        )
+    except (NotImplementedError, RuntimeError):
+        pass
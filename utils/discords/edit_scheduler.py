@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, Dict, Optional, Union
+import discord
+from ..metrics import counter, histogram
+
+DEFAULT_EDIT_INTERVAL = 1.0  # 同一条消息两次编辑的最小间隔（秒）
+DEFAULT_CHANNEL_EDIT_INTERVAL = 0.25  # 同一频道内任意两次编辑的最小间隔（秒）
+MAX_FINAL_RETRIES = 3
+
+EDIT_SECONDS = histogram("llmcord_discord_edit_seconds", "流式回复每次发送/编辑消息的耗时", ["final"])
+EDIT_RATE_LIMITED = counter("llmcord_discord_rate_limited", "Discord REST 请求收到 429 的次数（含 discord.py 内部重试）")
+EDIT_ERRORS = counter("llmcord_discord_edit_errors", "流式编辑失败次数")
+
+
+class ChannelPacer:
+    """频道级编辑节奏控制，对应 Discord 按频道划分的速率限制桶"""
+
+    def __init__(self, interval: float = DEFAULT_CHANNEL_EDIT_INTERVAL):
+        self.interval = interval
+        self.next_allowed = 0.0
+
+    async def wait_turn(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self.next_allowed)
+        self.next_allowed = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def penalize(self, retry_after: float):
+        """收到 429 后整体推迟该频道的下一次编辑"""
+        now = asyncio.get_running_loop().time()
+        self.next_allowed = max(self.next_allowed, now + retry_after)
+
+
+__channel_pacers__: Dict[int, ChannelPacer] = {}
+
+
+def get_channel_pacer(channel_id: int, interval: float = DEFAULT_CHANNEL_EDIT_INTERVAL) -> ChannelPacer:
+    pacer = __channel_pacers__.get(channel_id)
+    if pacer is None:
+        pacer = __channel_pacers__[channel_id] = ChannelPacer(interval)
+    pacer.interval = interval
+    return pacer
+
+
+RATE_LIMIT_CHANNEL = re.compile(r"/channels/(\d+)/")
+
+
+class RateLimitLogFilter(logging.Filter):
+    """discord.py 在 HTTPClient 内部等待并重试 429，调用方看不到，只会记录一条 warning
+
+    借这条日志计数，并推迟对应频道之后的流式编辑。
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.msg, str) and "responded with 429" in record.msg and len(record.args or ()) >= 3:
+            _, url, retry_after = record.args[:3]
+            EDIT_RATE_LIMITED.inc()
+            match = RATE_LIMIT_CHANNEL.search(str(url))
+            if match and (pacer := __channel_pacers__.get(int(match.group(1)))) is not None:
+                pacer.penalize(float(retry_after))
+        return True
+
+
+def install_rate_limit_hook():
+    """在 discord.http 的日志上挂载 429 计数（重复调用只挂载一次）"""
+    logger = logging.getLogger("discord.http")
+    if not any(isinstance(f, RateLimitLogFilter) for f in logger.filters):
+        logger.addFilter(RateLimitLogFilter())
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """discord.py 重试耗尽后仍为 429，或等待超过 max_ratelimit_timeout（RateLimited）时的等待时间"""
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if isinstance(error, discord.HTTPException) and error.status == 429:
+        return float(getattr(error, "retry_after", None) or 1.0)
+    return None
+
+
+class EditScheduler:
+    """独立任务中发布流式消息，合并中间文本，绝不阻塞 token 读取
+
+    update() 只记录最新文本；后台任务按消息间隔与频道节奏发布，
+    finish() 保证最后一次发布一定执行（失败时向调用方抛出异常）。
+    """
+
+    def __init__(
+        self,
+        channel_id: int,
+        publish: Callable[[str, bool], Awaitable[None]],
+        interval: float = DEFAULT_EDIT_INTERVAL,
+        channel_interval: float = DEFAULT_CHANNEL_EDIT_INTERVAL,
+    ):
+        self.publish = publish
+        self.interval = interval
+        self.pacer = get_channel_pacer(channel_id, channel_interval)
+        self._pending: Union[str, Callable[[], str], None] = None
+        self._published: Optional[str] = None
+        self._final = False
+        self._changed = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._last_publish = 0.0
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> "EditScheduler":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def update(self, text: Union[str, Callable[[], str]]):
+        """提交最新文本（非阻塞，只保留最后一次）
+
+        也可以传入返回文本的函数，只在真正发布时才生成文本。
+        """
+        self._pending = text
+        self._changed.set()
+
+    async def finish(self, text: Optional[str] = None, final: bool = True):
+        """提交最终文本并等待其发布完成"""
+        if text is not None:
+            self._pending = text
+        self._final = final
+        self._finished.set()
+        self._changed.set()
+        if self._task is None:
+            self.start()
+        await self._task
+        if self._error:
+            raise self._error
+
+    def cancel(self):
+        """放弃尚未发布的文本并结束后台任务（生成被取消时使用）"""
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _wait_cadence(self):
+        loop = asyncio.get_running_loop()
+        delay = self._last_publish + self.interval - loop.time()
+        if delay > 0 and not self._finished.is_set():
+            try:
+                # finish() 会打断等待，最终文本不必等满间隔
+                await asyncio.wait_for(self._finished.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self):
+        retries = 0
+        while True:
+            await self._changed.wait()
+            await self._wait_cadence()
+            self._changed.clear()
+            await self.pacer.wait_turn()
+
+            text, final = self._pending, self._finished.is_set()
+            if callable(text):
+                text = text()
+            if text is not None and (text != self._published or final):
+                try:
+                    with EDIT_SECONDS.time(final=str(final).lower()):
+                        await self.publish(text, final and self._final)
+                    self._published = text
+                except (discord.HTTPException, discord.RateLimited) as e:
+                    # 429 已由 RateLimitLogFilter 计数
+                    if (retry_after := _retry_after(e)) is None:
+                        EDIT_ERRORS.inc()
+                    if retry_after is not None and retries < MAX_FINAL_RETRIES:
+                        logging.warning(f"编辑消息触发速率限制，{retry_after} 秒后重试")
+                        self.pacer.penalize(retry_after)
+                        retries += final
+                        self._changed.set()
+                        continue
+                    if final:
+                        self._error = e
+                        return
+                    logging.error(f"编辑消息失败: {str(e)}")
+                except Exception as e:
+                    EDIT_ERRORS.inc()
+                    if final:
+                        self._error = e
+                        return
+                    logging.error(f"编辑消息失败: {str(e)}")
+                self._last_publish = asyncio.get_running_loop().time()
+            if final:
+                return
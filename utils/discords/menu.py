@@ -1,8 +1,28 @@
+import inspect
+import time
+from dataclasses import dataclass
 from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+from ..metrics import counter, histogram
+from ..offload import run_blocking
 
 # 使用字典存储非通配符的匹配项，通配符单独存储
 __menu_registry__ = {}
 __menu_wildcard__ = []
+# 冻结后的路由表与帮助文本缓存，注册新菜单时失效
+__compiled_router__ = None
+__help_cache__ = {}
+
+COMMAND_SECONDS = histogram("llmcord_command_seconds", "菜单命令执行耗时（含回复）", ["command"])
+COMMAND_ERRORS = counter("llmcord_command_errors", "菜单命令执行出错次数", ["command"])
+
+# 参数类型转换：注解为这些类型的参数会自动转换
+ARG_COERCERS = {
+    str: str,
+    int: int,
+    float: float,
+    bool: lambda v: v.lower() in ("1", "true", "yes", "y", "on", "是"),
+}
 
 def get_menu_map():
     """获取全部菜单映射"""
@@ -10,6 +30,7 @@ def get_menu_map():
 
 def add_menu(menu):
     """添加菜单项，支持多个匹配符"""
+    global __compiled_router__
     # 确保菜单项有匹配规则且为列表形式
     assert 'matches' in menu and isinstance(menu['matches'], list), "菜单必须包含 matches 列表"
     
@@ -19,13 +40,18 @@ def add_menu(menu):
         else:
             # 为每个匹配符注册菜单项
             __menu_registry__.setdefault(match, []).append(menu)
+    __compiled_router__ = None
+    __help_cache__.clear()
 
 def get_matched_menus(match_str):
     """获取匹配的菜单项，无匹配时返回通配符菜单"""
     return __menu_registry__.get(match_str, __menu_wildcard__)
 
-def menu_item(matches, title, description, binding_func_args=None, binding_func_kwargs=None):
-    """装饰器，用于注册菜单项"""
+def menu_item(matches, title, description, binding_func_args=None, binding_func_kwargs=None, prefix_match=False):
+    """装饰器，用于注册菜单项
+
+    prefix_match 为 True 时，命令后直接跟参数（如 `!装备铁剑`）也能匹配。
+    """
     def decorator(func):
         add_menu({
             "matches": matches,
@@ -34,6 +60,7 @@ def menu_item(matches, title, description, binding_func_args=None, binding_func_
             "binding_func": func,
             "binding_func_args": binding_func_args or [],
             "binding_func_kwargs": binding_func_kwargs or {},
+            "prefix_match": prefix_match,
         })
         @wraps(func)
         async def wrapper(*args, **kwargs):
@@ -50,7 +77,7 @@ def init_menu():
         description="显示帮助信息",
     )
     async def show_help_simply(ctx,**kwargs):
-        await ctx.reply(dump_help_list())
+        await ctx.reply(await render_help())
 
     @menu_item(
         matches=["!详细帮助", "!xz"],
@@ -58,12 +85,139 @@ def init_menu():
         description="显示高级帮助",
     )
     async def show_help(ctx,**kwargs):
-        await ctx.reply(dump_help_list(False))
+        await ctx.reply(await render_help(False))
+
+
+
+@dataclass(frozen=True)
+class CompiledMenu:
+    """预先解析好参数模式的菜单项"""
+    menu: dict
+    arg_schema: Tuple[Tuple[str, Callable[[str], object]], ...]
+    arg_names: Tuple[str, ...] = ()
+    plain_args: bool = True  # 参数全为字符串，无需逐个转换
 
+    def parse_args(self, params: List[str]) -> dict:
+        """按参数模式取出并转换参数"""
+        if len(params) < len(self.arg_names):
+            raise ValueError("参数不足")
+        if self.plain_args:
+            return dict(zip(self.arg_names, params))
+        values = {}
+        for (name, coerce), raw in zip(self.arg_schema, params):
+            try:
+                values[name] = coerce(raw)
+            except (TypeError, ValueError):
+                raise ValueError(f"参数 {name} 类型错误: {raw}")
+        return values
+
+
+@dataclass(frozen=True)
+class CompiledRouter:
+    """冻结后的路由表：精确匹配表 + 按首字符分组、长度降序的前缀表 + 通配符"""
+    exact: Dict[str, Tuple[CompiledMenu, ...]]
+    prefixes: Dict[str, Tuple[Tuple[str, Tuple[CompiledMenu, ...]], ...]]
+    wildcard: Tuple[CompiledMenu, ...]
+
+    def route(self, cmd: str) -> Tuple[Tuple[CompiledMenu, ...], Optional[str]]:
+        """返回 (匹配的菜单, 前缀匹配时剩余的首个参数)；只做一次 casefold 与一次精确查表"""
+        folded = cmd.casefold()
+        menus = self.exact.get(folded)
+        if menus is not None:
+            return menus, None
+        group = self.prefixes.get(folded[:1])
+        if group is not None:
+            for prefix, menus in group:
+                if folded.startswith(prefix):
+                    return menus, cmd[len(prefix):]
+        return self.wildcard, None
+
+
+def _build_arg_schema(menu) -> tuple:
+    """从 binding_func 的注解推导参数类型，未注解时按字符串处理"""
+    try:
+        parameters = inspect.signature(menu["binding_func"]).parameters
+    except (TypeError, ValueError):
+        parameters = {}
+    schema = []
+    for name in menu["binding_func_args"]:
+        annotation = parameters[name].annotation if name in parameters else str
+        schema.append((name, ARG_COERCERS.get(annotation, str)))
+    return tuple(schema)
+
+
+def freeze_menu() -> CompiledRouter:
+    """将注册表编译为路由表（启动完成后调用，注册新菜单会使其失效）"""
+    global __compiled_router__
+    compiled = {}
+    def compile_menu(menu):
+        if id(menu) not in compiled:
+            schema = _build_arg_schema(menu)
+            compiled[id(menu)] = CompiledMenu(
+                menu,
+                schema,
+                arg_names=tuple(name for name, _ in schema),
+                plain_args=all(coerce is str for _, coerce in schema),
+            )
+        return compiled[id(menu)]
+
+    exact = {}
+    prefixes = {}
+    for match, menus in __menu_registry__.items():
+        entries = tuple(compile_menu(menu) for menu in menus)
+        exact.setdefault(match.casefold(), ())
+        exact[match.casefold()] += entries
+        prefix_entries = tuple(e for e in entries if e.menu.get("prefix_match"))
+        if prefix_entries:
+            prefixes[match.casefold()] = prefixes.get(match.casefold(), ()) + prefix_entries
+    grouped_prefixes = {}
+    for prefix, entries in sorted(prefixes.items(), key=lambda item: len(item[0]), reverse=True):
+        grouped_prefixes.setdefault(prefix[:1], []).append((prefix, entries))
+    __compiled_router__ = CompiledRouter(
+        exact=exact,
+        prefixes={first: tuple(items) for first, items in grouped_prefixes.items()},
+        wildcard=tuple(compile_menu(menu) for menu in __menu_wildcard__),
+    )
+    return __compiled_router__
+
+
+def get_router() -> CompiledRouter:
+    return __compiled_router__ or freeze_menu()
+
+
+def dispatch_menu(line: str) -> List[Tuple[dict, dict]]:
+    """解析一行命令，返回 [(菜单项, 已转换的参数)]；参数不合法时抛出 ValueError"""
+    router = __compiled_router__ or freeze_menu()
+    cmd, _, rest = line.partition(" ")
+    menus, first_arg = router.route(cmd)
+    params = None
+    targets = []
+    for entry in menus:
+        if not entry.arg_schema:
+            targets.append((entry.menu, {}))
+            continue
+        # 只有需要参数的菜单才切分参数，通配符等无参菜单不付出这部分开销
+        if params is None:
+            params = [first_arg, *rest.split()] if first_arg else rest.split()
+        targets.append((entry.menu, entry.parse_args(params)))
+    return targets
 
 
 def dump_help_list(simplified=True):
-    """生成菜单帮助列表，排除通配符菜单项"""
+    """生成菜单帮助列表，排除通配符菜单项（结果缓存到注册表变化为止）"""
+    if simplified not in __help_cache__:
+        __help_cache__[simplified] = _render_help_list(simplified)
+    return __help_cache__[simplified]
+
+
+async def render_help(simplified=True):
+    """dump_help_list 的异步版本：缓存未命中时在线程池中生成帮助文本"""
+    if simplified not in __help_cache__:
+        __help_cache__[simplified] = await run_blocking("help_render", _render_help_list, simplified)
+    return __help_cache__[simplified]
+
+
+def _render_help_list(simplified):
     # 去重并收集所有非通配符菜单项
     seen = set()
     unique_menus = []
@@ -123,10 +277,13 @@ async def execute_menu(menu, ctx, **kwargs):
     preset_kwargs = menu.get("binding_func_kwargs", {})
     merged_kwargs = {**preset_kwargs, **kwargs}  # 合并字典
     
+    command = getattr(binding_func, "__name__", "unknown")
+    started = time.perf_counter()
     try:
         # 执行函数：ctx 作为首个参数，预设位置参数随后，合并的关键字参数最后
         return await binding_func(ctx, **merged_kwargs)
     except Exception as e:
+        COMMAND_ERRORS.inc(command=command)
         # 异常处理（含友好错误提示）
         error_detail = f"执行菜单 [{menu.get('title', '无标题')}] 时出错: {str(e)}"
         if hasattr(ctx, "reply"):
@@ -134,4 +291,6 @@ async def execute_menu(menu, ctx, **kwargs):
         else:
             print(f"[ERROR] {error_detail}")  # 无上下文时的降级处理
         
-        return None
\ No newline at end of file
+        return None
+    finally:
+        COMMAND_SECONDS.observe(time.perf_counter() - started, command=command)
\ No newline at end of file
@@ -0,0 +1,81 @@
+from dataclasses import dataclass
+from typing import FrozenSet, Iterable, Tuple
+
+# 判定原因码
+ALLOWED = "allowed"
+USER_NOT_ALLOWED = "user_not_allowed"
+USER_BLOCKED = "user_blocked"
+ROLE_BLOCKED = "role_blocked"
+DMS_DISABLED = "dms_disabled"
+CHANNEL_NOT_ALLOWED = "channel_not_allowed"
+CHANNEL_BLOCKED = "channel_blocked"
+
+
+@dataclass(frozen=True)
+class PermissionTable:
+    """由 cfg["permissions"] 编译出的只读允许/拒绝表"""
+    allow_dms: bool
+    allowed_users: FrozenSet[int]
+    blocked_users: FrozenSet[int]
+    allowed_roles: FrozenSet[int]
+    blocked_roles: FrozenSet[int]
+    allowed_channels: FrozenSet[int]
+    blocked_channels: FrozenSet[int]
+
+
+def _ids(perm: dict, key: str) -> FrozenSet[int]:
+    return frozenset(int(i) for i in (perm or {}).get(key) or ())
+
+
+def compile_permissions(cfg: dict) -> PermissionTable:
+    """将配置中的权限列表编译为 frozenset 表，仅在加载配置时调用一次"""
+    permissions = cfg.get("permissions") or {}
+    users, roles, channels = (permissions.get(k) or {} for k in ("users", "roles", "channels"))
+    return PermissionTable(
+        allow_dms=bool(cfg.get("allow_dms", True)),
+        allowed_users=_ids(users, "allowed_ids"),
+        blocked_users=_ids(users, "blocked_ids"),
+        allowed_roles=_ids(roles, "allowed_ids"),
+        blocked_roles=_ids(roles, "blocked_ids"),
+        allowed_channels=_ids(channels, "allowed_ids"),
+        blocked_channels=_ids(channels, "blocked_ids"),
+    )
+
+
+def check_permissions(
+    table: PermissionTable,
+    user_id: int,
+    role_ids: Iterable[int],
+    channel_ids: Iterable[int],
+    is_dm: bool,
+) -> Tuple[bool, str]:
+    """判定消息是否允许处理，返回 (是否允许, 原因码)
+
+    每次判定的开销只与该消息的角色/频道数量相关，与名单长度无关。
+    """
+    role_ids = frozenset(role_ids)
+    channel_ids = frozenset(channel_ids)
+
+    allow_all_users = (
+        not table.allowed_users if is_dm else not table.allowed_users and not table.allowed_roles
+    )
+    if not (
+        allow_all_users
+        or user_id in table.allowed_users
+        or not role_ids.isdisjoint(table.allowed_roles)
+    ):
+        return False, USER_NOT_ALLOWED
+    if user_id in table.blocked_users:
+        return False, USER_BLOCKED
+    if not role_ids.isdisjoint(table.blocked_roles):
+        return False, ROLE_BLOCKED
+
+    if is_dm:
+        if not table.allow_dms:
+            return False, DMS_DISABLED
+    elif table.allowed_channels and channel_ids.isdisjoint(table.allowed_channels):
+        return False, CHANNEL_NOT_ALLOWED
+    if not channel_ids.isdisjoint(table.blocked_channels):
+        return False, CHANNEL_BLOCKED
+
+    return True, ALLOWED
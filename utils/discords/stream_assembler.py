@@ -0,0 +1,105 @@
+import re
+from typing import List, Optional
+
+FENCE = "```"
+FENCE_LINE = re.compile(r"^[ \t]*```([^\s`]*)", re.MULTILINE)
+# 按优先级排列的断点：段落、换行、句末、空格
+SENTENCE_ENDS = ("。", "！", "？", ". ", "! ", "? ", "；", "; ")
+
+
+class StreamAssembler:
+    """流式回复分页：片段先存入列表，只在需要时拼接当前页
+
+    当前页超过 max_length 时在自然边界（段落 > 换行 > 句末 > 空格）处换页，
+    代码块被截断时在本页末尾补上 ``` 并在下一页以同样的语言重新打开。
+    每个字符只会被拼接常数次，总开销与回复长度成线性关系。
+    """
+
+    def __init__(self, max_length: int):
+        self.max_length = max_length
+        self._parts: List[str] = []
+        self._length = 0
+        self._text: Optional[str] = ""  # 当前页拼接结果的缓存
+
+    @property
+    def current(self) -> str:
+        """当前页（尚未换页）的完整文本"""
+        if self._text is None:
+            self._text = "".join(self._parts)
+            self._parts = [self._text]
+        return self._text
+
+    def feed(self, chunk: str) -> List[str]:
+        """追加片段，返回因此写满的页"""
+        self._parts.append(chunk)
+        self._length += len(chunk)
+        self._text = None
+        if self._length <= self.max_length:
+            return []
+        return self._split_full()
+
+    def finish(self) -> List[str]:
+        """结束流，返回剩余的页（可能为空）"""
+        pages = self._split_full()
+        if self.current.strip():
+            pages.append(self.current)
+        self._reset("")
+        return pages
+
+    def _split_full(self) -> List[str]:
+        pages = []
+        while self._length > self.max_length:
+            page = self._split()
+            # 大段空白切出的页只剩空白，Discord 不接受空消息，直接丢弃
+            if page.strip():
+                pages.append(page)
+        return pages
+
+    def _reset(self, text: str):
+        self._parts = [text] if text else []
+        self._length = len(text)
+        self._text = text
+
+    def _split(self) -> str:
+        text = self.current
+        # 预留补全代码块结尾的位置
+        limit = self.max_length - len(FENCE) - 1
+        cut = find_boundary(text, limit)
+        page, rest = text[:cut].rstrip(), text[cut:].lstrip("\n")
+        fence = open_fence_at(text, cut)
+        if fence is not None:
+            rest = f"{FENCE}{fence}\n{rest}"
+            # 代码块内只有空白时不输出空代码块，由调用方丢弃
+            page = "" if page.strip() == f"{FENCE}{fence}" else f"{page}\n{FENCE}"
+        self._reset(rest)
+        return page
+
+
+def open_fence_at(text: str, end: int) -> Optional[str]:
+    """text[:end] 结束时所在代码块的语言（无语言为空串），不在代码块内返回 None
+
+    续页开头重新打开的代码块也在 text 中，因此只需从头计数。
+    """
+    fence = None
+    for match in FENCE_LINE.finditer(text, 0, end):
+        fence = None if fence is not None else match.group(1)
+    return fence
+
+
+def find_boundary(text: str, limit: int) -> int:
+    """在 text[:limit] 中找最靠后的自然断点，找不到时在 limit 处硬切"""
+    window = text[:limit]
+    floor = limit // 2  # 断点太靠前会产生很短的页，宁可退到下一级
+    index = window.rfind("\n\n")
+    if index >= floor:
+        return index + 2
+    index = window.rfind("\n")
+    if index >= floor:
+        return index + 1
+    best = max((window.rfind(end) + len(end) for end in SENTENCE_ENDS if window.rfind(end) >= 0), default=-1)
+    if best >= floor:
+        return best
+    index = window.rfind(" ")
+    if index >= floor:
+        return index + 1
+    return limit
@@ -0,0 +1,249 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Union
+from urllib.parse import urlsplit
+from ..offload import run_blocking
+
+DEFAULT_MEMORY_BYTES = 128 * 1024 * 1024
+DEFAULT_DISK_BYTES = 1024 * 1024 * 1024
+DISK_PRUNE_RATIO = 0.9  # 超出磁盘预算时清理到预算的该比例，避免每次写入都触发清理
+
+
+@dataclass
+class CachedAttachment:
+    """处理完成、可直接放进请求的附件内容"""
+    kind: str  # "text" 或 "image"
+    digest: str  # 原始内容的 sha256
+    payload: Union[str, dict]  # 文本正文，或 image_url 内容块
+    limit: Optional[int] = None  # 文本读取时使用的 max_text，None 表示完整内容
+    variant: Optional[str] = None  # 处理参数标记（图片为 ImageSettings.cache_tag），参数不同的结果不能共用
+
+    @property
+    def size(self) -> int:
+        if self.kind == "text":
+            return len(self.payload) * 2
+        return len(self.payload["image_url"]["url"])
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "digest": self.digest, "payload": self.payload, "limit": self.limit, "variant": self.variant}
+
+
+def attachment_cache_key(att: dict) -> str:
+    """附件缓存键：优先使用附件 ID，否则使用去掉签名参数的 URL"""
+    if att.get("id"):
+        return f"id:{att['id']}"
+    parts = urlsplit(att["url"])
+    return f"url:{parts.netloc}{parts.path}"
+
+
+def content_digest(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class AttachmentCache:
+    """内存 LRU（按字节计）+ 可选磁盘存储的附件缓存
+
+    正文文件以内容哈希（及处理参数）命名，写盘时同样内容的不同附件共用一份；
+    键文件只记录正文文件名，因此重启后仍可命中。
+    磁盘占用超过 max_disk_bytes 时按修改时间删除最旧的正文（读取命中会刷新修改时间），
+    并清理指向已删除正文的键文件。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MEMORY_BYTES,
+        disk_path: Optional[str] = None,
+        max_disk_bytes: int = DEFAULT_DISK_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.max_disk_bytes = max_disk_bytes
+        self._disk_bytes: Optional[int] = None  # 首次写盘时扫描得到，之后增量维护
+        self._disk_lock = threading.Lock()  # 写盘在 io 线程池中并发执行
+        self._entries: "OrderedDict[str, CachedAttachment]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def configure(self, max_bytes: Optional[int] = None, disk_path: Optional[str] = None, max_disk_bytes: Optional[int] = None):
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if max_disk_bytes is not None:
+            self.max_disk_bytes = max_disk_bytes
+        if disk_path != self.disk_path:
+            self.disk_path = disk_path
+            self._disk_bytes = None
+        self._evict()
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    @staticmethod
+    def _usable(entry: CachedAttachment, limit: Optional[int], variant: Optional[str]) -> bool:
+        if entry.variant != variant:
+            return False
+        # 之前按更小的 max_text 截断过的文本不能满足更大的需求
+        return entry.kind != "text" or entry.limit is None or (limit is not None and entry.limit >= limit)
+
+    async def get(self, key: str, limit: Optional[int] = None, variant: Optional[str] = None) -> Optional[CachedAttachment]:
+        entry = self._entries.get(key)
+        if entry is not None and self._usable(entry, limit, variant):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        if self.disk_path:
+            entry = await run_blocking("attachment_cache_read", self._read_disk, key, executor="io")
+            if entry is not None and self._usable(entry, limit, variant):
+                self._remember(key, entry)
+                self.disk_hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, entry: CachedAttachment):
+        self._remember(key, entry)
+        if self.disk_path:
+            try:
+                await run_blocking("attachment_cache_write", self._write_disk, key, entry, executor="io")
+            except OSError as e:
+                logging.error(f"写入附件磁盘缓存失败: {str(e)}")
+
+    def _remember(self, key: str, entry: CachedAttachment):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key).size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        self._evict()
+
+    def _evict(self):
+        while self._entries and self._bytes > self.max_bytes:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+
+    # 磁盘存储：keys/<sha256(key)> 记录正文文件名，blobs/<digest>-<kind>-<limit>[-<variant 哈希>].json 保存正文
+    def _blob_dir(self) -> str:
+        return os.path.join(self.disk_path, "blobs")
+
+    def _key_file(self, key: str) -> str:
+        return os.path.join(self.disk_path, "keys", hashlib.sha256(key.encode()).hexdigest())
+
+    def _blob_file(self, entry: CachedAttachment) -> str:
+        name = f"{entry.digest}-{entry.kind}-{entry.limit or 'full'}"
+        if entry.variant:
+            name += f"-{hashlib.sha256(entry.variant.encode()).hexdigest()[:16]}"
+        return os.path.join(self._blob_dir(), f"{name}.json")
+
+    def _read_disk(self, key: str) -> Optional[CachedAttachment]:
+        try:
+            with open(self._key_file(key), "r", encoding="utf-8") as f:
+                blob_file = os.path.join(self._blob_dir(), f.read().strip())
+            with open(blob_file, "r", encoding="utf-8") as f:
+                entry = CachedAttachment(**json.load(f))
+            os.utime(blob_file)  # 刷新修改时间，清理时按最近使用保留
+            return entry
+        except (OSError, ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def _write_atomic(path: str, text: str) -> int:
+        """经同目录下唯一的临时文件写入后替换，并发写同一文件时不会互相覆盖临时文件"""
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            raise
+        return size
+
+    def _write_disk(self, key: str, entry: CachedAttachment):
+        blob_file = self._blob_file(entry)
+        os.makedirs(os.path.dirname(blob_file), exist_ok=True)
+        os.makedirs(os.path.dirname(self._key_file(key)), exist_ok=True)
+        written = 0
+        if not os.path.exists(blob_file):
+            written = self._write_atomic(blob_file, json.dumps(entry.to_dict(), ensure_ascii=False))
+        self._write_atomic(self._key_file(key), os.path.basename(blob_file))
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_blob_bytes()
+            else:
+                self._disk_bytes += written
+            if self._disk_bytes > self.max_disk_bytes:
+                self._prune_disk()
+
+    def _scan_blob_bytes(self) -> int:
+        total = 0
+        with os.scandir(self._blob_dir()) as it:
+            for item in it:
+                if item.name.endswith(".json"):
+                    with contextlib.suppress(OSError):
+                        total += item.stat().st_size
+        return total
+
+    def _prune_disk(self):
+        """删除最久未使用的正文直到低于预算，再清理指向已删除正文的键文件（持有 _disk_lock 时调用）"""
+        blobs = []
+        with os.scandir(self._blob_dir()) as it:
+            for item in it:
+                if item.name.endswith(".json"):
+                    with contextlib.suppress(OSError):
+                        stat = item.stat()
+                        blobs.append((stat.st_mtime, stat.st_size, item.path))
+        blobs.sort()
+        total = sum(size for _, size, _ in blobs)
+        target = self.max_disk_bytes * DISK_PRUNE_RATIO
+        removed = 0
+        for _, size, path in blobs:
+            if total <= target:
+                break
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+                total -= size
+                removed += 1
+        self._disk_bytes = total
+        if removed:
+            orphans = self._prune_keys()
+            logging.info(f"附件磁盘缓存超出预算，已删除 {removed} 个正文文件与 {orphans} 个失效键")
+
+    def _prune_keys(self) -> int:
+        blob_dir = self._blob_dir()
+        removed = 0
+        with os.scandir(os.path.join(self.disk_path, "keys")) as it:
+            for item in it:
+                try:
+                    with open(item.path, "r", encoding="utf-8") as f:
+                        blob_name = f.read().strip()
+                    if not os.path.exists(os.path.join(blob_dir, blob_name)):
+                        os.unlink(item.path)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
+
+
+attachment_cache = AttachmentCache()
+
+
+def get_attachment_cache() -> AttachmentCache:
+    """获取全局附件缓存"""
+    return attachment_cache
@@ -0,0 +1,72 @@
+import codecs
+import logging
+from typing import Optional
+import httpx
+
+DEFAULT_MAX_ATTACHMENT_BYTES = 20 * 1024 * 1024
+DEFAULT_MAX_REQUEST_ATTACHMENT_BYTES = 50 * 1024 * 1024
+DEFAULT_ATTACHMENT_CONCURRENCY = 4
+
+
+class AttachmentTooLarge(Exception):
+    """附件超出单个或单次请求的字节预算"""
+
+
+class ByteBudget:
+    """单次请求内所有附件共享的字节预算"""
+
+    def __init__(self, total: int):
+        self.remaining = total
+
+    def take(self, size: int):
+        if size > self.remaining:
+            raise AttachmentTooLarge("附件总大小超出本次请求的预算")
+        self.remaining -= size
+
+
+def _check_declared_size(resp: httpx.Response, att: dict, max_bytes: int):
+    """在读取正文前，用 Content-Length / Discord 提供的 size 提前拒绝过大附件"""
+    declared = resp.headers.get("content-length") or att.get("size")
+    if declared and int(declared) > max_bytes:
+        raise AttachmentTooLarge(f"附件大小 {declared} 字节超出上限 {max_bytes}")
+
+
+async def fetch_text(client: httpx.AsyncClient, att: dict, max_chars: int, max_bytes: int, budget: ByteBudget) -> str:
+    """流式读取文本附件，读到 max_chars 个字符即停止"""
+    async with client.stream("GET", att["url"]) as resp:
+        resp.raise_for_status()
+        decoder = codecs.getincrementaldecoder(resp.charset_encoding or "utf-8")(errors="replace")
+        parts = []
+        chars = 0
+        read = 0
+        async for chunk in resp.aiter_bytes():
+            chunk = chunk[:max_bytes - read]
+            read += len(chunk)
+            budget.take(len(chunk))
+            text = decoder.decode(chunk)
+            parts.append(text)
+            chars += len(text)
+            if chars >= max_chars or read >= max_bytes:
+                break
+        return "".join(parts)[:max_chars]
+
+
+async def fetch_bytes(client: httpx.AsyncClient, att: dict, max_bytes: int, budget: ByteBudget) -> bytes:
+    """流式读取二进制附件，超出单附件或请求预算时中止"""
+    async with client.stream("GET", att["url"]) as resp:
+        resp.raise_for_status()
+        _check_declared_size(resp, att, max_bytes)
+        body = bytearray()
+        async for chunk in resp.aiter_bytes():
+            if len(body) + len(chunk) > max_bytes:
+                raise AttachmentTooLarge(f"附件超出上限 {max_bytes} 字节")
+            budget.take(len(chunk))
+            body += chunk
+        return bytes(body)
+
+
+def log_skipped(att: dict, error: Optional[BaseException]):
+    if isinstance(error, AttachmentTooLarge):
+        logging.warning(f"跳过附件 {att.get('url')}: {str(error)}")
+    else:
+        logging.error(f"下载附件失败 {att.get('url')}: {str(error)}")
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set, Tuple
+from ..metrics import counter, register_collector
+
+# 停止原因及显示文本
+STOP_REASONS = {
+    "deleted": "提示消息已被删除",
+    "edited": "提示消息已被编辑",
+    "superseded": "已被新的提问取代",
+    "stopped": "已手动停止",
+    "response_deleted": "回复已被删除",
+}
+DEFAULT_STOP_EMOJIS = ("⏹️", "🛑")
+
+GENERATIONS_CANCELLED = counter("llmcord_generations_cancelled", "被取消的生成次数", ["reason"])
+
+
+@dataclass(eq=False)
+class Generation:
+    """一次进行中的生成：对应处理该提示消息的任务"""
+    prompt_id: int
+    user_id: int
+    channel_id: int
+    task: asyncio.Task
+    response_ids: Set[int] = field(default_factory=set)
+    reason: Optional[str] = None  # 被取消时记录原因
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str) -> bool:
+        """取消生成任务，已取消或已结束时返回 False"""
+        if self.reason is not None or self.task.done():
+            return False
+        self.reason = reason
+        self.task.cancel()
+        GENERATIONS_CANCELLED.inc(reason=reason)
+        logging.info(f"停止生成：提示消息 {self.prompt_id}，原因：{STOP_REASONS.get(reason, reason)}")
+        return True
+
+
+class GenerationRegistry:
+    """进行中的生成，可按提示消息 / 回复消息 ID 或 (用户, 频道) 查找"""
+
+    def __init__(self):
+        self._by_message: Dict[int, Generation] = {}  # 提示消息与回复消息 ID
+        self._by_user: Dict[Tuple[int, int], Set[Generation]] = {}
+
+    def register(self, prompt_id: int, user_id: int, channel_id: int, task: asyncio.Task) -> Generation:
+        generation = Generation(prompt_id, user_id, channel_id, task)
+        self._by_message[prompt_id] = generation
+        self._by_user.setdefault((user_id, channel_id), set()).add(generation)
+        return generation
+
+    def add_response(self, generation: Generation, message_id: int):
+        """登记生成中发出的回复消息，删除回复或对其添加停止反应也能取消生成"""
+        generation.response_ids.add(message_id)
+        self._by_message[message_id] = generation
+
+    def unregister(self, generation: Generation):
+        for message_id in (generation.prompt_id, *generation.response_ids):
+            if self._by_message.get(message_id) is generation:
+                del self._by_message[message_id]
+        key = (generation.user_id, generation.channel_id)
+        generations = self._by_user.get(key)
+        if generations is not None:
+            generations.discard(generation)
+            if not generations:
+                del self._by_user[key]
+
+    def get(self, message_id: int) -> Optional[Generation]:
+        return self._by_message.get(message_id)
+
+    def cancel_message(self, message_id: int, reason: str) -> Optional[Generation]:
+        """按提示或回复消息 ID 取消，返回被取消的生成"""
+        generation = self._by_message.get(message_id)
+        if generation is not None and generation.cancel(reason):
+            return generation
+        return None
+
+    def cancel_user(self, user_id: int, channel_id: int, reason: str) -> int:
+        """取消该用户在该频道内的全部生成，返回取消的数量"""
+        return sum(
+            generation.cancel(reason)
+            for generation in list(self._by_user.get((user_id, channel_id), ()))
+        )
+
+    def __len__(self) -> int:
+        return sum(len(generations) for generations in self._by_user.values())
+
+
+generation_registry = GenerationRegistry()
+
+register_collector(
+    "llmcord_generations_inflight", "进行中的生成数", "gauge",
+    lambda: [({}, len(generation_registry))],
+)
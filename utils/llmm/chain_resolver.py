@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set
+import discord
+from ..metrics import counter, histogram
+
+# 一次批量拉取的历史消息条数（Discord 单次上限 100）
+DEFAULT_HISTORY_LIMIT = 50
+MAX_HISTORY_LIMIT = 100
+
+PARENT_LOOKUPS = counter(
+    "llmcord_parent_lookups", "回复链父消息查找次数，按来源区分（cache/resolved/client_cache/history/api/error）", ["source"],
+)
+PARENT_FETCH_SECONDS = histogram("llmcord_parent_fetch_seconds", "从 Discord API 获取父消息的耗时", ["method"])
+
+
+class ChainResolver:
+    """单次请求内的回复链解析器
+
+    查找顺序：节点缓存 → 网关随消息下发的引用（reference.resolved）→ discord.py 消息缓存
+    → 一次 channel.history 批量拉取 → 单条 fetch_message。
+    同一条消息在一次请求内只解析一次；找到消息后，若其父消息已在手边，
+    立即并行构建父节点（下载附件等），不必等调用方逐级请求。
+    预取深度按整条链计算，不超过 max_depth；链构建结束后调用 close() 取消未被使用的预取。
+    """
+
+    def __init__(
+        self,
+        channel,
+        discord_client: discord.Client,
+        node_cache,
+        load_node: Callable[[discord.Message], Awaitable[object]],
+        max_depth: int = 25,
+        history_limit: int = DEFAULT_HISTORY_LIMIT,
+    ):
+        self.channel = channel
+        self.discord_client = discord_client
+        self.node_cache = node_cache
+        self.load_node = load_node
+        self.max_depth = max_depth
+        self.history_limit = min(history_limit, MAX_HISTORY_LIMIT)
+        self._known: Dict[int, discord.Message] = {}  # 已拿到但尚未构建节点的消息
+        self._known_sources: Dict[int, str] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._depths: Dict[int, int] = {}  # 消息在链中距新消息的层数
+        self._steps = 0  # 调用方逐级请求的次数，即下一条未预取消息的层数
+        self._history_fetched = False
+        self._requested: Set[int] = set()  # 已向 API 请求过的消息 ID
+
+    def seed(self, msg: discord.Message):
+        """记录网关已解析好的引用消息，解析时无需请求 API"""
+        while msg.reference is not None and isinstance(msg.reference.resolved, discord.Message):
+            msg = msg.reference.resolved
+            self._known.setdefault(msg.id, msg)
+            self._known_sources.setdefault(msg.id, "resolved")
+
+    async def get(self, message_id: int):
+        """获取消息节点，失败返回 None"""
+        self._steps += 1
+        return await self._schedule(message_id, self._depths.get(message_id, self._steps - 1))
+
+    def close(self):
+        """取消尚未完成的预取（链已在 max_messages 处截断，或生成被取消）"""
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+
+    def _schedule(self, message_id: int, depth: int) -> "asyncio.Task":
+        task = self._tasks.get(message_id)
+        if task is None:
+            self._depths[message_id] = depth
+            task = self._tasks[message_id] = asyncio.create_task(self._resolve(message_id, depth))
+        return task
+
+    def _lookup_local(self, message_id: int) -> Optional[discord.Message]:
+        """不经网络可得的消息：已记录的引用 / 批量结果，其次是 discord.py 的消息缓存"""
+        msg = self._known.pop(message_id, None)
+        if msg is not None:
+            PARENT_LOOKUPS.inc(source=self._known_sources.pop(message_id))
+            return msg
+        msg = self.discord_client._connection._get_message(message_id)
+        if msg is not None:
+            PARENT_LOOKUPS.inc(source="client_cache")
+        return msg
+
+    async def _fetch_history(self, message_id: int):
+        """拉取包含该消息在内的更早历史，一次请求可覆盖多级祖先"""
+        self._history_fetched = True
+        with PARENT_FETCH_SECONDS.time(method="history"):
+            async for msg in self.channel.history(limit=self.history_limit, before=discord.Object(id=message_id + 1)):
+                self._requested.add(msg.id)
+                if msg.id not in self._tasks or msg.id == message_id:
+                    self._known.setdefault(msg.id, msg)
+                    self._known_sources.setdefault(msg.id, "history")
+
+    async def _find_message(self, message_id: int) -> Optional[discord.Message]:
+        if (msg := self._lookup_local(message_id)) is not None:
+            return msg
+        if not self._history_fetched and self.history_limit > 1:
+            try:
+                await self._fetch_history(message_id)
+            except Exception as e:
+                logging.warning(f"批量获取历史消息失败，改为逐条获取: {str(e)}")
+            if (msg := self._lookup_local(message_id)) is not None:
+                return msg
+        if message_id in self._requested:
+            # 同一消息只向 API 请求一次；批量结果中没有的消息不在此列，仍会逐条 fetch_message
+            return None
+        self._requested.add(message_id)
+        with PARENT_FETCH_SECONDS.time(method="fetch"):
+            msg = await self.channel.fetch_message(message_id)
+        PARENT_LOOKUPS.inc(source="api")
+        return msg
+
+    async def _resolve(self, message_id: int, depth: int):
+        if (node := self.node_cache.get(message_id)) is not None:
+            PARENT_LOOKUPS.inc(source="cache")
+            return node
+        try:
+            msg = await self._find_message(message_id)
+            if msg is None:
+                PARENT_LOOKUPS.inc(source="error")
+                logging.error(f"获取父消息失败: 消息 {message_id} 不存在")
+                return None
+            # 父消息已在手边时提前并行构建
+            parent_id = msg.reference.message_id if msg.reference else None
+            if parent_id and depth + 1 < self.max_depth and parent_id not in self.node_cache:
+                if parent_id in self._known or self.discord_client._connection._get_message(parent_id) is not None:
+                    self._schedule(parent_id, depth + 1)
+            node = await self.load_node(msg)
+        except Exception as e:
+            PARENT_LOOKUPS.inc(source="error")
+            logging.error(f"获取父消息失败: {str(e)}")
+            return None
+        self.node_cache.put(message_id, node)
+        return node
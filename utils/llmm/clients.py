@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+import httpx
+from openai import AsyncOpenAI
+
+try:
+    import h2  # noqa: F401  安装了 h2 才能启用 HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+DEFAULT_POOL_CONFIG = {
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 60.0,
+    "connect_timeout": 10.0,
+    "read_timeout": 300.0,
+    "http2": True,
+}
+# 影响连接池构造的配置项，变化后需要新建客户端
+POOL_KEYS = ("max_connections", "max_keepalive_connections", "keepalive_expiry", "connect_timeout", "read_timeout", "http2")
+RETIRED_CLIENT_GRACE = 600.0  # 退役客户端延迟关闭（秒），让仍在使用旧配置的请求完成
+
+@dataclass
+class ProviderClient:
+    """同一 provider/base_url/api_key 共享的一组客户端"""
+    provider: str
+    base_url: str
+    httpx_client: httpx.AsyncClient
+    openai_client: AsyncOpenAI
+
+# 进程级客户端注册表，键为 (provider, base_url, api_key, 连接池配置)
+__client_registry__: Dict[Tuple, ProviderClient] = {}
+# 已从注册表移除、等待宽限期后关闭的客户端
+__retired_clients__: List[ProviderClient] = []
+__retire_tasks__ = set()
+
+
+def get_pool_config(cfg: dict) -> dict:
+    """合并默认连接池配置与 config.yaml 中的 client_pool"""
+    return {**DEFAULT_POOL_CONFIG, **(cfg.get("client_pool") or {})}
+
+
+def _build_httpx_client(pool_cfg: dict) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=pool_cfg["max_connections"],
+        max_keepalive_connections=pool_cfg["max_keepalive_connections"],
+        keepalive_expiry=pool_cfg["keepalive_expiry"],
+    )
+    timeout = httpx.Timeout(pool_cfg["read_timeout"], connect=pool_cfg["connect_timeout"])
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=timeout,
+        http2=bool(pool_cfg["http2"]) and HTTP2_AVAILABLE,
+    )
+
+
+def get_provider_client(provider: str, base_url: str, api_key: str, pool_cfg: dict = None) -> ProviderClient:
+    """获取（必要时创建）共享客户端，provider/base_url/api_key 与连接池配置都相同时复用同一连接池"""
+    pool_cfg = pool_cfg or DEFAULT_POOL_CONFIG
+    key = (provider, base_url, api_key, tuple(pool_cfg.get(name, DEFAULT_POOL_CONFIG[name]) for name in POOL_KEYS))
+    client = __client_registry__.get(key)
+    if client is None:
+        httpx_client = _build_httpx_client(pool_cfg)
+        client = ProviderClient(
+            provider=provider,
+            base_url=base_url,
+            httpx_client=httpx_client,
+            # OpenAI 客户端复用同一个 httpx 连接池
+            openai_client=AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=httpx_client),
+        )
+        __client_registry__[key] = client
+        logging.info(f"创建共享客户端: {provider} ({base_url})")
+    return client
+
+
+def get_client_for_config(cfg: dict) -> ProviderClient:
+    """根据 cfg["model"] 获取当前模型对应的共享客户端"""
+    provider = cfg["model"].split("/", 1)[0]
+    provider_cfg = cfg["providers"][provider]
+    return get_provider_client(
+        provider,
+        provider_cfg["base_url"],
+        provider_cfg.get("api_key") or "sk-no-key-required",
+        get_pool_config(cfg),
+    )
+
+
+async def warmup_clients(cfg: dict):
+    """启动时预热：提前建立到当前模型 provider 的连接"""
+    if not get_pool_config(cfg).get("warmup", False):
+        return
+    client = get_client_for_config(cfg)
+    try:
+        # 任意响应都说明 TCP/TLS 已建立，连接会留在 keep-alive 池中
+        await client.httpx_client.get(
+            f"{client.base_url.rstrip('/')}/models",
+            headers={"Authorization": f"Bearer {client.openai_client.api_key}"},
+        )
+        logging.info(f"客户端预热完成: {client.provider}")
+    except Exception as e:
+        logging.warning(f"客户端预热失败: {str(e)}")
+
+
+async def _close_clients(clients: List[ProviderClient]):
+    await asyncio.gather(
+        *(client.openai_client.close() for client in clients),
+        *(client.httpx_client.aclose() for client in clients),
+        return_exceptions=True,
+    )
+
+
+async def _close_retired(clients: List[ProviderClient], delay: float):
+    await asyncio.sleep(delay)
+    closing = {id(client) for client in clients}
+    __retired_clients__[:] = [client for client in __retired_clients__ if id(client) not in closing]
+    await _close_clients(clients)
+    logging.info(f"已关闭 {len(clients)} 个不再使用的共享客户端")
+
+
+def retire_unused_clients(in_use: Iterable[ProviderClient], grace: float = RETIRED_CLIENT_GRACE) -> int:
+    """把当前配置不再使用的客户端移出注册表，宽限期后关闭（换 key、换 base_url 或修改 client_pool 后调用）"""
+    in_use_ids = {id(client) for client in in_use}
+    retired = [(key, client) for key, client in __client_registry__.items() if id(client) not in in_use_ids]
+    if not retired:
+        return 0
+    clients = []
+    for key, client in retired:
+        del __client_registry__[key]
+        clients.append(client)
+    __retired_clients__.extend(clients)
+    try:
+        task = asyncio.get_running_loop().create_task(_close_retired(clients, grace))
+    except RuntimeError:
+        return len(clients)  # 不在事件循环中，由 close_all_clients 统一关闭
+    __retire_tasks__.add(task)
+    task.add_done_callback(__retire_tasks__.discard)
+    return len(clients)
+
+
+async def close_all_clients():
+    """关闭全部共享客户端（程序退出时调用），包括尚在宽限期内的退役客户端"""
+    for task in list(__retire_tasks__):
+        task.cancel()
+    clients = [*__client_registry__.values(), *__retired_clients__]
+    __client_registry__.clear()
+    __retired_clients__.clear()
+    await _close_clients(clients)
+    if clients:
+        logging.info(f"已关闭 {len(clients)} 个共享客户端")
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import time
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+from openai import APIStatusError
+from ..metrics import counter, histogram, register_collector, RATE_BUCKETS
+from .clients import ProviderClient, get_provider_client, get_pool_config
+
+EWMA_ALPHA = 0.3  # 首 token 延迟的指数加权系数
+DEFAULT_FAILURE_THRESHOLD = 3  # 连续失败多少次后熔断
+DEFAULT_COOLDOWN = 30.0  # 熔断后多久允许一次试探请求（秒）
+DEFAULT_PROBE_INTERVAL = 30.0  # 健康检查间隔（秒），0 关闭
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class NoEndpointAvailable(Exception):
+    pass
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """是否应计入端点故障：连接错误、超时、429 与 5xx 计入；其余 4xx 是请求本身的问题"""
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return True
+
+
+class Endpoint:
+    """一个可提供该模型的上游端点，记录延迟与熔断状态"""
+
+    def __init__(self, provider: str, model: str, client: ProviderClient):
+        self.provider = provider
+        self.model = model
+        self.client = client
+        self.ewma_ttft: Optional[float] = None
+        self.inflight = 0
+        self.failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trial_inflight = False
+        self.successes = 0
+        self.errors = 0
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}/{self.model}"
+
+    def available(self, now: float, cooldown: float) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now - self.opened_at >= cooldown:
+            self.state = HALF_OPEN
+        # 半开状态同一时间只放行一个试探请求
+        return self.state == HALF_OPEN and not self.trial_inflight
+
+    def score(self) -> float:
+        # 未测量过的端点视为最快，优先获得样本
+        return (self.ewma_ttft or 0.0) * (self.inflight + 1)
+
+    def record_success(self, ttft: float):
+        self.ewma_ttft = ttft if self.ewma_ttft is None else EWMA_ALPHA * ttft + (1 - EWMA_ALPHA) * self.ewma_ttft
+        self.failures = 0
+        self.successes += 1
+        if self.state != CLOSED:
+            logging.info(f"端点 {self.name} ({self.client.base_url}) 已恢复")
+        self.state = CLOSED
+
+    def record_failure(self, threshold: int):
+        self.failures += 1
+        self.errors += 1
+        if self.state == HALF_OPEN or self.failures >= threshold:
+            if self.state != OPEN:
+                logging.warning(f"端点 {self.name} ({self.client.base_url}) 连续失败 {self.failures} 次，已熔断")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def get_stats(self) -> dict:
+        return {
+            "endpoint": self.name,
+            "base_url": self.client.base_url,
+            "state": self.state,
+            "ewma_ttft": self.ewma_ttft,
+            "inflight": self.inflight,
+            "successes": self.successes,
+            "errors": self.errors,
+        }
+
+
+# 端点注册表：配置重载后同一端点沿用原有的延迟与熔断统计
+__endpoint_registry__: Dict[Tuple[str, str, str, str], Endpoint] = {}
+
+UPSTREAM_TTFT_SECONDS = histogram("llmcord_upstream_ttft_seconds", "上游首 token 延迟", ["provider", "endpoint"])
+UPSTREAM_TOKENS_PER_SECOND = histogram(
+    "llmcord_upstream_tokens_per_second", "首 token 之后的输出速度（流式片段/秒）", ["provider", "endpoint"],
+    buckets=RATE_BUCKETS,
+)
+UPSTREAM_ERRORS = counter("llmcord_upstream_errors", "上游请求失败次数（connect 为首 token 前）", ["provider", "endpoint", "stage"])
+register_collector(
+    "llmcord_endpoint_up", "端点熔断器是否闭合（1 为正常）", "gauge",
+    lambda: [
+        ({"provider": e.provider, "endpoint": e.name, "base_url": e.client.base_url}, int(e.state == CLOSED))
+        for e in __endpoint_registry__.values()
+    ],
+)
+
+
+def get_endpoint(provider: str, model: str, base_url: str, api_key: str, pool_cfg: dict) -> Endpoint:
+    key = (provider, base_url, api_key, model)
+    client = get_provider_client(provider, base_url, api_key, pool_cfg)
+    endpoint = __endpoint_registry__.get(key)
+    if endpoint is None:
+        endpoint = __endpoint_registry__[key] = Endpoint(provider, model, client)
+    else:
+        # client_pool 修改后换用新的连接池，延迟与熔断统计保留
+        endpoint.client = client
+    return endpoint
+
+
+class EndpointPool:
+    """同一逻辑模型的多个端点：按 EWMA 首 token 延迟选路，熔断故障端点
+
+    首个 token 之前失败的请求会换一个端点重试；已经开始输出后失败则直接抛出。
+    4xx 客户端错误（429 除外）由请求内容导致，直接抛出，不计入熔断也不切换端点。
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = DEFAULT_COOLDOWN,
+        max_attempts: Optional[int] = None,
+    ):
+        self.endpoints = endpoints
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts or len(endpoints)
+
+    def choose(self, exclude=()) -> Optional[Endpoint]:
+        if len(self.endpoints) == 1:
+            # 只有一个端点时熔断没有可切换的去处，始终放行
+            endpoint = self.endpoints[0]
+            return None if endpoint in exclude else endpoint
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude and e.available(now, self.cooldown)]
+        if not candidates:
+            return None
+        return min(candidates, key=Endpoint.score)
+
+    async def stream(self, messages: List[dict], params: dict) -> AsyncGenerator[str, None]:
+        """流式生成，首 token 之前失败时切换端点"""
+        tried = []
+        last_error: Optional[BaseException] = None
+        while len(tried) < self.max_attempts:
+            endpoint = self.choose(tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            trial = endpoint.state == HALF_OPEN
+            endpoint.trial_inflight |= trial
+            endpoint.inflight += 1
+            started = time.monotonic()
+            first_token = False
+            chunks = 0
+            try:
+                stream = await endpoint.client.openai_client.chat.completions.create(
+                    model=endpoint.model,
+                    messages=messages,
+                    stream=True,
+                    **params
+                )
+                # 调用方提前关闭（生成被取消）时立即断开上游连接
+                async with stream:
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        if content := chunk.choices[0].delta.content:
+                            chunks += 1
+                            if not first_token:
+                                first_token = True
+                                first_token_at = time.monotonic()
+                                endpoint.record_success(first_token_at - started)
+                                UPSTREAM_TTFT_SECONDS.observe(first_token_at - started, provider=endpoint.provider, endpoint=endpoint.name)
+                            yield content
+                if not first_token:
+                    # 空回复也算一次成功的往返
+                    endpoint.record_success(time.monotonic() - started)
+                elif (elapsed := time.monotonic() - first_token_at) > 0:
+                    # 流式片段数近似 token 数
+                    UPSTREAM_TOKENS_PER_SECOND.observe(chunks / elapsed, provider=endpoint.provider, endpoint=endpoint.name)
+                return
+            except Exception as e:
+                if not is_endpoint_failure(e):
+                    raise
+                endpoint.record_failure(self.failure_threshold)
+                UPSTREAM_ERRORS.inc(provider=endpoint.provider, endpoint=endpoint.name, stage="stream" if first_token else "connect")
+                if first_token:
+                    raise
+                last_error = e
+                logging.warning(f"端点 {endpoint.name} ({endpoint.client.base_url}) 请求失败，尝试其他端点: {str(e)}")
+            finally:
+                endpoint.inflight -= 1
+                if trial:
+                    endpoint.trial_inflight = False
+        if last_error is not None:
+            raise last_error
+        raise NoEndpointAvailable("没有可用的模型端点")
+
+    async def probe(self):
+        """对非正常状态的端点做健康检查，恢复后重新参与选路"""
+        async def probe_one(endpoint: Endpoint):
+            client = endpoint.client
+            started = time.monotonic()
+            try:
+                response = await client.httpx_client.get(
+                    f"{client.base_url.rstrip('/')}/models",
+                    headers={"Authorization": f"Bearer {client.openai_client.api_key}"},
+                    timeout=10,
+                )
+                healthy = response.status_code < 500
+            except Exception:
+                healthy = False
+            if healthy:
+                if endpoint.state != CLOSED:
+                    endpoint.record_success(endpoint.ewma_ttft or time.monotonic() - started)
+            else:
+                endpoint.record_failure(self.failure_threshold)
+
+        await asyncio.gather(*(probe_one(e) for e in self.endpoints if e.state != CLOSED))
+
+    def get_stats(self) -> List[dict]:
+        return [endpoint.get_stats() for endpoint in self.endpoints]
+
+
+def parse_endpoint(name: str) -> Tuple[str, str]:
+    provider, model = name.split("/", 1)
+    return provider, model
+
+
+def build_endpoint_pool(cfg) -> EndpointPool:
+    """由 model 与 model_endpoints 构建端点池（第一个为主端点）"""
+    pool_cfg = get_pool_config(cfg)
+    routing_cfg = cfg.get("endpoint_routing") or {}
+    endpoints = []
+    for name in [cfg["model"], *(cfg.get("model_endpoints") or ())]:
+        provider, model = parse_endpoint(name)
+        provider_cfg = cfg["providers"][provider]
+        endpoint = get_endpoint(
+            provider,
+            model,
+            provider_cfg["base_url"],
+            provider_cfg.get("api_key") or "sk-no-key-required",
+            pool_cfg,
+        )
+        if endpoint not in endpoints:
+            endpoints.append(endpoint)
+    return EndpointPool(
+        endpoints,
+        failure_threshold=routing_cfg.get("failure_threshold", DEFAULT_FAILURE_THRESHOLD),
+        cooldown=routing_cfg.get("cooldown", DEFAULT_COOLDOWN),
+        max_attempts=routing_cfg.get("max_attempts"),
+    )
+
+
+async def probe_endpoints(get_pool, get_interval):
+    """后台健康检查循环：get_pool 返回当前端点池，get_interval 返回当前间隔"""
+    while True:
+        interval = get_interval()
+        await asyncio.sleep(interval or DEFAULT_PROBE_INTERVAL)
+        if not interval:
+            continue
+        pool = get_pool()
+        if pool is not None:
+            try:
+                await pool.probe()
+            except Exception as e:
+                logging.error(f"端点健康检查失败: {str(e)}")
@@ -1,5 +1,5 @@
 import asyncio
-from base64 import b64encode
+import contextlib
 from datetime import datetime as dt
 from dataclasses import dataclass, field
 from typing import Literal, Optional, List, Dict, AsyncGenerator
@@ -8,6 +8,29 @@ from openai import AsyncOpenAI
 import logging
 import discord
 from ..discords.menu import menu_item
+from ..discords.edit_scheduler import EditScheduler, DEFAULT_EDIT_INTERVAL, DEFAULT_CHANNEL_EDIT_INTERVAL
+from ..discords.stream_assembler import StreamAssembler
+from ..config import register_config_applier, register_derived, thaw
+from ..metrics import counter, histogram, register_collector, COUNT_BUCKETS
+from .clients import ProviderClient, get_client_for_config, retire_unused_clients
+from .endpoints import EndpointPool, build_endpoint_pool
+from .attachments import (
+    ByteBudget, fetch_text, fetch_bytes, log_skipped,
+    DEFAULT_MAX_ATTACHMENT_BYTES, DEFAULT_MAX_REQUEST_ATTACHMENT_BYTES, DEFAULT_ATTACHMENT_CONCURRENCY,
+)
+from .attachment_cache import (
+    CachedAttachment, attachment_cache, attachment_cache_key, content_digest, DEFAULT_MEMORY_BYTES, DEFAULT_DISK_BYTES,
+)
+from .scheduler import QueueFull, UserQueueFull, configure_schedulers, get_generation_scheduler, DEFAULT_POSITION_UPDATE_INTERVAL
+from .response_cache import response_cache, response_cache_key, is_deterministic, replay_response, record_response
+from .tokens import (
+    get_tokenizer, get_context_tokens, node_tokens, record_chain_budget,
+    DEFAULT_CONTEXT_TOKENS, MESSAGE_OVERHEAD_TOKENS,
+)
+from .node_cache import MessageNodeCache, DEFAULT_MAX_NODES, DEFAULT_MAX_BYTES
+from .chain_resolver import ChainResolver, DEFAULT_HISTORY_LIMIT
+from .images import ImageSettings, get_image_settings, build_image_payload
+from .cancellation import Generation, generation_registry, STOP_REASONS, DEFAULT_STOP_EMOJIS
 VISION_MODEL_TAGS = ("gpt-4", "claude-3", "gemini", "gemma", "llama", "pixtral", "mistral-small", "vision", "vl")
 streaming_indicator_list = "❤🧡💛💚💙💜🤎🖤🤍💕💓💗💖💘💝💟💌"
 
@@ -22,6 +45,14 @@ class AIConfig:
     max_images: int
     max_messages: int
     extra_api_parameters: dict
+    accept_images: bool = False
+    accept_usernames: bool = False
+    max_attachment_bytes: int = DEFAULT_MAX_ATTACHMENT_BYTES
+    max_request_attachment_bytes: int = DEFAULT_MAX_REQUEST_ATTACHMENT_BYTES
+    attachment_concurrency: int = DEFAULT_ATTACHMENT_CONCURRENCY
+    context_tokens: int = DEFAULT_CONTEXT_TOKENS
+    tokenizer: str = "auto"  # auto / tiktoken / heuristic
+    image_settings: ImageSettings = field(default_factory=ImageSettings)
 
 @dataclass
 class MessageNode:
@@ -30,89 +61,178 @@ class MessageNode:
     role: Literal["user", "assistant"] = "assistant"
     user_id: Optional[str] = None
     parent_msg_id: Optional[int] = None
+    timestamp: Optional[str] = None
+    # 按 (分词器, max_text) 缓存的文本 token 数
+    token_counts: Dict[tuple, int] = field(default_factory=dict, repr=False, compare=False)
 
 class AIGenerator:
-    def __init__(self, config: AIConfig):
+    def __init__(self, config: AIConfig, client: Optional[ProviderClient] = None, endpoints: Optional[EndpointPool] = None):
         self.config = config
-        self.httpx_client = httpx.AsyncClient()
-        self.openai_client = AsyncOpenAI(
-            base_url=config.base_url,
-            api_key=config.api_key
-        )
+        # 配置了端点池时由端点池选路、重试，client 仅用于下载附件
+        self.endpoints = endpoints
+        # 优先使用共享客户端，避免每条消息都重新建立连接池
+        self._owns_clients = client is None
+        if client is None:
+            self.httpx_client = httpx.AsyncClient()
+            self.openai_client = AsyncOpenAI(
+                base_url=config.base_url,
+                api_key=config.api_key
+            )
+        else:
+            self.httpx_client = client.httpx_client
+            self.openai_client = client.openai_client
 
     @staticmethod
     def get_streaming_indicator() -> str:
         return f"{streaming_indicator_list[int(dt.now().timestamp() * 2) % len(streaming_indicator_list)]} "
 
     async def process_attachments(self, attachments: List[dict]) -> tuple:
-        """处理附件，返回（文本内容列表，图片内容列表）"""
+        """并发处理附件，返回（文本内容列表，图片内容列表）
+
+        下载数受信号量限制，单个附件与整次请求都有字节上限；
+        超出 max_images 的图片在下载前就被丢弃。
+        """
+        text_atts = [att for att in attachments if att['content_type'].startswith('text')]
+        image_atts = [att for att in attachments if att['content_type'].startswith('image')]
+        image_atts = image_atts[:self.config.max_images]
+
+        semaphore = asyncio.Semaphore(self.config.attachment_concurrency)
+        budget = ByteBudget(self.config.max_request_attachment_bytes)
+        max_bytes = self.config.max_attachment_bytes
+
+        async def load_text(att):
+            key = attachment_cache_key(att)
+            if cached := await attachment_cache.get(key, self.config.max_text):
+                return cached.payload[:self.config.max_text]
+            async with semaphore:
+                with ATTACHMENT_FETCH_SECONDS.time(kind="text"):
+                    text = await fetch_text(self.httpx_client, att, self.config.max_text, max_bytes, budget)
+            await attachment_cache.put(key, CachedAttachment(
+                kind="text", digest=content_digest(text.encode('utf-8')), payload=text, limit=self.config.max_text,
+            ))
+            return text
+
+        async def load_image(att):
+            # 缓存的是缩放、重新编码后的结果，处理参数不同的模型分开缓存
+            tag = self.config.image_settings.cache_tag
+            key = f"{attachment_cache_key(att)}|{tag}"
+            if cached := await attachment_cache.get(key, variant=tag):
+                return cached.payload
+            async with semaphore:
+                with ATTACHMENT_FETCH_SECONDS.time(kind="image"):
+                    body = await fetch_bytes(self.httpx_client, att, max_bytes, budget)
+            payload = await build_image_payload(body, att['content_type'], self.config.image_settings)
+            await attachment_cache.put(key, CachedAttachment(
+                kind="image", digest=content_digest(body), payload=payload, variant=tag,
+            ))
+            return payload
+
+        results = await asyncio.gather(
+            *(load_text(att) for att in text_atts),
+            *(load_image(att) for att in image_atts),
+            return_exceptions=True,
+        )
+
         texts = []
         images = []
-        
-        for att in attachments:
-            if att['content_type'].startswith('text'):
-                resp = await self.httpx_client.get(att['url'])
-                texts.append(resp.text)
-            elif att['content_type'].startswith('image'):
-                resp = await self.httpx_client.get(att['url'])
-                b64 = b64encode(resp.content).decode('utf-8')
-                images.append({
-                    "type": "image_url",
-                    "image_url": {"url": f"data:{att['content_type']};base64,{b64}"}
-                })
-        
+        for att, result in zip(text_atts + image_atts, results):
+            if isinstance(result, BaseException):
+                ATTACHMENTS_SKIPPED.inc(reason=type(result).__name__)
+                log_skipped(att, result)
+            elif isinstance(result, str):
+                texts.append(result)
+            else:
+                images.append(result)
+
         return texts, images
 
+    async def build_node(self, msg: dict) -> MessageNode:
+        """下载并处理附件，生成可缓存的消息节点"""
+        texts, images = await self.process_attachments(msg.get('attachments', []))
+        text = "\n".join(filter(None, (msg.get('content', ''), *texts)))
+        return MessageNode(
+            text=text[:self.config.max_text],
+            images=images[:self.config.max_images],
+            role=msg.get('role', 'user'),
+            user_id=msg.get('user_id'),
+            parent_msg_id=msg.get('parent_msg_id'),
+            timestamp=msg.get('timestamp'),
+        )
+
     async def build_message_chain(
         self, 
-        initial_message: dict,
-        get_parent_message: callable
+        initial_node: MessageNode,
+        get_parent_node: callable
     ) -> List[dict]:
-        """构建消息链"""
-        messages = []
-        current_msg = initial_message
-        accept_images = any(x in self.config.model.lower() for x in VISION_MODEL_TAGS)
-        accept_usernames = 'openai' in self.config.provider.lower()  # 示例逻辑
+        """构建消息链，父节点由 get_parent_node 提供（优先命中节点缓存）
+
+        超出 token 预算（上下文窗口 - max_tokens）时从最早的消息开始丢弃，
+        最新一条消息总是保留。
+        """
+        entries = []  # (消息, token 数)，由新到旧
+        current_node = initial_node
+        accept_images = self.config.accept_images
+        accept_usernames = self.config.accept_usernames
+        tokenizer = get_tokenizer(self.config.model, self.config.tokenizer)
         
-        while current_msg and len(messages) < self.config.max_messages:
-            # 处理附件
-            texts, images = await self.process_attachments(current_msg.get('attachments', []))
-            
+        while current_node and len(entries) < self.config.max_messages:
             # 构建消息内容
             content = []
-            if text_content := current_msg.get('content', ''):
-                content.append({"type": "text", "text": text_content[:self.config.max_text]})
+            if current_node.text:
+                content.append({"type": "text", "text": current_node.text[:self.config.max_text]})
             
-            if accept_images:
-                content.extend(images[:self.config.max_images])
+            images = current_node.images[:self.config.max_images] if accept_images else []
+            content.extend(images)
             
             # 构建消息字典
             message = {
-                "role": current_msg.get('role', 'user'),
+                "role": current_node.role,
                 "content": content
             }
             
-            if accept_usernames and (user_id := current_msg.get('user_id')):
-                message["name"] = str(user_id)
+            if accept_usernames and current_node.user_id:
+                message["name"] = str(current_node.user_id)
             
-            messages.append(message)
+            entries.append((message, node_tokens(current_node, tokenizer, self.config.max_text, len(images))))
             
             # 获取上一条消息
-            if parent_id := current_msg.get('parent_msg_id'):
-                current_msg = await get_parent_message(parent_id)
+            if current_node.parent_msg_id:
+                current_node = await get_parent_node(current_node.parent_msg_id)
             else:
-                current_msg = None
+                current_node = None
         
         # 添加系统提示
+        system_message = None
+        used_tokens = 0
         if self.config.system_prompt:
             system_content = [self.config.system_prompt]
             if accept_usernames:
-                system_content.append(f"用户ID: <@{initial_message['user_id']}>")
+                system_content.append(f"用户ID: <@{initial_node.user_id}>")
             
-            messages.append({
+            system_message = {
                 "role": "system",
                 "content": "\n".join(system_content)
-            })
+            }
+            used_tokens = MESSAGE_OVERHEAD_TOKENS + tokenizer.count(system_message["content"])
+
+        # 按 token 预算从最早的消息开始裁剪
+        budget = self.config.context_tokens - (self.config.extra_api_parameters.get("max_tokens") or 0)
+        kept = 0
+        for _, tokens in entries:
+            if kept and used_tokens + tokens > budget:
+                break
+            used_tokens += tokens
+            kept += 1
+        trimmed = len(entries) - kept
+        if trimmed:
+            logging.info(f"上下文超出 token 预算，丢弃最早的 {trimmed} 条消息（保留 {kept} 条，约 {used_tokens}/{budget} tokens）")
+        elif used_tokens > budget:
+            logging.warning(f"最新消息已超出 token 预算（约 {used_tokens}/{budget} tokens）")
+        record_chain_budget(self.config.provider, used_tokens, trimmed)
+
+        messages = [message for message, _ in entries[:kept]]
+        if system_message:
+            messages.append(system_message)
         
         return messages[::-1]  # 反转顺序为历史优先
 
@@ -121,22 +241,28 @@ class AIGenerator:
         messages: List[dict]
     ) -> AsyncGenerator[str, None]:
         """流式生成AI响应"""
-        async for chunk in await self.openai_client.chat.completions.create(
+        if self.endpoints is not None:
+            async with contextlib.aclosing(self.endpoints.stream(messages, self.config.extra_api_parameters)) as stream:
+                async for content in stream:
+                    yield content
+            return
+        async with await self.openai_client.chat.completions.create(
             model=self.config.model,
             messages=messages,
             stream=True,
             **self.config.extra_api_parameters
-        ):
-            if content := chunk.choices[0].delta.content:
-                yield content
+        ) as stream:
+            async for chunk in stream:
+                if content := chunk.choices[0].delta.content:
+                    yield content
 
     async def generate_full_response(
         self,
-        initial_message: dict,
-        get_parent_message: callable
+        initial_node: MessageNode,
+        get_parent_node: callable
     ) -> str:
         """完整生成响应（非流式）"""
-        messages = await self.build_message_chain(initial_message, get_parent_message)
+        messages = await self.build_message_chain(initial_node, get_parent_node)
         response = await self.openai_client.chat.completions.create(
             model=self.config.model,
             messages=messages,
@@ -145,12 +271,45 @@ class AIGenerator:
         return response.choices[0].message.content
 
     async def close(self):
-        """清理资源"""
+        """清理资源（共享客户端由 clients.close_all_clients 统一关闭）"""
+        if not self._owns_clients:
+            return
         await self.httpx_client.aclose()
         await self.openai_client.close()
 
-msg_nodes = {}
-MAX_MESSAGE_NODES = 100
+MAX_MESSAGE_NODES = DEFAULT_MAX_NODES
+msg_nodes = MessageNodeCache(MAX_MESSAGE_NODES)
+
+ATTACHMENT_FETCH_SECONDS = histogram("llmcord_attachment_fetch_seconds", "附件下载耗时", ["kind"])
+ATTACHMENTS_SKIPPED = counter("llmcord_attachments_skipped", "下载或处理失败而跳过的附件数", ["reason"])
+CHAIN_BUILD_SECONDS = histogram("llmcord_chain_build_seconds", "构建消息链的耗时", ["provider"])
+CHAIN_MESSAGES = histogram("llmcord_chain_messages", "发送给模型的消息条数（含系统提示）", ["provider"], buckets=COUNT_BUCKETS)
+QUEUE_REJECTED = counter("llmcord_queue_rejected", "生成队列已满而被拒绝的请求数", ["provider"])
+GENERATION_ERRORS = counter("llmcord_generation_errors", "回复生成失败次数", ["provider"])
+
+
+def _collect_cache_lookups():
+    attachment_stats = attachment_cache.get_stats()
+    return [
+        ({"cache": "message_nodes", "result": "hit"}, msg_nodes.hits),
+        ({"cache": "message_nodes", "result": "miss"}, msg_nodes.misses),
+        ({"cache": "attachments", "result": "hit"}, attachment_stats["hits"]),
+        ({"cache": "attachments", "result": "disk_hit"}, attachment_stats["disk_hits"]),
+        ({"cache": "attachments", "result": "miss"}, attachment_stats["misses"]),
+        ({"cache": "responses", "result": "hit"}, response_cache.hits),
+        ({"cache": "responses", "result": "miss"}, response_cache.misses),
+    ]
+
+
+def _collect_cache_bytes():
+    return [
+        ({"cache": "message_nodes"}, msg_nodes.total_bytes),
+        ({"cache": "attachments"}, attachment_cache.get_stats()["bytes"]),
+    ]
+
+
+register_collector("llmcord_cache_lookups", "各缓存的查找次数，按命中/未命中区分", "counter", _collect_cache_lookups)
+register_collector("llmcord_cache_bytes", "各缓存当前占用的估算字节数", "gauge", _collect_cache_bytes)
 
 def get_msg_nodes():
     """获取消息节点"""
@@ -158,151 +317,380 @@ def get_msg_nodes():
 
 def set_msg_nodes(nodes):
     """设置消息节点"""
-    global msg_nodes
-    msg_nodes.update(nodes)
+    msg_nodes.update({
+        msg_id: node for msg_id, node in nodes.items() if isinstance(node, MessageNode)
+    })
 
+def message_to_dict(msg: discord.Message, discord_client: discord.Client) -> dict:
+    """将 Discord 消息转换为 build_node 使用的字典"""
+    is_bot = msg.author == discord_client.user
+    content = msg.content
+    if is_bot and not content and msg.embeds:
+        # 机器人的 Embed 回复正文在 description 中
+        content = msg.embeds[0].description or ""
+    return {
+        "content": content.removeprefix(discord_client.user.mention).strip(),
+        "attachments": [
+            {"id": att.id, "url": att.url, "content_type": att.content_type or "", "size": att.size}
+            for att in msg.attachments
+        ],
+        "role": "assistant" if is_bot else "user",
+        "user_id": msg.author.id,
+        "parent_msg_id": msg.reference.message_id if msg.reference else None,
+        "timestamp": msg.created_at.isoformat(),
+    }
 
-@menu_item(
-    matches=["!对话", "!聊天", "!chat", "!talk", "!lt", "!c", "!t", "!"],
-    title="聊天",
-    description="与AI聊天",
-)
-async def handler(ctx,discord_client,cfg,**kwargs):
-    # 初始化配置
-    new_msg = ctx
+def remember_reply(msg: discord.Message, text: str, parent_msg_id: Optional[int]):
+    """缓存机器人自己发出的回复，后续回复链无需再从 API 拉取"""
+    msg_nodes.put(msg.id, MessageNode(
+        text=text,
+        role="assistant",
+        user_id=msg.author.id,
+        parent_msg_id=parent_msg_id,
+        timestamp=msg.created_at.isoformat(),
+    ))
+
+
+def build_ai_config(cfg) -> AIConfig:
+    """由配置构建 AIConfig（每次加载配置时计算一次）"""
     provider, model = cfg["model"].split("/", 1)
-    ai_config = AIConfig(
+    return AIConfig(
         provider=provider,
         model=model,
         base_url=cfg["providers"][provider]["base_url"],
-        api_key=cfg["providers"][provider].get("api_key", "sk-no-key-required"),
+        api_key=cfg["providers"][provider].get("api_key") or "sk-no-key-required",
         system_prompt=cfg["system_prompt"],
         max_text=cfg["max_text"],
         max_images=cfg["max_images"],
         max_messages=cfg["max_messages"],
-        extra_api_parameters=cfg["extra_api_parameters"],
+        extra_api_parameters=thaw(cfg["extra_api_parameters"] or {}),
+        accept_images=any(x in model.lower() for x in VISION_MODEL_TAGS),
+        accept_usernames='openai' in provider.lower(),  # 示例逻辑
+        max_attachment_bytes=cfg.get("max_attachment_bytes", DEFAULT_MAX_ATTACHMENT_BYTES),
+        max_request_attachment_bytes=cfg.get("max_request_attachment_bytes", DEFAULT_MAX_REQUEST_ATTACHMENT_BYTES),
+        attachment_concurrency=cfg.get("attachment_concurrency", DEFAULT_ATTACHMENT_CONCURRENCY),
+        context_tokens=get_context_tokens(cfg, provider, model),
+        tokenizer=(cfg.get("context_window") or {}).get("tokenizer", "auto"),
+        image_settings=get_image_settings(cfg, provider, model),
     )
-    ai_generator = AIGenerator(ai_config)
 
-    # 定义父消息获取器
-    async def get_parent_message(message_id: int) -> Optional[dict]:
-        try:
-            parent_msg = await new_msg.channel.fetch_message(message_id)
-            return {
-                "content": parent_msg.content,
-                "attachments": [
-                    {"url": att.url, "content_type": att.content_type}
-                    for att in parent_msg.attachments
-                ],
-                "role": (
-                    "assistant" if parent_msg.author == discord_client.user else "user"
-                ),
-                "user_id": parent_msg.author.id,
-                "parent_msg_id": (
-                    parent_msg.reference.message_id if parent_msg.reference else None
-                ),
-            }
-        except Exception as e:
-            logging.error(f"获取父消息失败: {str(e)}")
-            return None
+def build_llm_settings(cfg) -> tuple:
+    """返回 (AIConfig, 共享客户端, 端点池)"""
+    return build_ai_config(cfg), get_client_for_config(cfg), build_endpoint_pool(cfg)
+
+register_derived("llm", build_llm_settings)
+
+
+def apply_cache_settings(cfg) -> None:
+    """按新配置调整进程级缓存与生成调度器，每个快照生效后执行一次"""
+    msg_nodes.configure(
+        max_entries=cfg.get("max_message_nodes", MAX_MESSAGE_NODES),
+        max_bytes=cfg.get("max_message_node_bytes", DEFAULT_MAX_BYTES),
+    )
+    cache_cfg = cfg.get("attachment_cache") or {}
+    attachment_cache.configure(
+        max_bytes=cache_cfg.get("max_bytes", DEFAULT_MEMORY_BYTES),
+        disk_path=cache_cfg.get("disk_path"),
+        max_disk_bytes=cache_cfg.get("max_disk_bytes", DEFAULT_DISK_BYTES),
+    )
+    response_cache.configure(cfg.get("response_cache"))
+    configure_schedulers(cfg)
+
+register_config_applier("caches", apply_cache_settings)
+
+
+def retire_stale_clients(cfg) -> None:
+    """新快照生效后，退役不再被当前模型及其端点使用的共享客户端"""
+    _, provider_client, endpoint_pool = cfg.derived["llm"]
+    retire_unused_clients([provider_client, *(endpoint.client for endpoint in endpoint_pool.endpoints)])
+
+register_config_applier("clients", retire_stale_clients)
+
+
+@menu_item(
+    matches=["!对话", "!聊天", "!chat", "!talk", "!lt", "!c", "!t", "!"],
+    title="聊天",
+    description="与AI聊天",
+)
+async def handler(ctx,discord_client,cfg,**kwargs):
+    # 初始化配置：优先使用配置快照中预先构建好的设置
+    new_msg = ctx
+    llm_settings = getattr(cfg, "derived", {}).get("llm") or build_llm_settings(cfg)
+    ai_config, provider_client, endpoint_pool = llm_settings
+    ai_generator = AIGenerator(ai_config, provider_client, endpoint_pool)
+
+    # 父消息解析器：节点缓存 → 网关引用 → 客户端缓存 → 批量历史 → 单条获取，同一消息只解析一次
+    chain_resolver = ChainResolver(
+        new_msg.channel,
+        discord_client,
+        msg_nodes,
+        lambda msg: ai_generator.build_node(message_to_dict(msg, discord_client)),
+        max_depth=ai_config.max_messages,
+        history_limit=cfg.get("chain_history_limit", DEFAULT_HISTORY_LIMIT),
+    )
+    chain_resolver.seed(new_msg)
+    get_parent_message = chain_resolver.get
 
     # 检查新消息发送者是否与父消息的发送者一致
     if new_msg.reference and new_msg.reference.message_id:
-        parent_msg = await get_parent_message((await get_parent_message(new_msg.reference.message_id))["parent_msg_id"])
-        if parent_msg and parent_msg["user_id"] != new_msg.author.id:
-            await new_msg.reply(f'🔒<@{new_msg.author.id}>该对话不属于你,而属于<@{parent_msg["user_id"]}>')
+        reply_node = await get_parent_message(new_msg.reference.message_id)
+        parent_msg = None
+        if reply_node and reply_node.parent_msg_id:
+            parent_msg = await get_parent_message(reply_node.parent_msg_id)
+            # 长回复会分成多页，上一页仍是机器人的消息时继续向上找到提问者
+            for _ in range(ai_config.max_messages):
+                if not (parent_msg and parent_msg.role == "assistant" and parent_msg.parent_msg_id):
+                    break
+                parent_msg = await get_parent_message(parent_msg.parent_msg_id)
+        if parent_msg and parent_msg.user_id != new_msg.author.id:
+            chain_resolver.close()
+            await new_msg.reply(f'🔒<@{new_msg.author.id}>该对话不属于你,而属于<@{parent_msg.user_id}>')
             return
 
-    # 构建初始消息
-    initial_message = {
-        "content": new_msg.content.removeprefix(discord_client.user.mention).strip(),
-        "attachments": [
-            {"url": att.url, "content_type": att.content_type}
-            for att in new_msg.attachments
-        ],
-        "role": "user",
-        "user_id": new_msg.author.id,
-        "parent_msg_id": new_msg.reference.message_id if new_msg.reference else None,
-        "timestamp": new_msg.created_at.isoformat(),
-    }
-
-    # 生成响应
-    response_msgs = []
+    # 生成响应（登记后可被删除 / 编辑 / 新提问 / 停止命令取消）
+    cancel_cfg = cfg.get("generation_cancel") or {}
+    if cancel_cfg.get("supersede", True):
+        generation_registry.cancel_user(new_msg.author.id, new_msg.channel.id, "superseded")
+    generation = generation_registry.register(new_msg.id, new_msg.author.id, new_msg.channel.id, asyncio.current_task())
+    use_plain_responses = cfg["use_plain_responses"]
+    edit_scheduler = None
+    queue_notice = None
+    assembler = None
+    page_msg = None  # Embed 模式下正在流式编辑的消息
+    reply_to = new_msg  # 下一条消息回复的对象，续页回复上一页
     # 修改后的响应处理部分
     try:
-        # 构建消息链
-        messages = await ai_generator.build_message_chain(initial_message, get_parent_message)
-        
-        # 保持原始响应分片逻辑
-        use_plain_responses = cfg["use_plain_responses"]
-        max_length = 2000 if use_plain_responses else 4096
-        streaming_indicator = AIGenerator.get_streaming_indicator()
-        
-        # 流式生成响应
-        buffer = ""
-        last_send_time = dt.now()
-        reply_to = new_msg
-        
-        async for chunk in ai_generator.generate_response(messages):
-            buffer += chunk
-            
-            # 处理纯文本模式
-            if use_plain_responses:
-                if len(buffer) >= max_length:
-                    await reply_to.reply(buffer[:max_length], suppress_embeds=True)
-                    buffer = buffer[max_length:]
-                    reply_to = response_msgs[-1] if response_msgs else new_msg
-            # 处理Embed模式
-            else:
-                current_time = dt.now()
-                time_diff = (current_time - last_send_time).total_seconds()
-                
-                # 满足以下任一条件时发送更新：
-                # 1. 缓冲区达到最大长度
-                # 2. 超过1秒未更新
-                # 3. 收到完整句子（以句号结尾）
-                if len(buffer) >= max_length or time_diff > 1 or chunk.endswith('。'):
-                    # 创建或更新Embed
-                    if not response_msgs:
-                        embed = discord.Embed(
-                            description=f"{buffer}{streaming_indicator}",
-                            color=discord.Color.orange()
-                        )
-                        sent_msg = await reply_to.reply(embed=embed)
-                        response_msgs.append(sent_msg)
-                    else:
-                        embed = response_msgs[-1].embeds[0]
-                        embed.description = f"{buffer}{streaming_indicator}"
-                        await response_msgs[-1].edit(embed=embed)
-                    
-                    last_send_time = current_time
-
-        # 发送最终结果
-        if buffer:
-            if use_plain_responses:
-                while buffer:
-                    chunk = buffer[:2000]
-                    await reply_to.reply(chunk, suppress_embeds=True)
-                    buffer = buffer[2000:]
-            else:
+        try:
+            # 构建初始节点并写入缓存
+            initial_node = await ai_generator.build_node(message_to_dict(new_msg, discord_client))
+            msg_nodes.put(new_msg.id, initial_node)
+
+            # 构建消息链
+            with CHAIN_BUILD_SECONDS.time(provider=ai_config.provider):
+                messages = await ai_generator.build_message_chain(initial_node, get_parent_message)
+            # 链已构建完成，超出 max_messages 的预取不再需要
+            chain_resolver.close()
+            CHAIN_MESSAGES.observe(len(messages), provider=ai_config.provider)
+
+            # 分页：纯文本每条 2000 字，Embed 每条 4096 字（留出流式指示符的位置）
+            streaming_indicator = AIGenerator.get_streaming_indicator()
+            max_length = 2000 if use_plain_responses else 4096 - len(streaming_indicator)
+            assembler = StreamAssembler(max_length)
+
+            # Embed 模式下由独立任务发布编辑，读取 token 不再等待 Discord
+            async def publish_embed(text: str, final: bool):
+                nonlocal page_msg
                 embed = discord.Embed(
-                    description=buffer,
-                    color=discord.Color.green()
+                    description=text if final else f"{text}{streaming_indicator}",
+                    color=discord.Color.green() if final else discord.Color.orange()
                 )
-                if response_msgs:
-                    await response_msgs[-1].edit(embed=embed)
+                if page_msg is not None:
+                    await page_msg.edit(embed=embed)
+                else:
+                    page_msg = await reply_to.reply(embed=embed)
+                    generation_registry.add_response(generation, page_msg.id)
+
+            def start_edit_scheduler() -> EditScheduler:
+                return EditScheduler(
+                    new_msg.channel.id,
+                    publish_embed,
+                    interval=cfg.get("edit_interval", DEFAULT_EDIT_INTERVAL),
+                    channel_interval=cfg.get("channel_edit_interval", DEFAULT_CHANNEL_EDIT_INTERVAL),
+                ).start()
+
+            async def send_page(page: str, last: bool):
+                """发出写满的一页：纯文本直接回复；Embed 模式定稿当前消息，之后的内容写入续页"""
+                nonlocal page_msg, reply_to, edit_scheduler
+                if use_plain_responses:
+                    sent_msg = await reply_to.reply(page, suppress_embeds=True)
+                    generation_registry.add_response(generation, sent_msg.id)
+                else:
+                    await edit_scheduler.finish(page)
+                    sent_msg, page_msg = page_msg, None
+                    if not last:
+                        edit_scheduler = start_edit_scheduler()
+                remember_reply(sent_msg, page, reply_to.id)
+                reply_to = sent_msg
+
+            # 只在真正编辑时才拼接当前页
+            def visible_text() -> str:
+                return assembler.current
+
+            # 排队提示：进入队列时发送，位置变化时编辑，开始生成后删除
+            async def report_position(position: int):
+                nonlocal queue_notice
+                text = f"⏳ 排队中，当前第 {position} 位"
+                if queue_notice is None:
+                    queue_notice = await new_msg.reply(text, silent=True)
+                else:
+                    await queue_notice.edit(content=text)
+
+            # 回复缓存：命中时直接回放，不占用生成名额
+            response_source = None
+            cache_hit = False
+            if response_cache.enabled and is_deterministic(ai_config.extra_api_parameters):
+                cache_key = response_cache_key(f"{ai_config.provider}/{ai_config.model}", messages, ai_config.extra_api_parameters)
+                if (cached_text := await response_cache.get(cache_key)) is not None:
+                    response_source = replay_response(cached_text)
+                    cache_hit = True
                 else:
-                    await new_msg.reply(embed=embed)
+                    response_source = record_response(ai_generator.generate_response(messages), response_cache, cache_key)
+
+            queue_cfg = cfg.get("generation_queue") or {}
+            scheduler = get_generation_scheduler(ai_config.provider)
+            try:
+                generation_slot = contextlib.nullcontext() if cache_hit else scheduler.slot(
+                    new_msg.author.id,
+                    report_position,
+                    update_interval=queue_cfg.get("position_update_interval", DEFAULT_POSITION_UPDATE_INTERVAL),
+                )
+                async with generation_slot:
+                    if queue_notice is not None:
+                        with contextlib.suppress(Exception):
+                            await queue_notice.delete()
+                        queue_notice = None
+
+                    if not use_plain_responses:
+                        edit_scheduler = start_edit_scheduler()
+
+                    # 流式生成响应；取消时 aclosing 立即关闭上游连接
+                    try:
+                        async with contextlib.aclosing(response_source or ai_generator.generate_response(messages)) as stream:
+                            async for chunk in stream:
+                                # 写满的页在自然边界处换页，两种模式共用
+                                for page in assembler.feed(chunk):
+                                    await send_page(page, last=False)
+                                if not use_plain_responses:
+                                    edit_scheduler.update(visible_text)
+                    except BaseException:
+                        # 出错时也要把已生成的内容刷新出去（被取消时由 finish_stopped 收尾）
+                        if not use_plain_responses and not generation.cancelled:
+                            with contextlib.suppress(Exception):
+                                await edit_scheduler.finish(final=False)
+                        raise
+
+                    # 发送最终结果
+                    pages = assembler.finish()
+                    for index, page in enumerate(pages):
+                        await send_page(page, last=index == len(pages) - 1)
+                    if not pages and not use_plain_responses:
+                        await edit_scheduler.finish(final=False)
+            except UserQueueFull as e:
+                QUEUE_REJECTED.inc(provider=ai_config.provider)
+                logging.info(f"用户 {new_msg.author.id} 排队请求已达上限 {e.limit}，拒绝新请求")
+                await new_msg.reply(f"⏳ 你已有 {e.limit} 个请求在排队，请等待之前的回复完成后再试")
+            except QueueFull as e:
+                QUEUE_REJECTED.inc(provider=ai_config.provider)
+                logging.info(f"生成队列已满，拒绝用户 {new_msg.author.id} 的请求")
+                await new_msg.reply(f"⏳ 当前繁忙，排队已满（你将是第 {e.position} 位），请稍后再试")
+
+        except Exception as e:
+            GENERATION_ERRORS.inc(provider=ai_config.provider)
+            logging.error(f"生成失败: {str(e)}")
+            error_embed = discord.Embed(
+                title="⚠️ 生成错误",
+                description="处理请求时发生错误，请稍后再试",
+                color=discord.Color.red()
+            )
+            await new_msg.reply(embed=error_embed)
+    except asyncio.CancelledError:
+        if not generation.cancelled:
+            raise
+        # 由取消登记表发起的取消：吞掉取消并把回复标记为已停止
+        asyncio.current_task().uncancel()
+        if edit_scheduler is not None:
+            edit_scheduler.cancel()
+        if queue_notice is not None:
+            with contextlib.suppress(Exception):
+                await queue_notice.delete()
+        text = assembler.current if assembler is not None else ""
+        await finish_stopped(generation, new_msg, reply_to, page_msg, text, use_plain_responses)
+    finally:
+        chain_resolver.close()
+        generation_registry.unregister(generation)
+
+
+async def finish_stopped(
+    generation: Generation,
+    new_msg: discord.Message,
+    reply_to: discord.Message,
+    page_msg: Optional[discord.Message],
+    text: str,
+    use_plain_responses: bool,
+):
+    """生成被取消后收尾：保留当前页已生成的内容并标记为已停止
+
+    page_msg 为 Embed 模式下正在编辑的消息，reply_to 为当前页应回复的消息。
+    """
+    reason = STOP_REASONS.get(generation.reason, generation.reason)
+    try:
+        if use_plain_responses:
+            # 回复已被删除，或提示已被删除且还没有回复时，无处可回
+            if generation.reason == "response_deleted" or (generation.reason == "deleted" and reply_to is new_msg):
+                return
+            sent_msg = await reply_to.reply(f"{text[:1950]}\n⏹️ {reason}".strip(), suppress_embeds=True)
+            if text:
+                remember_reply(sent_msg, text, reply_to.id)
+            return
 
+        embed = discord.Embed(description=text or "（未生成内容）", color=discord.Color.light_grey())
+        embed.set_footer(text=f"⏹️ 已停止：{reason}")
+        if generation.reason == "response_deleted":
+            return
+        if page_msg is not None:
+            await page_msg.edit(embed=embed)
+            target = page_msg
+        elif (generation.reason == "deleted" and reply_to is new_msg) or not text:
+            return
+        else:
+            target = await reply_to.reply(embed=embed)
+        if text:
+            remember_reply(target, text, reply_to.id)
     except Exception as e:
-        logging.error(f"生成失败: {str(e)}")
-        error_embed = discord.Embed(
-            title="⚠️ 生成错误",
-            description="处理请求时发生错误，请稍后再试",
-            color=discord.Color.red()
-        )
-        await new_msg.reply(embed=error_embed)
-    # 保持原始缓存清理逻辑
-    if len(msg_nodes) > MAX_MESSAGE_NODES:
-        for msg_id in list(msg_nodes.keys())[: len(msg_nodes) - MAX_MESSAGE_NODES]:
-            del msg_nodes[msg_id]
\ No newline at end of file
+        logging.warning(f"更新已停止的回复失败: {str(e)}")
+
+
+def handle_message_delete(message_id: int, cfg):
+    """消息被删除：丢弃缓存节点，并取消以它为提示或回复的生成"""
+    msg_nodes.pop(message_id)
+    if not (cfg.get("generation_cancel") or {}).get("on_delete", True):
+        return
+    generation = generation_registry.get(message_id)
+    if generation is not None:
+        generation.cancel("deleted" if message_id == generation.prompt_id else "response_deleted")
+
+
+def handle_message_edit(message_id: int, data: dict, bot_user_id: int, cfg):
+    """用户编辑了消息：丢弃过期的缓存节点，并取消以它为提示的生成"""
+    # 只处理正文编辑：链接预览等更新不带 edited_timestamp，机器人自己的流式编辑也跳过
+    if not data.get("edited_timestamp") or int((data.get("author") or {}).get("id", 0)) == bot_user_id:
+        return
+    msg_nodes.pop(message_id)
+    if not (cfg.get("generation_cancel") or {}).get("on_edit", True):
+        return
+    generation = generation_registry.get(message_id)
+    if generation is not None and generation.prompt_id == message_id:
+        generation.cancel("edited")
+
+
+def handle_stop_reaction(message_id: int, user_id: int, emoji: str, cfg):
+    """提问者对提示或回复添加停止反应时取消生成"""
+    if emoji not in (cfg.get("generation_cancel") or {}).get("stop_emojis", DEFAULT_STOP_EMOJIS):
+        return
+    generation = generation_registry.get(message_id)
+    if generation is not None and generation.user_id == user_id:
+        generation.cancel("stopped")
+
+
+@menu_item(
+    matches=["!停止", "!stop"],
+    title="停止回复",
+    description="停止你在本频道进行中的回复（回复某条消息时只停止它；也可对回复添加 ⏹️ 反应）",
+)
+async def stop_generation(ctx, **kwargs):
+    generation = generation_registry.get(ctx.reference.message_id) if ctx.reference else None
+    if generation is not None and generation.user_id == ctx.author.id:
+        stopped = int(generation.cancel("stopped"))
+    else:
+        stopped = generation_registry.cancel_user(ctx.author.id, ctx.channel.id, "stopped")
+    await ctx.reply(f"⏹️ 已停止 {stopped} 个回复" if stopped else "没有进行中的回复", silent=True)
@@ -0,0 +1,135 @@
+import io
+import logging
+from base64 import b64encode
+from dataclasses import dataclass
+from typing import Tuple
+from ..metrics import counter
+from ..offload import run_blocking
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    Image = ImageOps = None
+    PIL_AVAILABLE = False
+
+DEFAULT_MAX_DIMENSION = 2048  # 长边上限（像素），OpenAI 高精度模式也会缩到 2048 以内
+DEFAULT_MAX_IMAGE_BYTES = 1536 * 1024  # 重新编码后的字节预算
+DEFAULT_IMAGE_FORMAT = "jpeg"  # jpeg / webp
+DEFAULT_IMAGE_QUALITY = 85
+MIN_IMAGE_QUALITY = 40
+
+IMAGE_BYTES = counter("llmcord_image_bytes", "图片预处理前后的字节数", ["stage"])
+
+
+@dataclass(frozen=True)
+class ImageSettings:
+    """发给模型前的图片处理参数，enabled 为 False 时只做 base64 编码"""
+    enabled: bool = True
+    max_dimension: int = DEFAULT_MAX_DIMENSION
+    max_bytes: int = DEFAULT_MAX_IMAGE_BYTES
+    format: str = DEFAULT_IMAGE_FORMAT
+    quality: int = DEFAULT_IMAGE_QUALITY
+
+    @property
+    def cache_tag(self) -> str:
+        """附件缓存键后缀：参数不同的模型不共用处理结果"""
+        if not (self.enabled and PIL_AVAILABLE):
+            return "raw"
+        return f"{self.format}:{self.max_dimension}:{self.max_bytes}:{self.quality}"
+
+
+def get_image_settings(cfg, provider: str, model: str) -> ImageSettings:
+    """image_preprocess 配置，models 中可按 provider/model 或 model 覆盖"""
+    image_cfg = cfg.get("image_preprocess") or {}
+    models = image_cfg.get("models") or {}
+    overrides = models.get(f"{provider}/{model}", models.get(model)) or {}
+
+    def option(name, default):
+        return overrides.get(name, image_cfg.get(name, default))
+
+    return ImageSettings(
+        enabled=option("enabled", True),
+        max_dimension=option("max_dimension", DEFAULT_MAX_DIMENSION),
+        max_bytes=option("max_bytes", DEFAULT_MAX_IMAGE_BYTES),
+        format=str(option("format", DEFAULT_IMAGE_FORMAT)).lower(),
+        quality=option("quality", DEFAULT_IMAGE_QUALITY),
+    )
+
+
+def check_image_support(cfg):
+    """启用了图片预处理但未安装 Pillow 时在启动时警告，否则图片会原样发送"""
+    image_cfg = cfg.get("image_preprocess") or {}
+    if image_cfg.get("enabled", True) and not PIL_AVAILABLE:
+        logging.warning("已启用 image_preprocess 但未安装 Pillow，图片将不做缩放直接发送 (pip install Pillow)")
+
+
+def _encode(image, settings: ImageSettings, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if settings.format == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def downscale_image(body: bytes, content_type: str, settings: ImageSettings) -> Tuple[bytes, str]:
+    """解码并缩放到 max_dimension 以内，再按字节预算重新编码（同步，需在线程池中调用）
+
+    原图已满足尺寸与字节预算时原样返回；无法解码（或未安装 Pillow）时也原样返回。
+    """
+    if not (settings.enabled and PIL_AVAILABLE):
+        return body, content_type
+    try:
+        image = Image.open(io.BytesIO(body))
+        width, height = image.size
+        if len(body) <= settings.max_bytes and max(width, height) <= settings.max_dimension:
+            return body, content_type
+        if getattr(image, "is_animated", False):
+            return body, content_type  # 动图重新编码会丢帧，交给模型端处理
+        # JPEG 可在解码时直接降采样，大图解码快得多
+        image.draft("RGB", (settings.max_dimension, settings.max_dimension))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            if settings.format == "webp" and image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+            else:
+                # JPEG 不支持透明通道，铺白底
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.getchannel("A"))
+        image.thumbnail((settings.max_dimension, settings.max_dimension), Image.LANCZOS)
+
+        quality = settings.quality
+        encoded = _encode(image, settings, quality)
+        while len(encoded) > settings.max_bytes:
+            if quality > MIN_IMAGE_QUALITY:
+                quality = max(MIN_IMAGE_QUALITY, quality - 15)
+            elif min(image.size) > 64:
+                image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)), Image.LANCZOS)
+            else:
+                break
+            encoded = _encode(image, settings, quality)
+    except Exception as e:
+        logging.warning(f"图片预处理失败，使用原图: {str(e)}")
+        return body, content_type
+    if len(encoded) >= len(body):
+        return body, content_type
+    return encoded, f"image/{settings.format}"
+
+
+def _image_payload(body: bytes, content_type: str, settings: ImageSettings) -> Tuple[dict, int]:
+    data, data_type = downscale_image(body, content_type, settings)
+    payload = {
+        "type": "image_url",
+        "image_url": {"url": f"data:{data_type};base64,{b64encode(data).decode('utf-8')}"},
+    }
+    return payload, len(data)
+
+
+async def build_image_payload(body: bytes, content_type: str, settings: ImageSettings) -> dict:
+    """在图片线程池中缩放、重新编码并生成 image_url 内容块（Pillow 解码与缩放时会释放 GIL）"""
+    payload, encoded_size = await run_blocking("image_preprocess", _image_payload, body, content_type, settings, executor="image")
+    IMAGE_BYTES.inc(len(body), stage="original")
+    IMAGE_BYTES.inc(encoded_size, stage="encoded")
+    return payload
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterator, Optional, Tuple
+
+# 默认预算：条目数与估算字节数，任一超出即按 LRU 淘汰
+DEFAULT_MAX_NODES = 500
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def estimate_node_size(node) -> int:
+    """粗略估算节点占用字节（文本 + 图片 data URI）"""
+    size = 256
+    if node.text:
+        size += len(node.text) * 2
+    for image in node.images:
+        size += len(image.get("image_url", {}).get("url", ""))
+    return size
+
+
+class MessageNodeCache:
+    """以 Discord 消息 ID 为键的 LRU 节点缓存，受条目数和内存预算约束"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_NODES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._nodes: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        """调整预算，缩小时立即淘汰"""
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        self._evict()
+
+    def get(self, msg_id) -> Optional[object]:
+        node = self._nodes.get(msg_id)
+        if node is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._nodes.move_to_end(msg_id)
+        return node
+
+    def put(self, msg_id, node):
+        if msg_id in self._nodes:
+            self._bytes -= self._sizes.pop(msg_id)
+        size = estimate_node_size(node)
+        self._nodes[msg_id] = node
+        self._nodes.move_to_end(msg_id)
+        self._sizes[msg_id] = size
+        self._bytes += size
+        self._evict()
+
+    def pop(self, msg_id, default=None):
+        if msg_id not in self._nodes:
+            return default
+        self._bytes -= self._sizes.pop(msg_id)
+        return self._nodes.pop(msg_id)
+
+    def _evict(self):
+        while self._nodes and (len(self._nodes) > self.max_entries or self._bytes > self.max_bytes):
+            msg_id, _ = self._nodes.popitem(last=False)
+            self._bytes -= self._sizes.pop(msg_id)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def items(self) -> Iterator[Tuple[Hashable, object]]:
+        return iter(list(self._nodes.items()))
+
+    def update(self, nodes: dict):
+        for msg_id, node in nodes.items():
+            self.put(msg_id, node)
+
+    def clear(self):
+        self._nodes.clear()
+        self._sizes.clear()
+        self._bytes = 0
+
+    def __contains__(self, msg_id) -> bool:
+        return msg_id in self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes)
@@ -0,0 +1,172 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncGenerator, AsyncIterator, List, Optional, Tuple
+from ..offload import run_blocking
+
+DEFAULT_TTL = 3600.0
+DEFAULT_MAX_ENTRIES = 1000
+REPLAY_CHUNK_CHARS = 1000  # 命中后按此长度分段回放，走与上游流式相同的输出路径
+
+
+def _normalize_content(content):
+    """图片 data URI 替换为内容哈希，避免把整张图片放进键的序列化中"""
+    if not isinstance(content, list):
+        return content
+    parts = []
+    for part in content:
+        if part.get("type") == "image_url":
+            url = part["image_url"]["url"]
+            parts.append({"type": "image", "sha256": hashlib.sha256(url.encode()).hexdigest()})
+        else:
+            parts.append(part)
+    return parts
+
+
+def response_cache_key(model: str, messages: List[dict], params: Optional[dict] = None) -> str:
+    """模型 + 规范化消息链 + 请求参数 的稳定哈希"""
+    normalized = {
+        "model": model,
+        "params": params or {},
+        "messages": [{**message, "content": _normalize_content(message.get("content"))} for message in messages],
+    }
+    data = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(params: dict) -> bool:
+    """只有 temperature 为 0 的请求结果才可复用"""
+    return params.get("temperature") == 0
+
+
+class ResponseDiskStore:
+    """SQLite 持久化的回复缓存，过期条目在写入时顺带清理"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, text TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, text FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def put(self, key: str, text: str, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, text, expires_at) VALUES (?, ?, ?)",
+                (key, text, expires_at),
+            )
+            self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """确定性请求的回复缓存：内存 LRU + TTL，可选 SQLite 落盘
+
+    默认关闭，需在配置中设置 response_cache.enabled。
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL):
+        self.enabled = False
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk: Optional[ResponseDiskStore] = None
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, cfg: Optional[dict]):
+        cfg = cfg or {}
+        self.enabled = bool(cfg.get("enabled", False))
+        self.max_entries = cfg.get("max_entries", DEFAULT_MAX_ENTRIES)
+        self.ttl = cfg.get("ttl", DEFAULT_TTL)
+        disk_path = cfg.get("disk_path")
+        if (self.disk.path if self.disk else None) != disk_path:
+            if self.disk:
+                self.disk.close()
+            self.disk = ResponseDiskStore(disk_path) if disk_path else None
+        self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= now:
+            del self._entries[key]
+            entry = None
+        if entry is None and self.disk:
+            try:
+                entry = await run_blocking("response_cache_read", self.disk.get, key, now, executor="io")
+            except sqlite3.Error as e:
+                logging.error(f"读取回复缓存失败: {str(e)}")
+            if entry is not None:
+                self._entries[key] = entry
+                self._evict()
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    async def put(self, key: str, text: str):
+        expires_at = time.time() + self.ttl
+        self._entries[key] = (expires_at, text)
+        self._entries.move_to_end(key)
+        self._evict()
+        if self.disk:
+            try:
+                await run_blocking("response_cache_write", self.disk.put, key, text, expires_at, executor="io")
+            except sqlite3.Error as e:
+                logging.error(f"写入回复缓存失败: {str(e)}")
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+async def replay_response(text: str) -> AsyncGenerator[str, None]:
+    """把缓存的完整回复按段产出，与上游流式输出接口一致"""
+    for start in range(0, len(text), REPLAY_CHUNK_CHARS):
+        yield text[start:start + REPLAY_CHUNK_CHARS]
+        await asyncio.sleep(0)
+
+
+async def record_response(stream: AsyncIterator[str], cache: ResponseCache, key: str) -> AsyncGenerator[str, None]:
+    """透传上游流式输出，完整结束后写入缓存（中途出错不缓存）"""
+    parts = []
+    async with contextlib.aclosing(stream):
+        async for chunk in stream:
+            parts.append(chunk)
+            yield chunk
+    if parts:
+        await cache.put(key, "".join(parts))
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, Optional
+from ..metrics import histogram, register_collector
+
+DEFAULT_MAX_CONCURRENT = 4  # 每个 provider 同时进行的流式生成数
+DEFAULT_MAX_QUEUE = 50  # 每个 provider 最多排队的请求数，超出立即拒绝
+DEFAULT_MAX_PER_USER = 3  # 每个用户最多排队的请求数，0 不限
+DEFAULT_POSITION_UPDATE_INTERVAL = 5.0  # 排队位置通知的最小间隔（秒）
+
+
+class QueueFull(Exception):
+    """排队已满，position 为该请求若能排队时所处的位置"""
+
+    def __init__(self, position: int):
+        super().__init__(f"生成队列已满（第 {position} 位）")
+        self.position = position
+
+
+class UserQueueFull(QueueFull):
+    """该用户排队的请求已达上限，只拒绝该用户，不占用其他用户的排队位置"""
+
+    def __init__(self, position: int, limit: int):
+        super().__init__(position)
+        self.limit = limit
+
+
+class _Ticket:
+    __slots__ = ("user_id", "granted", "position", "active")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.granted: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.position = 0
+        self.active = False
+
+
+class GenerationScheduler:
+    """单个 provider 的生成调度：并发上限 + 按用户轮转的公平队列
+
+    每个用户一条 FIFO 队列，空出名额时按用户轮流放行，
+    同一用户连续提交很多请求也只会占用轮转中的一个位置；
+    每个用户排队的请求数另有上限，刷屏的用户不会占满总队列而挤掉其他用户。
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        max_per_user: int = DEFAULT_MAX_PER_USER,
+        name: str = "",
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.active = 0
+        self.queued = 0
+        self._queues: "OrderedDict[object, Deque[_Ticket]]" = OrderedDict()
+
+    def configure(self, max_concurrent: Optional[int] = None, max_queue: Optional[int] = None, max_per_user: Optional[int] = None):
+        if max_concurrent is not None:
+            self.max_concurrent = max(1, max_concurrent)
+        if max_queue is not None:
+            self.max_queue = max(0, max_queue)
+        if max_per_user is not None:
+            self.max_per_user = max(0, max_per_user)
+        self._grant_next()
+
+    def _enqueue(self, user_id) -> _Ticket:
+        ticket = _Ticket(user_id)
+        if not self._queues and self.active < self.max_concurrent:
+            self._activate(ticket)
+            return ticket
+        queue = self._queues.get(user_id)
+        if self.max_per_user and queue is not None and len(queue) >= self.max_per_user:
+            raise UserQueueFull(self.queued + 1, self.max_per_user)
+        if self.queued >= self.max_queue:
+            raise QueueFull(self.queued + 1)
+        self._queues.setdefault(user_id, deque()).append(ticket)
+        self.queued += 1
+        self._update_positions()
+        return ticket
+
+    def _activate(self, ticket: _Ticket):
+        ticket.active = True
+        ticket.position = 0
+        self.active += 1
+        ticket.granted.set_result(None)
+
+    def _grant_next(self):
+        while self.active < self.max_concurrent and self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            self._activate(ticket)
+        self._update_positions()
+
+    def _update_positions(self):
+        """按轮转顺序计算每个排队请求的位置（从 1 开始）"""
+        queues = list(self._queues.values())
+        position = 0
+        depth = 0
+        while queues:
+            for queue in queues:
+                position += 1
+                queue[depth].position = position
+            depth += 1
+            queues = [queue for queue in queues if len(queue) > depth]
+
+    def _release(self, ticket: _Ticket):
+        if ticket.active:
+            ticket.active = False
+            self.active -= 1
+        else:
+            queue = self._queues.get(ticket.user_id)
+            if queue is None or ticket not in queue:
+                return
+            queue.remove(ticket)
+            self.queued -= 1
+            if not queue:
+                del self._queues[ticket.user_id]
+        self._grant_next()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id,
+        on_position: Optional[Callable[[int], Awaitable[None]]] = None,
+        update_interval: float = DEFAULT_POSITION_UPDATE_INTERVAL,
+    ):
+        """占用一个生成名额；排队时通过 on_position 通知位置变化
+
+        队列已满时立即抛出 QueueFull（该用户排队数达到上限时为 UserQueueFull），不会等待。
+        """
+        ticket = self._enqueue(user_id)
+        queued_at = time.perf_counter()
+        try:
+            reported = None
+            while not ticket.granted.done():
+                if on_position and ticket.position != reported:
+                    reported = ticket.position
+                    try:
+                        await on_position(reported)
+                    except Exception as e:
+                        logging.warning(f"发送排队位置失败: {str(e)}")
+                await asyncio.wait({ticket.granted}, timeout=update_interval if on_position else None)
+            QUEUE_WAIT_SECONDS.observe(time.perf_counter() - queued_at, provider=self.name)
+            yield
+        finally:
+            self._release(ticket)
+
+    def get_stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "users_waiting": len(self._queues),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "max_per_user": self.max_per_user,
+        }
+
+
+# 进程级调度器注册表，每个 provider 一个
+__generation_schedulers__: Dict[str, GenerationScheduler] = {}
+
+
+def get_generation_scheduler(provider: str, cfg: Optional[dict] = None) -> GenerationScheduler:
+    """获取 provider 的调度器，并按配置更新并发与队列上限
+
+    并发上限取 providers.<provider>.max_concurrent，未设置时用 generation_queue.max_concurrent。
+    """
+    scheduler = __generation_schedulers__.get(provider)
+    if scheduler is None:
+        scheduler = __generation_schedulers__[provider] = GenerationScheduler(name=provider)
+    if cfg is not None:
+        queue_cfg = cfg.get("generation_queue") or {}
+        provider_cfg = (cfg.get("providers") or {}).get(provider) or {}
+        scheduler.configure(
+            max_concurrent=provider_cfg.get("max_concurrent", queue_cfg.get("max_concurrent", DEFAULT_MAX_CONCURRENT)),
+            max_queue=queue_cfg.get("max_queue", DEFAULT_MAX_QUEUE),
+            max_per_user=queue_cfg.get("max_per_user", DEFAULT_MAX_PER_USER),
+        )
+    return scheduler
+
+
+def configure_schedulers(cfg):
+    """按新配置更新已创建的调度器以及当前模型 provider 的调度器（配置重载时调用）"""
+    providers = {str(cfg["model"]).split("/", 1)[0], *__generation_schedulers__}
+    for provider in providers:
+        get_generation_scheduler(provider, cfg)
+
+
+def get_scheduler_stats() -> Dict[str, dict]:
+    return {provider: scheduler.get_stats() for provider, scheduler in __generation_schedulers__.items()}
+
+
+QUEUE_WAIT_SECONDS = histogram("llmcord_queue_wait_seconds", "请求在生成队列中等待的时间", ["provider"])
+register_collector(
+    "llmcord_generation_active", "正在进行的流式生成数", "gauge",
+    lambda: [({"provider": p}, s.active) for p, s in __generation_schedulers__.items()],
+)
+register_collector(
+    "llmcord_generation_queue_depth", "生成队列中等待的请求数", "gauge",
+    lambda: [({"provider": p}, s.queued) for p, s in __generation_schedulers__.items()],
+)
@@ -0,0 +1,110 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict
+from ..metrics import counter, histogram
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+
+DEFAULT_CONTEXT_TOKENS = 32768
+IMAGE_TOKENS = 765  # 单张图片的估算 token 数（OpenAI 高精度模式 1024x1024）
+MESSAGE_OVERHEAD_TOKENS = 4  # 每条消息的角色、分隔符开销
+
+
+@dataclass(frozen=True)
+class Tokenizer:
+    """token 计数器，name 用于区分节点上缓存的计数"""
+    name: str
+    count: Callable[[str], int]
+
+
+def heuristic_token_count(text: str) -> int:
+    """不依赖词表的快速估算：ASCII 约 4 字符 1 token，CJK 等宽字符约 1 字 1 token"""
+    if not text:
+        return 0
+    chars = len(text)
+    # 非 ASCII 字符在 UTF-8 中占 2~4 字节，按 3 字节的 CJK 估算其数量
+    wide = min(chars, (len(text.encode("utf-8")) - chars) // 2)
+    return wide + (chars - wide + 3) // 4
+
+
+HEURISTIC_TOKENIZER = Tokenizer("heuristic", heuristic_token_count)
+
+# 自定义分词器：模型名（不含 provider）-> Tokenizer，优先于 tiktoken
+__custom_tokenizers__: Dict[str, Tokenizer] = {}
+__tokenizer_cache__: Dict[tuple, Tokenizer] = {}
+
+
+def register_tokenizer(model: str, tokenizer: Tokenizer):
+    """为指定模型注册分词器（如本地模型的 HuggingFace tokenizer）"""
+    __custom_tokenizers__[model] = tokenizer
+    __tokenizer_cache__.clear()
+
+
+def _tiktoken_tokenizer(model: str) -> Tokenizer:
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("o200k_base")
+    return Tokenizer(f"tiktoken:{encoding.name}", lambda text: len(encoding.encode(text, disallowed_special=())))
+
+
+def get_tokenizer(model: str, mode: str = "auto") -> Tokenizer:
+    """按模型选择分词器：自定义 > tiktoken（auto/tiktoken 且已安装）> 启发式估算"""
+    key = (model, mode)
+    tokenizer = __tokenizer_cache__.get(key)
+    if tokenizer is not None:
+        return tokenizer
+    if model in __custom_tokenizers__:
+        tokenizer = __custom_tokenizers__[model]
+    elif mode in ("auto", "tiktoken") and TIKTOKEN_AVAILABLE:
+        try:
+            tokenizer = _tiktoken_tokenizer(model)
+        except Exception as e:
+            logging.warning(f"加载 tiktoken 失败，改用估算: {str(e)}")
+            tokenizer = HEURISTIC_TOKENIZER
+    else:
+        if mode == "tiktoken":
+            logging.warning("未安装 tiktoken，token 数改用估算")
+        tokenizer = HEURISTIC_TOKENIZER
+    __tokenizer_cache__[key] = tokenizer
+    return tokenizer
+
+
+def get_context_tokens(cfg, provider: str, model: str) -> int:
+    """模型的上下文窗口：context_window.models 中按 provider/model 或 model 查找"""
+    window_cfg = cfg.get("context_window") or {}
+    models = window_cfg.get("models") or {}
+    return models.get(f"{provider}/{model}", models.get(model, window_cfg.get("default", DEFAULT_CONTEXT_TOKENS)))
+
+
+def node_tokens(node, tokenizer: Tokenizer, max_text: int, image_count: int) -> int:
+    """节点的 token 数（文本 + 图片 + 消息开销），按分词器与截断长度缓存在节点上"""
+    counts = getattr(node, "token_counts", None)
+    if counts is None:
+        # 旧存档中的节点没有该字段
+        counts = node.token_counts = {}
+    key = (tokenizer.name, max_text)
+    text_tokens = counts.get(key)
+    if text_tokens is None:
+        text_tokens = counts[key] = tokenizer.count(node.text[:max_text]) if node.text else 0
+    return MESSAGE_OVERHEAD_TOKENS + text_tokens + image_count * IMAGE_TOKENS
+
+
+PROMPT_TOKENS = histogram(
+    "llmcord_prompt_tokens", "裁剪后发送给模型的上下文 token 数（估算）", ["provider"],
+    buckets=(256, 1024, 4096, 8192, 16384, 32768, 65536, 131072),
+)
+TRIMMED_CHAINS = counter("llmcord_context_trimmed_chains", "因超出 token 预算而被裁剪的消息链数", ["provider"])
+TRIMMED_MESSAGES = counter("llmcord_context_trimmed_messages", "因超出 token 预算而丢弃的消息数", ["provider"])
+
+
+def record_chain_budget(provider: str, prompt_tokens: int, trimmed: int):
+    PROMPT_TOKENS.observe(prompt_tokens, provider=provider)
+    if trimmed:
+        TRIMMED_CHAINS.inc(provider=provider)
+        TRIMMED_MESSAGES.inc(trimmed, provider=provider)
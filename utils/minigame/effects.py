@@ -0,0 +1,50 @@
+import heapq
+import itertools
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 全局持续效果到期堆：(到期时间, 序号, 玩家 ID, 效果 ID)
+# 效果被替换或提前移除后，旧条目会在弹出时因到期时间不符而被忽略
+__effect_heap__: List[Tuple[float, int, int, str]] = []
+__effect_seq__ = itertools.count()
+
+
+def schedule_effect(user_id: int, effect_id: str, deadline: float):
+    """登记一个持续效果的到期时间"""
+    heapq.heappush(__effect_heap__, (deadline, next(__effect_seq__), user_id, effect_id))
+
+
+def schedule_player_effects(user_id: int, player):
+    """玩家从存档加载时登记其全部持续效果"""
+    for effect_id, effect in player.effects.items():
+        schedule_effect(user_id, effect_id, effect.deadline)
+
+
+def expire_effects(
+    players: Dict[int, object],
+    now: Optional[float] = None,
+    on_expired: Optional[Callable[[int], None]] = None,
+) -> int:
+    """弹出所有已到期的效果并从玩家身上移除，返回移除数量
+
+    每个到期效果 O(log n)，不会扫描未到期的玩家或效果。
+    """
+    now = time.time() if now is None else now
+    removed = 0
+    while __effect_heap__ and __effect_heap__[0][0] < now:
+        deadline, _, user_id, effect_id = heapq.heappop(__effect_heap__)
+        player = players.get(user_id)
+        if player is None:
+            continue
+        effect = player.effects.get(effect_id)
+        if effect is None or effect.deadline != deadline:
+            continue
+        player.remove_effect(effect_id)
+        removed += 1
+        if on_expired:
+            on_expired(user_id)
+    return removed
+
+
+def pending_effects() -> int:
+    return len(__effect_heap__)
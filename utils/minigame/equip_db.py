@@ -1,59 +1,133 @@
-__weapon_db__ = {
-    "铁剑":{
-        "name":"铁剑",
-        "item_buff":{
-            "atk":3,
-            "def":1,
-            "luck":1,
-        },
-        "fit":"weapon"
-    }
-
-}
-
-__armor_db__ = {
-    "新人冒险家套装":{
-        "name":"新人冒险家套装",
-        "item_buff":{
-            "atk":0,
-            "def":3,
-            "luck":1,
-        },
-        "fit":"armor"
-    }
-}
-
-__item_db__ = {
-    "生命药水":{
-        "name":"生命药水",
-        "item_buff_instant":{
-            "hp":15
-        },
-        "fit":"cost"
-    },
-    "力量药水":{
-        "name":"力量药水",
-        "item_buff_duration":{
-            "atk":15
-        },
-        "duration":300,
-        "fit":"cost"
-    }
-}
-
-def get_equip_info(item_id):
-    """通用获取物品信息"""
-    if item_id in __weapon_db__:
-        return {'type': 'weapon', **__weapon_db__[item_id]}
-    if item_id in __armor_db__:
-        return {'type': 'armor', **__armor_db__[item_id]}
-    return None
-
-def get_weapon_state(db_index):
-    return __weapon_db__.get(db_index)
-
-def get_armor_state(db_index):
-    return __armor_db__.get(db_index)
-
-def get_item_state(db_index):
-    return __item_db__.get(db_index)
\ No newline at end of file
+import logging
+import os
+import sys
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Callable, List, Mapping, Optional, Tuple
+import yaml
+from ..config import register_watched_file
+from ..offload import run_blocking
+
+ITEMS_FILE = os.path.join(os.path.dirname(__file__), "items.yaml")
+EQUIP_SLOTS = ("weapon", "armor")
+_EMPTY_BUFF = MappingProxyType({})
+
+
+@dataclass(frozen=True, slots=True)
+class ItemRecord:
+    """只读物品记录，所有查询直接返回同一个对象"""
+    id: str
+    name: str
+    fit: str  # weapon / armor / cost
+    item_buff: Mapping[str, int] = field(default_factory=lambda: _EMPTY_BUFF)
+    item_buff_instant: Mapping[str, int] = field(default_factory=lambda: _EMPTY_BUFF)
+    item_buff_duration: Mapping[str, int] = field(default_factory=lambda: _EMPTY_BUFF)
+    duration: float = 0
+
+    @property
+    def type(self) -> str:
+        return self.fit if self.fit in EQUIP_SLOTS else "item"
+
+
+@dataclass(frozen=True)
+class ItemCatalog:
+    """物品目录：按 ID 查询，并按装备位置、属性建立二级索引"""
+    by_id: Mapping[str, ItemRecord]
+    by_fit: Mapping[str, Tuple[ItemRecord, ...]]
+    by_stat: Mapping[str, Tuple[ItemRecord, ...]]
+    mtime: float = 0
+
+
+def _buff(data) -> Mapping[str, int]:
+    if not data:
+        return _EMPTY_BUFF
+    return MappingProxyType({sys.intern(str(k)): v for k, v in data.items()})
+
+
+def build_item_catalog(items: dict, mtime: float = 0) -> ItemCatalog:
+    """由 物品ID -> 属性 的字典构建目录"""
+    by_id = {}
+    by_fit = {}
+    by_stat = {}
+    for item_id, data in (items or {}).items():
+        item_id = sys.intern(str(item_id))
+        if "fit" not in data:
+            raise ValueError(f"物品 {item_id} 缺少 fit")
+        record = ItemRecord(
+            id=item_id,
+            name=sys.intern(str(data.get("name", item_id))),
+            fit=sys.intern(str(data["fit"])),
+            item_buff=_buff(data.get("item_buff")),
+            item_buff_instant=_buff(data.get("item_buff_instant")),
+            item_buff_duration=_buff(data.get("item_buff_duration")),
+            duration=data.get("duration", 0),
+        )
+        by_id[item_id] = record
+        by_fit.setdefault(record.fit, []).append(record)
+        for stat in {*record.item_buff, *record.item_buff_instant, *record.item_buff_duration}:
+            by_stat.setdefault(stat, []).append(record)
+    return ItemCatalog(
+        by_id=MappingProxyType(by_id),
+        by_fit=MappingProxyType({fit: tuple(records) for fit, records in by_fit.items()}),
+        by_stat=MappingProxyType({stat: tuple(records) for stat, records in by_stat.items()}),
+        mtime=mtime,
+    )
+
+
+def read_item_catalog(path: str = ITEMS_FILE) -> ItemCatalog:
+    mtime = os.path.getmtime(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return build_item_catalog(yaml.safe_load(f), mtime)
+
+
+__item_catalog__: ItemCatalog = read_item_catalog()
+__catalog_listeners__: List[Callable[[ItemCatalog], None]] = []
+
+
+def get_item_catalog() -> ItemCatalog:
+    return __item_catalog__
+
+
+def add_catalog_listener(listener: Callable[[ItemCatalog], None]):
+    """目录替换后回调（如清空依赖装备属性的缓存）"""
+    __catalog_listeners__.append(listener)
+
+
+def install_item_catalog(catalog: ItemCatalog):
+    """原子替换物品目录"""
+    global __item_catalog__
+    __item_catalog__ = catalog
+    for listener in __catalog_listeners__:
+        listener(catalog)
+
+
+async def reload_item_catalog(path: str = ITEMS_FILE) -> bool:
+    """重新读取物品目录，失败时保留旧目录"""
+    try:
+        catalog = await run_blocking("item_catalog_load", read_item_catalog, path, executor="io")
+    except Exception as e:
+        logging.error(f"重载物品目录失败: {str(e)}")
+        return False
+    install_item_catalog(catalog)
+    logging.info(f"物品目录已重载，共 {len(catalog.by_id)} 件物品")
+    return True
+
+
+register_watched_file(ITEMS_FILE, reload_item_catalog)
+
+
+def get_equip_info(item_id) -> Optional[ItemRecord]:
+    """通用获取物品信息（武器、护甲、消耗品）"""
+    return __item_catalog__.by_id.get(item_id)
+
+def get_weapon_state(db_index) -> Optional[ItemRecord]:
+    item = __item_catalog__.by_id.get(db_index)
+    return item if item is not None and item.fit == "weapon" else None
+
+def get_armor_state(db_index) -> Optional[ItemRecord]:
+    item = __item_catalog__.by_id.get(db_index)
+    return item if item is not None and item.fit == "armor" else None
+
+def get_item_state(db_index) -> Optional[ItemRecord]:
+    item = __item_catalog__.by_id.get(db_index)
+    return item if item is not None and item.fit == "cost" else None
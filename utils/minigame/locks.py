@@ -0,0 +1,52 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional, Union
+from ..metrics import histogram
+
+DEFAULT_LOCK_SHARDS = 256
+
+LOCK_WAIT_SECONDS = histogram("llmcord_game_lock_wait_seconds", "游戏命令等待玩家锁的时间")
+
+
+class PlayerLockTable:
+    """分片的玩家锁表：同一玩家的命令串行执行，不同玩家大多可以并行
+
+    锁的数量固定为 shards，不随玩家数增长；两个玩家落在同一分片时才会互相等待。
+    """
+
+    def __init__(self, shards: int = DEFAULT_LOCK_SHARDS):
+        self._locks = [asyncio.Lock() for _ in range(shards)]
+
+    def lock_for(self, user_id) -> asyncio.Lock:
+        return self._locks[hash(user_id) % len(self._locks)]
+
+
+player_locks = PlayerLockTable()
+
+
+@asynccontextmanager
+async def player_transaction(user_id):
+    """持有玩家锁执行一段读-改-写逻辑"""
+    lock = player_locks.lock_for(user_id)
+    started = time.perf_counter()
+    async with lock:
+        LOCK_WAIT_SECONDS.observe(time.perf_counter() - started)
+        yield
+
+
+async def mutate_and_reply(
+    ctx,
+    user_id,
+    mutation: Callable[[], Union[Optional[str], Awaitable[Optional[str]]]],
+):
+    """在玩家锁内执行修改并得到回复文本，释放锁之后再回复
+
+    回复是网络操作，放在锁外可以避免 Discord 延迟拖慢同一玩家的下一条命令。
+    """
+    async with player_transaction(user_id):
+        reply = mutation()
+        if asyncio.iscoroutine(reply):
+            reply = await reply
+    if reply:
+        return await ctx.reply(reply)
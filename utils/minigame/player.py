@@ -0,0 +1,153 @@
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+# 属性名与字段名的对应（def 是关键字，字段名为 def_）
+STAT_NAMES = ("atk", "def", "hp", "max_hp", "luck")
+_STAT_ATTRS = {name: ("def_" if name == "def" else name) for name in STAT_NAMES}
+
+DEFAULT_WEAPON = "铁剑"
+DEFAULT_ARMOR = "新人冒险家套装"
+
+
+def intern_id(item_id: Optional[str]) -> Optional[str]:
+    """物品 ID 驻留，所有玩家共享同一个字符串对象"""
+    return sys.intern(item_id) if isinstance(item_id, str) else item_id
+
+
+@dataclass(slots=True)
+class StatBlock:
+    """固定字段的属性块，可按旧的键名（atk/def/...）读写"""
+    atk: int = 1
+    def_: int = 1
+    hp: int = 36
+    max_hp: int = 36
+    luck: int = 0
+
+    def __getitem__(self, name: str) -> int:
+        return getattr(self, _STAT_ATTRS[name])
+
+    def __setitem__(self, name: str, value: int):
+        setattr(self, _STAT_ATTRS[name], value)
+
+    def add(self, buff) -> "StatBlock":
+        """就地叠加加成（buff 为 属性名 -> 数值）"""
+        for name, value in buff.items():
+            attr = _STAT_ATTRS[name]
+            setattr(self, attr, getattr(self, attr) + value)
+        return self
+
+    def copy(self) -> "StatBlock":
+        return StatBlock(self.atk, self.def_, self.hp, self.max_hp, self.luck)
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, attr) for name, attr in _STAT_ATTRS.items()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "StatBlock":
+        return cls(**{_STAT_ATTRS[name]: value for name, value in data.items()})
+
+
+@dataclass(slots=True)
+class Effect:
+    """持续效果"""
+    start_time: float
+    duration: float
+    buff: Dict[str, int]
+
+    @property
+    def deadline(self) -> float:
+        return self.start_time + self.duration
+
+    def to_dict(self) -> dict:
+        return {"start_time": self.start_time, "duration": self.duration, "buff": dict(self.buff)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Effect":
+        return cls(data["start_time"], data["duration"], {sys.intern(k): v for k, v in data["buff"].items()})
+
+
+@dataclass(slots=True)
+class PlayerState:
+    """玩家数据，序列化格式与旧版嵌套字典一致"""
+    coin: int = 0
+    npc_attitude: int = 0
+    weapon: Optional[str] = DEFAULT_WEAPON
+    armor: Optional[str] = DEFAULT_ARMOR
+    exp: int = 0
+    stats: StatBlock = field(default_factory=StatBlock)
+    backpack: Dict[str, int] = field(default_factory=dict)
+    effects: Dict[str, Effect] = field(default_factory=dict)
+    special_memory: dict = field(default_factory=dict)
+    extra: Optional[dict] = None  # 旧格式中无法识别的键，原样保留
+    # 最终属性缓存（不序列化），装备、用药、效果到期时失效
+    total: Optional[StatBlock] = field(default=None, repr=False, compare=False)
+
+    def invalidate(self):
+        self.total = None
+
+    def add_effect(self, effect_id: str, effect: Effect):
+        self.effects[intern_id(effect_id)] = effect
+        self.total = None
+
+    def remove_effect(self, effect_id: str):
+        if self.effects.pop(effect_id, None) is not None:
+            self.total = None
+
+    def slot(self, slot_type: str) -> Optional[str]:
+        return self.weapon if slot_type == "weapon" else self.armor if slot_type == "armor" else None
+
+    def set_slot(self, slot_type: str, item_id: Optional[str]):
+        if slot_type == "weapon":
+            self.weapon = intern_id(item_id)
+        elif slot_type == "armor":
+            self.armor = intern_id(item_id)
+        else:
+            raise ValueError(f"未知的装备位置: {slot_type}")
+        self.total = None
+
+    def add_item(self, item_id: str, count: int = 1):
+        item_id = intern_id(item_id)
+        self.backpack[item_id] = self.backpack.get(item_id, 0) + count
+
+    def remove_item(self, item_id: str, count: int = 1) -> bool:
+        """从背包移除物品，数量不足时返回 False"""
+        if self.backpack.get(item_id, 0) < count:
+            return False
+        self.backpack[item_id] -= count
+        if self.backpack[item_id] == 0:
+            del self.backpack[item_id]
+        return True
+
+    def to_dict(self) -> dict:
+        data = {
+            "coin": self.coin,
+            "npc_attitude": self.npc_attitude,
+            "weapon": self.weapon,
+            "armor": self.armor,
+            "backpack": dict(self.backpack),
+            "exp": self.exp,
+            "state": self.stats.to_dict(),
+            "additon": {effect_id: effect.to_dict() for effect_id, effect in self.effects.items()},
+            "special_memory": self.special_memory,
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PlayerState":
+        known = {"coin", "npc_attitude", "weapon", "armor", "backpack", "exp", "state", "additon", "special_memory"}
+        extra = {k: v for k, v in data.items() if k not in known}
+        return cls(
+            coin=data.get("coin", 0),
+            npc_attitude=data.get("npc_attitude", 0),
+            weapon=intern_id(data.get("weapon")),
+            armor=intern_id(data.get("armor")),
+            exp=data.get("exp", 0),
+            stats=StatBlock.from_dict(data["state"]) if "state" in data else StatBlock(),
+            backpack={intern_id(k): v for k, v in (data.get("backpack") or {}).items()},
+            effects={intern_id(k): Effect.from_dict(v) for k, v in (data.get("additon") or {}).items()},
+            special_memory=data.get("special_memory") or {},
+            extra=extra or None,
+        )
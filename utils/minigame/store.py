@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, Optional
+from ..offload import run_blocking
+
+DB_FILE = "game_save.db"
+LEGACY_SAVE_FILE = "game_save.pkl"
+LEGACY_VERSION = "1.0.0"
+FLUSH_DELAY = 1.0  # 修改后多久写盘（秒），期间的多次修改合并为一次提交
+MAX_ABSENT_PLAYERS = 10000  # 记住多少个“存档中不存在”的用户（LRU 淘汰）
+
+
+class PlayerStore:
+    """SQLite（WAL 模式）玩家存档，每个玩家一行 JSON"""
+
+    def __init__(self, path: str = DB_FILE):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        if self._conn is not None:
+            return
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS players ("
+            "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def load(self, user_id: int) -> Optional[dict]:
+        self.open()
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM players WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def write(self, rows: Dict[int, Optional[str]]):
+        """在一个事务内写入已序列化的玩家数据，值为 None 表示删除"""
+        if not rows:
+            return
+        self.open()
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for user_id, data in rows.items():
+                    if data is None:
+                        self._conn.execute("DELETE FROM players WHERE user_id = ?", (user_id,))
+                    else:
+                        self._conn.execute(
+                            "INSERT INTO players (user_id, data, updated_at) VALUES (?, ?, ?) "
+                            "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                            (user_id, data, now),
+                        )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def count(self) -> int:
+        self.open()
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+
+    def user_ids(self):
+        self.open()
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT user_id FROM players")]
+
+    def migrate_pickle(self, legacy_file: str = LEGACY_SAVE_FILE) -> int:
+        """导入旧的整包 pickle 存档，完成后将其重命名为 .migrated"""
+        if not os.path.exists(legacy_file):
+            return 0
+        with open(legacy_file, "rb") as f:
+            data = pickle.load(f)
+        saved_version = data.get("version", "")
+        if saved_version.split(".")[:2] != LEGACY_VERSION.split(".")[:2]:
+            logging.warning(f"旧游戏存档版本 {saved_version} 不兼容，跳过迁移")
+            return 0
+        players = data.get("game_state", {})
+        self.write({user_id: json.dumps(state, ensure_ascii=False) for user_id, state in players.items()})
+        os.replace(legacy_file, f"{legacy_file}.migrated")
+        logging.info(f"已将 {len(players)} 名玩家从 {legacy_file} 迁移到 {self.path}")
+        return len(players)
+
+
+class PlayerRegistry(MutableMapping):
+    """替代整包字典的玩家表：首次访问时从存档加载，只把修改过的玩家写回
+
+    decode/encode 在存档中的 JSON 字典与内存中的玩家对象之间转换。
+    命令入口先 await preload()，首次查询在线程池中进行，不阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        store: PlayerStore,
+        decode: Callable[[dict], Any] = lambda data: data,
+        encode: Callable[[Any], dict] = lambda state: state,
+        on_load: Optional[Callable[[int, Any], None]] = None,
+    ):
+        self.store = store
+        self.decode = decode
+        self.encode = encode
+        self.on_load = on_load
+        self._players: Dict[int, Any] = {}
+        # 已确认存档中不存在的用户，避免重复查询；有上限，淘汰后最多多查一次
+        self._absent: "OrderedDict[int, None]" = OrderedDict()
+        self._dirty = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks = set()  # 进行中的写盘任务（上一次写盘未完成时可能有多个）
+
+    def _known(self, user_id) -> bool:
+        """无需查询存档即可确定结果（已加载 / 已确认不存在 / 已删除待写盘）"""
+        if user_id in self._players or user_id in self._dirty:
+            return True
+        if user_id in self._absent:
+            self._absent.move_to_end(user_id)
+            return True
+        return False
+
+    def _remember_absent(self, user_id):
+        self._absent[user_id] = None
+        self._absent.move_to_end(user_id)
+        while len(self._absent) > MAX_ABSENT_PLAYERS:
+            self._absent.popitem(last=False)
+
+    def _accept(self, user_id, data: Optional[dict]):
+        if data is None:
+            self._remember_absent(user_id)
+            return None
+        state = self._players[user_id] = self.decode(data)
+        if self.on_load:
+            self.on_load(user_id, state)
+        return state
+
+    def _load(self, user_id):
+        if self._known(user_id):
+            return self._players.get(user_id)
+        return self._accept(user_id, self.store.load(user_id))
+
+    async def preload(self, user_id):
+        """在线程池中从存档加载玩家，之后的同步访问直接命中内存"""
+        if self._known(user_id):
+            return
+        data = await run_blocking("game_load", self.store.load, user_id, executor="io")
+        if not self._known(user_id):  # 等待期间可能已被其他命令加载或创建
+            self._accept(user_id, data)
+
+    def __getitem__(self, user_id):
+        state = self._load(user_id)
+        if state is None:
+            raise KeyError(user_id)
+        return state
+
+    def __contains__(self, user_id) -> bool:
+        return self._load(user_id) is not None
+
+    def __setitem__(self, user_id, state):
+        self._players[user_id] = state
+        self._absent.pop(user_id, None)
+        self.mark_dirty(user_id)
+
+    def __delitem__(self, user_id):
+        if self._load(user_id) is None:
+            raise KeyError(user_id)
+        # 写盘前由 _dirty 挡住存档中的旧数据，写盘进行中由 _absent 挡住
+        del self._players[user_id]
+        self._remember_absent(user_id)
+        self.mark_dirty(user_id)
+
+    def __iter__(self) -> Iterator[int]:
+        # 遍历需要完整玩家列表，仅用于管理/统计场景
+        deleted = {user_id for user_id in self._dirty if user_id not in self._players}
+        return iter(set(self.store.user_ids()) - deleted | set(self._players))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    @property
+    def loaded(self) -> Dict[int, Any]:
+        """已加载到内存中的玩家"""
+        return self._players
+
+    def mark_dirty(self, user_id):
+        """标记玩家已修改，并安排稍后写盘"""
+        self._dirty.add(user_id)
+        self.schedule_flush()
+
+    def schedule_flush(self, delay: float = FLUSH_DELAY):
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # 不在事件循环中（如脚本调用），等待 flush() 显式写盘
+        self._flush_handle = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        # 保留任务引用，避免写盘完成前被垃圾回收
+        task = asyncio.get_running_loop().create_task(self.flush_async())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def _take_dirty(self) -> Dict[int, Optional[str]]:
+        # 在事件循环线程内序列化，写盘时不会读到修改了一半的数据
+        rows = {}
+        for user_id in self._dirty:
+            state = self._players.get(user_id)
+            rows[user_id] = None if state is None else json.dumps(self.encode(state), ensure_ascii=False)
+        self._dirty.clear()
+        return rows
+
+    async def flush_async(self):
+        self._flush_handle = None
+        rows = self._take_dirty()
+        try:
+            await run_blocking("game_save", self.store.write, rows, executor="io")
+        except Exception as e:
+            logging.error(f"保存游戏存档失败: {str(e)}")
+            self._dirty.update(rows)
+            self.schedule_flush()
+
+    def flush(self):
+        """同步写入全部修改（退出时调用）"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self.store.write(self._take_dirty())
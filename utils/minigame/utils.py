@@ -1,66 +1,69 @@
 from ..discords.menu import menu_item
 import logging
-import pickle
 import time
-import os
-from .equip_db import get_equip_info, get_weapon_state, get_armor_state
+from .equip_db import get_equip_info, get_weapon_state, get_armor_state, add_catalog_listener, EQUIP_SLOTS
+from .store import PlayerStore, PlayerRegistry, DB_FILE, LEGACY_SAVE_FILE
+from .player import PlayerState, StatBlock, Effect
+from .locks import mutate_and_reply
+from .effects import schedule_effect, schedule_player_effects, expire_effects
 import random
-__game_state__ = {}
-SAVE_FILE = "game_save.pkl"
-VERSION = "1.0.0"
+# 玩家数据按需从 SQLite 存档加载，修改后由 commit_player 安排增量写盘
+__game_store__ = PlayerStore(DB_FILE)
+__game_state__ = PlayerRegistry(
+    __game_store__,
+    decode=PlayerState.from_dict,
+    encode=PlayerState.to_dict,
+    on_load=schedule_player_effects,
+)
+# 物品目录热重载后，装备加成可能变化，清空已加载玩家的属性缓存
+add_catalog_listener(lambda catalog: [player.invalidate() for player in __game_state__.loaded.values()])
 RANDOM_WEIGHTS = [(51 - x)**2 for x in range(5, 51)]
 def game_save_state():
     try:
-        with open(SAVE_FILE, "wb") as f:
-            pickle.dump({"version": VERSION, "game_state": __game_state__}, f)
-        logging.info("状态已保存到本地文件")
+        __game_state__.flush()
+        logging.info("游戏存档已保存")
     except Exception as e:
         logging.error(f"保存状态失败: {str(e)}")
 
 
 def game_load_state():
-    global __game_state__
-    if os.path.exists(SAVE_FILE):
-        try:
-            with open(SAVE_FILE, "rb") as f:
-                data = pickle.load(f)
-            saved_version = data.get("version", "")
-            if saved_version.split(".")[:2] != VERSION.split(".")[:2]:
-                # 版本不兼容，重命名文件
-                backup_file = f"{SAVE_FILE}.backup"
-                if os.path.exists(backup_file):
-                    os.remove(backup_file)
-                os.rename(SAVE_FILE, backup_file)
-                logging.warning("游戏存档版本不兼容，已重命名旧的序列化文件")
-            else:
-                __game_state__ = data.get("game_state", {})
-                logging.info("已加载游戏存档")
-        except Exception as e:
-            logging.error(f"加载状态失败: {str(e)}")
+    try:
+        __game_store__.open()
+        __game_store__.migrate_pickle(LEGACY_SAVE_FILE)
+        logging.info("已打开游戏存档")
+    except Exception as e:
+        logging.error(f"加载状态失败: {str(e)}")
+
+def commit_player(user_id):
+    """标记玩家数据已修改，稍后写入存档"""
+    __game_state__.mark_dirty(user_id)
 
 def special_tag_to_text(tag: str) -> str:
     return  ""
 
-def state_to_text(state: dict) -> str:
+def state_to_text(player: PlayerState, total: StatBlock) -> str:
     
     addition_effects = []
     current_time = time.time()
-    for effect_id, effect in state["additon"].items():
-        effect_name = get_equip_info(effect_id)["name"]
-        left_duration = max(0, int(effect["duration"] - (current_time - effect["start_time"])))
+    for effect_id, effect in player.effects.items():
+        effect_info = get_equip_info(effect_id)
+        effect_name = effect_info.name if effect_info else effect_id
+        left_duration = max(0, int(effect.duration - (current_time - effect.start_time)))
         addition_effects.append(f"{effect_name}: 效果剩余 {left_duration} 秒结束")
     
     addition_text = "\n".join(addition_effects) if addition_effects else "无"
+    weapon = get_weapon_state(player.weapon)
+    armor = get_armor_state(player.armor)
     
     return f"""你的属性如下：
-金币: {state["coin"]}
-武器: {get_weapon_state(state["weapon"]).get("name","无") if get_weapon_state(state["weapon"]) else "无"}
-护甲: {get_armor_state(state["armor"]).get("name","无") if get_armor_state(state["armor"]) else "无"}
-经验: {state["exp"]}
-攻击: {state['state']["atk"]}
-防御: {state['state']["def"]}
-生命: {state['state']["hp"]} / {state['state']["max_hp"]}
-幸运: {state['state']["luck"]}
+金币: {player.coin}
+武器: {weapon.name if weapon else "无"}
+护甲: {armor.name if armor else "无"}
+经验: {player.exp}
+攻击: {total.atk}
+防御: {total.def_}
+生命: {total.hp} / {total.max_hp}
+幸运: {total.luck}
 附加效果: 
 {addition_text}
 """
@@ -71,158 +74,164 @@ def state_to_text(state: dict) -> str:
 )
 async def sign_up(ctx,**kwargs):
     user_id = ctx.author.id
+    await __game_state__.preload(user_id)
+    await mutate_and_reply(ctx, user_id, lambda: _sign_up(user_id))
+
+def _sign_up(user_id) -> str:
     if(user_id not in __game_state__):
-        __game_state__[user_id] = {}
-        __game_state__[user_id]['coin'] = 0
-        __game_state__[user_id]['npc_attitude'] = 0
-        __game_state__[user_id]['weapon'] = "铁剑"
-        __game_state__[user_id]['armor'] = "新人冒险家套装"
-        __game_state__[user_id]['backpack'] = {}
-        __game_state__[user_id]['exp'] = 0
-        __game_state__[user_id]['state'] = {
-            "atk":1,
-            "def":1,
-            "hp":36,
-            "max_hp":36,
-            "luck":0,
-        }
-        __game_state__[user_id]['additon'] = {}
-        __game_state__[user_id]['special_memory'] = {}
-        await ctx.reply(f"<@{user_id}>恭喜你成为了一名冒险家！输入 `!状态` 查看你的信息。")
+        # 初始属性见 PlayerState / StatBlock 的默认值
+        __game_state__[user_id] = PlayerState()
+        commit_player(user_id)
+        return f"<@{user_id}>恭喜你成为了一名冒险家！输入 `!状态` 查看你的信息。"
     else:
-        await ctx.reply(f"<@{user_id}>你已经注册过啦！输入 `!状态` 查看你的信息。或输入 `!注销` 来重置你的数据！")
+        return f"<@{user_id}>你已经注册过啦！输入 `!状态` 查看你的信息。或输入 `!注销` 来重置你的数据！"
+
+def calculate_total_state(user_id) -> StatBlock:
+    """计算玩家最终属性（基础属性 + 装备加成 + 持续效果）
 
-def calculate_total_state(user_id,full_state = False):
-    """计算玩家最终属性（基础属性 + 装备加成 + 持续效果）"""
-    user_state = __game_state__[user_id]
-    base_state = user_state['state'].copy()
+    结果缓存在玩家对象上，仅在装备变化、使用物品或效果到期时重新计算；
+    返回值为共享缓存，调用方不要修改。
+    """
+    # 先从全局到期堆中清理所有到期效果（只处理到期的条目）
+    expire_effects(__game_state__.loaded, on_expired=commit_player)
+    player = __game_state__[user_id]
+    if player.total is not None:
+        return player.total
+
+    total = player.stats.copy()
     
     # 装备加成
-    weapon = get_weapon_state(user_state['weapon'])
-    armor = get_armor_state(user_state['armor'])
+    weapon = get_weapon_state(player.weapon)
+    armor = get_armor_state(player.armor)
     
     for eq in [weapon, armor]:
-        if eq and 'item_buff' in eq:
-            for attr, val in eq['item_buff'].items():
-                base_state[attr] += val
-    
-    # 持续效果加成
-    current_time = time.time()
-    expired = []
+        if eq:
+            total.add(eq.item_buff)
     
-    for effect_id, effect in user_state['additon'].items():
-        if current_time - effect['start_time'] <= effect['duration']:
-            for attr, val in effect['buff'].items():
-                base_state[attr] += val
-        else:
-            expired.append(effect_id)
-    
-    # 清理过期效果
-    for effect_id in expired:
-        del user_state['additon'][effect_id]
-    if full_state:
-        full = user_state.copy()
-        full['state'] = base_state
-        return full
+    # 持续效果加成（到期的效果已被移除）
+    for effect in player.effects.values():
+        total.add(effect.buff)
 
-    return base_state
+    player.total = total
+    return total
 
 @menu_item(
     matches=["!装备","!zb","!equip"],
     title="装备",
     description="使用 `!装备 <物品名>` 来装备一个武器或护甲",
-    binding_func_args=["item_id"]
+    binding_func_args=["item_id"],
+    prefix_match=True,
 )
-async def equip_item(ctx, item_id,**kwargs):
-    """装备物品逻辑"""
+async def equip_item(ctx, item_id: str,**kwargs):
     user_id = ctx.author.id
+    await __game_state__.preload(user_id)
+    await mutate_and_reply(ctx, user_id, lambda: _equip_item(user_id, item_id))
+
+def _equip_item(user_id, item_id) -> str:
+    """装备物品逻辑"""
     user = __game_state__.get(user_id)
     if not user:
-        return await ctx.reply("请先使用 !注册 创建角色")
+        return "请先使用 !注册 创建角色"
     
     item_info = get_equip_info(item_id)
-    if not item_info:
-        return await  ctx.reply("不存在或无法装备的物品")
+    if not item_info or item_info.fit not in EQUIP_SLOTS:
+        return "不存在或无法装备的物品"
 
-    slot_type = item_info.get('fit')
-    current_item = user.get(slot_type, None)
+    slot_type = item_info.fit
+    current_item = user.slot(slot_type)
     
-    # 验证物品是否在背包
-    if user['backpack'].get(item_id, 0) < 1:
-        return await ctx.reply("背包中没有这个物品")
+    # 验证物品是否在背包，并从背包取出
+    if not user.remove_item(item_id):
+        return "背包中没有这个物品"
     
     # 执行装备操作
     if current_item:
         # 卸下当前装备
-        user['backpack'][current_item] = user['backpack'].get(current_item, 0) + 1
+        user.add_item(current_item)
     
     # 装备新物品
-    user[slot_type] = item_id
-    user['backpack'][item_id] -= 1
-    if user['backpack'][item_id] == 0:
-        del user['backpack'][item_id]
+    user.set_slot(slot_type, item_id)
+    commit_player(user_id)
     
-    await ctx.reply(f"成功装备 {item_info['name']}!")
+    return f"成功装备 {item_info.name}!"
 
 @menu_item(
     matches=["!卸下","!xx","!dequip"],
     title="卸下装备",
     description="使用 `!卸下 <武器|护甲>` 来卸下一个武器或护甲",
-    binding_func_args=["slot_type"]
+    binding_func_args=["slot_type"],
+    prefix_match=True,
 )
-async def unequip_item(ctx, slot_type,**kwargs):
+async def unequip_item(ctx, slot_type: str,**kwargs):
+    user_id = ctx.author.id
+    await __game_state__.preload(user_id)
+    await mutate_and_reply(ctx, user_id, lambda: _unequip_item(user_id, slot_type))
+
+def _unequip_item(user_id, slot_type) -> str:
     """卸下装备逻辑"""
     _slot_type = "armor" if slot_type == "护甲" else "weapon"
-    user_id = ctx.author.id
     user = __game_state__.get(user_id)
     if not user:
-        return await ctx.reply("请先使用 !注册 创建角色")
+        return "请先使用 !注册 创建角色"
     
-    item_id = user.get(_slot_type)
+    item_id = user.slot(_slot_type)
     if not item_id:
-        return await ctx.reply(f"当前没有装备{slot_type}")
+        return f"当前没有装备{slot_type}"
     
     # 放回背包
-    user['backpack'][item_id] = user['backpack'].get(item_id, 0) + 1
-    user[_slot_type] = None
-    await ctx.reply(f"已卸下 {get_equip_info(item_id)['name']}")
+    user.add_item(item_id)
+    user.set_slot(_slot_type, None)
+    commit_player(user_id)
+    item_info = get_equip_info(item_id)
+    return f"已卸下 {item_info.name if item_info else item_id}"
 
-def use_item(ctx, item_id):
-    """使用物品逻辑"""
+@menu_item(
+    matches=["!使用","!sy","!use"],
+    title="使用物品",
+    description="使用 `!使用 <物品名>` 来使用一个消耗品",
+    binding_func_args=["item_id"],
+    prefix_match=True,
+)
+async def use_item(ctx, item_id: str,**kwargs):
     user_id = ctx.author.id
+    await __game_state__.preload(user_id)
+    await mutate_and_reply(ctx, user_id, lambda: _use_item(user_id, item_id))
+
+def _use_item(user_id, item_id) -> str:
+    """使用物品逻辑"""
     user = __game_state__.get(user_id)
     if not user:
-        return ctx.reply("请先使用 !注册 创建角色")
+        return "请先使用 !注册 创建角色"
     
     item_info = get_equip_info(item_id)
-    if not item_info or item_info['fit'] != 'cost':
-        return ctx.reply("不可使用的物品")
+    if not item_info or item_info.fit != 'cost':
+        return "不可使用的物品"
     
-    if user['backpack'].get(item_id, 0) < 1:
-        return ctx.reply("背包中没有这个物品")
+    # 消耗物品
+    if not user.remove_item(item_id):
+        return "背包中没有这个物品"
     
     # 处理即时效果
-    if 'item_buff_instant' in item_info:
-        for attr, val in item_info['item_buff_instant'].items():
+    if item_info.item_buff_instant:
+        for attr, val in item_info.item_buff_instant.items():
             if attr == 'hp':
-                user['state']['hp'] = min(user['state']['max_hp'], user['state']['hp'] + val)
+                user.stats.hp = min(user.stats.max_hp, user.stats.hp + val)
             else:
-                user['state'][attr] += val
+                user.stats[attr] += val
     
     # 处理持续效果
-    if 'item_buff_duration' in item_info:
-        user['additon'][item_id] = {
-            'start_time': time.time(),
-            'duration': item_info['duration'],
-            'buff': item_info['item_buff_duration']
-        }
+    if item_info.item_buff_duration:
+        effect = Effect(
+            start_time=time.time(),
+            duration=item_info.duration,
+            buff=dict(item_info.item_buff_duration),
+        )
+        user.add_effect(item_id, effect)
+        schedule_effect(user_id, item_id, effect.deadline)
+    user.invalidate()
+    commit_player(user_id)
     
-    # 消耗物品
-    user['backpack'][item_id] -= 1
-    if user['backpack'][item_id] == 0:
-        del user['backpack'][item_id]
-    
-    ctx.reply(f"成功使用 {item_info['name']}!")
+    return f"成功使用 {item_info.name}!"
 
 @menu_item(
     matches=["!背包","!bb","!check"],
@@ -232,18 +241,19 @@ def use_item(ctx, item_id):
 async def show_backpack(ctx,**kwargs):
     """显示背包内容"""
     user_id = ctx.author.id
+    await __game_state__.preload(user_id)
     user = __game_state__.get(user_id)
     if not user:
         return await ctx.reply("请先使用 `!注册` 创建角色")
     
-    backpack = user['backpack']
+    backpack = user.backpack
     if not backpack:
         return await ctx.reply("背包空空如也")
     
     items = []
     for item_id, count in backpack.items():
         item_info = get_equip_info(item_id)
-        name = item_info['name'] if item_info else f"未知物品({item_id})"
+        name = item_info.name if item_info else f"未知物品({item_id})"
         items.append(f"{name} ×{count}")
     
     await ctx.reply("背包内容：\n" + "\n".join(items))
@@ -255,11 +265,12 @@ async def show_backpack(ctx,**kwargs):
 )
 async def check_status(ctx, **kwargs):
     user_id = ctx.author.id
+    await __game_state__.preload(user_id)
     user = __game_state__.get(user_id)
     if not user:
         await ctx.reply("请先使用 `!注册` 创建角色")
         return
-    await ctx.reply(state_to_text(calculate_total_state(user_id,True)))
+    await ctx.reply(state_to_text(user, calculate_total_state(user_id)))
 @menu_item(
     matches=["!公会签到","!签到","!qd"],
     title="签到",
@@ -267,26 +278,27 @@ async def check_status(ctx, **kwargs):
 )
 async def sign_in(ctx,**kwargs):
     user_id = ctx.author.id
+    await __game_state__.preload(user_id)
+    await mutate_and_reply(ctx, user_id, lambda: _sign_in(user_id))
+
+def _sign_in(user_id) -> str:
     if user_id in __game_state__:
-        sp_m = __game_state__[user_id].get("special_memory")
-        if not sp_m:
-            __game_state__[user_id]["special_memory"] = {}
-        sign = __game_state__[user_id]["special_memory"].get("signed")
-        if not sign:
-            __game_state__[user_id]["special_memory"]["signed"] = {
-                "times":0,
-                "last_sign_time":0
-            }
-        last_sign_time = __game_state__[user_id]["special_memory"]["signed"]["last_sign_time"]
+        player = __game_state__[user_id]
+        signed = player.special_memory.setdefault("signed", {
+            "times":0,
+            "last_sign_time":0
+        })
+        last_sign_time = signed["last_sign_time"]
         current_time = time.time()
         if current_time - last_sign_time >= 8 * 3600:
-            __game_state__[user_id]["special_memory"]["signed"]["times"] += 1
-            __game_state__[user_id]["special_memory"]["signed"]["last_sign_time"] = current_time
+            signed["times"] += 1
+            signed["last_sign_time"] = current_time
             reward = random.choices(range(5, 51), weights=RANDOM_WEIGHTS, k=1)[0]  # 非均等概率，值越小概率越大
-            __game_state__[user_id]["coin"] += reward  # 奖励金币
-            await ctx.reply(f"<@{user_id}> 签到成功！你获得了 {reward} 金币。(最高可获得 50 金币！)")
+            player.coin += reward  # 奖励金币
+            commit_player(user_id)
+            return f"<@{user_id}> 签到成功！你获得了 {reward} 金币。(最高可获得 50 金币！)"
         else:
             remaining_time = 8 * 3600 - (current_time - last_sign_time)
             hours, remainder = divmod(remaining_time, 3600)
             minutes, _ = divmod(remainder, 60)
-            await ctx.reply(f"<@{user_id}> 距离下次签到还有 {int(hours)} 小时 {int(minutes)} 分钟。")
\ No newline at end of file
+            return f"<@{user_id}> 距离下次签到还有 {int(hours)} 小时 {int(minutes)} 分钟。"
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, TypeVar
+from .metrics import counter, histogram, register_collector
+
+# 阻塞或耗 CPU 的操作统一交给线程池执行，事件循环只负责等待结果
+DEFAULT_EXECUTOR = "default"
+DEFAULT_WORKERS = {"default": 4, "image": 2, "io": 4}
+
+OFFLOAD_SECONDS = histogram("llmcord_offload_seconds", "卸载到线程池的任务执行耗时", ["task"])
+OFFLOAD_QUEUE_SECONDS = histogram("llmcord_offload_queue_seconds", "卸载任务在线程池中排队等待的耗时", ["task"])
+OFFLOAD_ERRORS = counter("llmcord_offload_errors", "卸载任务抛出异常的次数", ["task"])
+
+T = TypeVar("T")
+
+__executors__: Dict[str, ThreadPoolExecutor] = {}
+__executor_workers__: Dict[str, int] = dict(DEFAULT_WORKERS)
+__offload_inflight__: Dict[str, int] = {}
+
+
+def configure_offload(cfg):
+    """按 offload.workers 设置各线程池大小（只影响之后创建的线程池）"""
+    workers = (cfg.get("offload") or {}).get("workers") or {}
+    __executor_workers__.update({name: int(count) for name, count in workers.items()})
+
+
+def get_executor(name: str = DEFAULT_EXECUTOR) -> ThreadPoolExecutor:
+    executor = __executors__.get(name)
+    if executor is None:
+        executor = __executors__[name] = ThreadPoolExecutor(
+            max_workers=__executor_workers__.get(name, DEFAULT_WORKERS[DEFAULT_EXECUTOR]),
+            thread_name_prefix=f"offload-{name}",
+        )
+    return executor
+
+
+async def run_blocking(task: str, func: Callable[..., T], *args, executor: str = DEFAULT_EXECUTOR, **kwargs) -> T:
+    """在指定线程池中执行 func，记录排队与执行耗时
+
+    task 为指标标签；指标在事件循环线程中更新，工作线程只负责计时。
+    """
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
+    timing = {}
+
+    def call():
+        timing["started"] = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timing["finished"] = time.perf_counter()
+
+    __offload_inflight__[task] = __offload_inflight__.get(task, 0) + 1
+    try:
+        return await loop.run_in_executor(get_executor(executor), call)
+    except Exception:
+        OFFLOAD_ERRORS.inc(task=task)
+        raise
+    finally:
+        __offload_inflight__[task] -= 1
+        if "started" in timing:
+            OFFLOAD_QUEUE_SECONDS.observe(timing["started"] - submitted, task=task)
+        if "finished" in timing:
+            OFFLOAD_SECONDS.observe(timing["finished"] - timing["started"], task=task)
+
+
+def shutdown_executors(wait: bool = True):
+    for name, executor in list(__executors__.items()):
+        executor.shutdown(wait=wait)
+        del __executors__[name]
+    logging.debug("卸载线程池已关闭")
+
+
+register_collector(
+    "llmcord_offload_inflight", "正在线程池中排队或执行的卸载任务数", "gauge",
+    lambda: [({"task": task}, count) for task, count in __offload_inflight__.items()],
+)
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+from .metrics import counter, histogram
+
+DEFAULT_WATCHDOG_INTERVAL = 0.1  # 心跳间隔（秒）
+DEFAULT_WATCHDOG_THRESHOLD = 0.25  # 心跳迟到超过该值时记录卡住的调用栈（秒）
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LOOP_LAG_SECONDS = histogram("llmcord_event_loop_lag_seconds", "事件循环心跳的迟到时间", buckets=LAG_BUCKETS)
+LOOP_STALLS = counter("llmcord_event_loop_stalls", "事件循环阻塞超过阈值的次数")
+
+
+class LoopWatchdog:
+    """事件循环延迟监控
+
+    循环内的心跳任务按固定间隔 sleep 并记录迟到时间；
+    独立的守护线程发现心跳超过阈值未更新时，打印事件循环线程当前的调用栈与正在运行的任务，
+    每次阻塞只记录一次。
+    """
+
+    def __init__(self, interval: float = DEFAULT_WATCHDOG_INTERVAL, threshold: float = DEFAULT_WATCHDOG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._beat_task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> "LoopWatchdog":
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._beat_task = self._loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._beat_task is not None:
+            self._beat_task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            LOOP_LAG_SECONDS.observe(max(0.0, now - expected))
+            self._last_beat = now
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stopped.wait(self.interval):
+            beat = self._last_beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled > self.threshold and beat != reported_beat:
+                reported_beat = beat
+                LOOP_STALLS.inc()
+                logging.warning(f"事件循环已阻塞 {stalled:.3f}s\n{self.describe_stall()}")
+
+    def describe_stall(self) -> str:
+        """事件循环线程当前的调用栈，以及正在运行的任务"""
+        lines = []
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        if task is not None:
+            lines.append(f"正在运行的任务: {task.get_name()} {task.get_coro()!r}")
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is not None:
+            lines.append("".join(traceback.format_stack(frame)).rstrip())
+        return "\n".join(lines)
+
+
+def start_loop_watchdog(cfg) -> Optional[LoopWatchdog]:
+    """按 loop_watchdog 配置启动监控，enabled 为 false 时不启动"""
+    watchdog_cfg = cfg.get("loop_watchdog") or {}
+    if not watchdog_cfg.get("enabled", True):
+        return None
+    return LoopWatchdog(
+        interval=watchdog_cfg.get("interval", DEFAULT_WATCHDOG_INTERVAL),
+        threshold=watchdog_cfg.get("threshold", DEFAULT_WATCHDOG_THRESHOLD),
+    ).start()